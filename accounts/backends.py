@@ -0,0 +1,28 @@
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+
+from .models import UserEmail
+
+
+class EmailBackend(ModelBackend):
+    """Authenticate with an email address in place of the username.
+
+    Looks the address up through the indexed ``UserEmail`` table, so the
+    check costs one unique-index probe regardless of the number of users.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if not username or password is None or '@' not in username:
+            return None
+        try:
+            lookup = UserEmail.objects.select_related('user').get(
+                email=UserEmail.normalize(username)
+            )
+        except UserEmail.DoesNotExist:
+            # Run the hasher once anyway so a miss takes as long as a hit
+            User().set_password(password)
+            return None
+        user = lookup.user
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_user_emails(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    UserEmail = apps.get_model('accounts', 'UserEmail')
+    seen = set()
+    batch = []
+    for user_id, email in User.objects.order_by('id').values_list('id', 'email').iterator(chunk_size=2000):
+        email = (email or '').strip().lower()
+        # Oldest account keeps the address when case variants already exist
+        if not email or email in seen:
+            continue
+        seen.add(email)
+        batch.append(UserEmail(user_id=user_id, email=email))
+        if len(batch) >= 2000:
+            UserEmail.objects.bulk_create(batch)
+            batch = []
+    UserEmail.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.CharField(max_length=254, unique=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='email_lookup', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'User Email',
+                'verbose_name_plural': 'User Emails',
+            },
+        ),
+        migrations.RunPython(backfill_user_emails, migrations.RunPython.noop),
+    ]
@@ -7,3 +7,26 @@ class UserProfile(models.Model):
     
     def __str__(self):
         return f"{self.user.username}'s Profile"
+
+
+class UserEmail(models.Model):
+    """Normalized, uniquely indexed copy of ``User.email``.
+
+    ``auth_user.email`` has no index and is compared case-sensitively, so
+    signup uniqueness checks and login-by-email go through this table
+    instead. Rows are kept in sync by the ``post_save`` handler in
+    ``accounts.signals``.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='email_lookup')
+    email = models.CharField(max_length=254, unique=True)
+
+    class Meta:
+        verbose_name = 'User Email'
+        verbose_name_plural = 'User Emails'
+
+    def __str__(self):
+        return self.email
+
+    @staticmethod
+    def normalize(email):
+        return (email or '').strip().lower()
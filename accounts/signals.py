@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import UserEmail
+
+
+@receiver(post_save, sender=User)
+def sync_user_email(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    """Mirror the user's email into the normalized lookup table.
+
+    A new user whose address is already taken (e.g. by a concurrent
+    signup) gets an IntegrityError, which rolls the signup back.
+    """
+    # Logins save only last_login
+    if raw or (update_fields is not None and 'email' not in update_fields):
+        return
+    email = UserEmail.normalize(instance.email)
+    if created:
+        if email:
+            UserEmail.objects.create(user=instance, email=email)
+        return
+    if not email or UserEmail.objects.filter(email=email).exclude(user=instance).exists():
+        # A case variant of another user's address (left over from before
+        # the lookup table) cannot be used to find this user
+        UserEmail.objects.filter(user=instance).delete()
+        return
+    UserEmail.objects.update_or_create(user=instance, defaults={'email': email})
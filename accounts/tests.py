@@ -1,7 +1,11 @@
+from unittest import mock
+
+from django.db import IntegrityError, transaction
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .forms import SignUpForm
+from .models import UserProfile, UserEmail
 
 # Create your tests here.
 
@@ -45,3 +49,80 @@ class AuthenticationViewsTest(TestCase):
         self.client.login(username='testuser', password='testpass123')
         response = self.client.get(reverse('accounts:logout'))
         self.assertEqual(response.status_code, 302)  # Redirect after logout
+
+
+class EmailLookupTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='emailuser',
+            email='Mixed.Case@Example.com',
+            password='testpass123'
+        )
+
+    def test_lookup_row_is_normalized_and_synced(self):
+        self.assertEqual(UserEmail.objects.get(user=self.user).email, 'mixed.case@example.com')
+        self.user.email = 'other@example.com'
+        self.user.save()
+        self.assertEqual(UserEmail.objects.get(user=self.user).email, 'other@example.com')
+
+    def test_case_variant_of_another_users_email_does_not_break_saves(self):
+        # Such pairs predate the lookup table, which keeps only one of them
+        twin = User.objects.create_user(username='twin', password='testpass123')
+        User.objects.filter(pk=twin.pk).update(email='MIXED.CASE@example.com')
+        twin.refresh_from_db()
+        self.assertTrue(self.client.login(username='twin', password='testpass123'))
+        twin.first_name = 'Twin'
+        twin.save()
+        self.assertFalse(UserEmail.objects.filter(user=twin).exists())
+        self.assertEqual(UserEmail.objects.get(email='mixed.case@example.com').user, self.user)
+
+    def test_signup_rejects_case_variant_email(self):
+        form = SignUpForm(data={
+            'username': 'newuser',
+            'first_name': 'New',
+            'email': 'mixed.case@EXAMPLE.com',
+            'password1': 'Str0ng-pass-123',
+            'password2': 'Str0ng-pass-123',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('email', form.errors)
+
+    def test_concurrent_signup_with_the_same_address_fails(self):
+        data = {
+            'username': 'newuser',
+            'first_name': 'New',
+            'email': 'new@example.com',
+            'password1': 'Str0ng-pass-123',
+            'password2': 'Str0ng-pass-123',
+        }
+        form = SignUpForm(data=data)
+        self.assertTrue(form.is_valid())
+        # The other signup commits between validation and save
+        User.objects.create_user(username='racer', email='NEW@example.com', password='testpass123')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            form.save()
+        self.assertFalse(User.objects.filter(username='newuser').exists())
+        self.assertEqual(UserEmail.objects.get(email='new@example.com').user.username, 'racer')
+
+        clean_email = SignUpForm.clean_email
+        raced = []
+
+        def clean_email_before_the_race(form):
+            if raced:
+                return clean_email(form)
+            raced.append(True)
+            return form.cleaned_data['email']
+
+        with mock.patch.object(SignUpForm, 'clean_email', clean_email_before_the_race):
+            response = self.client.post(reverse('accounts:signup'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('email', response.context['form'].errors)
+        self.assertFalse(User.objects.filter(username='newuser').exists())
+
+    def test_login_with_email(self):
+        response = self.client.post(reverse('accounts:login'), {
+            'username': ' MIXED.case@example.com ',
+            'password': 'testpass123'
+        })
+        self.assertEqual(response.status_code, 302)
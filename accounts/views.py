@@ -2,6 +2,7 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.db import IntegrityError, transaction
 from .forms import SignUpForm, LoginForm
 
 def signup_view(request):
@@ -12,11 +13,18 @@ def signup_view(request):
         form = SignUpForm(request.POST)
         if form.is_valid():
             try:
-                user = form.save()
+                with transaction.atomic():
+                    user = form.save()
                 username = form.cleaned_data.get('username')
                 messages.success(request, f'Account created successfully for {username}! You are now logged in.')
                 login(request, user)
                 return redirect('home')
+            except IntegrityError:
+                # The username or address was taken since the form was
+                # validated; validating again puts the error on its field
+                form = SignUpForm(request.POST)
+                form.is_valid()
+                messages.error(request, 'Please correct the errors below.')
             except Exception as e:
                 messages.error(request, 'An error occurred while creating your account. Please try again.')
         else:
@@ -42,7 +50,7 @@ def login_view(request):
                 next_url = request.GET.get('next', 'home')
                 return redirect(next_url)
             else:
-                messages.error(request, 'Invalid username or password. Please try again.')
+                messages.error(request, 'Invalid username, email or password. Please try again.')
     else:
         form = LoginForm()
     
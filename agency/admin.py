@@ -1,4 +1,5 @@
 from django.contrib import admin
+from core.exports import export_selected_csv, export_selected_jsonl
 from .models import Agency
 
 
@@ -7,3 +8,4 @@ class AgencyAdmin(admin.ModelAdmin):
     list_display = ['name', 'email', 'phone', 'approved', 'created_at']
     list_filter = ['approved', 'created_at']
     search_fields = ['name', 'email', 'phone', 'city', 'state', 'country']
+    actions = [export_selected_csv, export_selected_jsonl]
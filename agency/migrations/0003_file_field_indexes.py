@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agency', '0002_image_meta'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='agency',
+            name='license_document',
+            field=models.FileField(blank=True, db_index=True, null=True, upload_to='agencies/licenses/'),
+        ),
+        migrations.AlterField(
+            model_name='agency',
+            name='logo',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='agencies/logos/'),
+        ),
+    ]
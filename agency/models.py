@@ -12,8 +12,9 @@ class Agency(models.Model):
     state = models.CharField(max_length=100, blank=True)
     country = models.CharField(max_length=100, blank=True)
     description = models.TextField(blank=True)
-    logo = models.ImageField(upload_to='agencies/logos/', blank=True, null=True)
-    license_document = models.FileField(upload_to='agencies/licenses/', blank=True, null=True)
+    logo = models.ImageField(upload_to='agencies/logos/', blank=True, null=True, db_index=True)
+    image_meta = models.JSONField(default=dict, blank=True, editable=False)
+    license_document = models.FileField(upload_to='agencies/licenses/', blank=True, null=True, db_index=True)
     approved = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -1,5 +1,99 @@
-from django.contrib import admin
-from .models import Destination, DestinationImage, Testimonial, Tag, Category, PointOfInterest, Course, CourseApplication, Exam, Caravan, CaravanBooking
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.text import smart_split, unescape_string_literal
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+from .catalog import CatalogError, import_file
+from . import facets
+from .exports import export_selected_csv, export_selected_jsonl
+from .forms import CatalogImportForm, ReportPeriodForm
+from .rollups import course_funnels, revenue_summary
+from .models import Destination, DestinationImage, Testimonial, Tag, Category, PointOfInterest, Course, CourseApplication, Exam, Caravan, CaravanBooking, Job, JobResult
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that avoids ``COUNT(*)`` on large, unfiltered changelists.
+
+    Without a WHERE clause the row count is estimated from the planner
+    statistics on PostgreSQL or from the highest primary key elsewhere.
+    Filtered or small tables still get an exact count. Estimates can
+    overshoot (deleted rows still count towards ``MAX(pk)``), so a page
+    past the real end falls back to an exact count and the last page.
+    """
+    exact_below = 10000
+    estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = self._estimate(queryset)
+            if estimate and estimate > self.exact_below:
+                self.estimated = True
+                return estimate
+        return queryset.count()
+
+    def page(self, number):
+        page = super().page(number)
+        if self.estimated and page.number > 1 and not page.object_list:
+            # The properties derived from the count are cached too
+            self.__dict__.pop('num_pages', None)
+            self.__dict__.pop('page_range', None)
+            self.count, self.estimated = self.object_list.count(), False
+            page = super().page(min(page.number, self.num_pages))
+        return page
+
+    def _estimate(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            return row[0] if row else None
+        return queryset.model._default_manager.using(queryset.db).aggregate(top=Max('pk'))['top']
+
+
+class SubquerySearchMixin:
+    """Admin search that matches fields of related rows through subqueries.
+
+    A search field across a foreign key (``^destination__name``) is ORed
+    with the local ones as ``destination_id IN (SELECT id ... WHERE name
+    LIKE ...)`` instead of through a join, so each term of the OR can use
+    an index of its own table.
+    """
+    search_lookups = {'^': 'istartswith', '=': 'iexact', '@': 'search'}
+
+    def _search_q(self, field_name, bit):
+        lookup = 'icontains'
+        if field_name[0] in self.search_lookups:
+            lookup, field_name = self.search_lookups[field_name[0]], field_name[1:]
+        relation, _, field = field_name.partition('__')
+        if not field:
+            return Q(**{f'{relation}__{lookup}': bit})
+        related = self.model._meta.get_field(relation).related_model
+        matches = related._default_manager.filter(**{f'{field}__{lookup}': bit}).values('pk')
+        return Q(**{f'{relation}__in': matches})
+
+    def get_search_results(self, request, queryset, search_term):
+        search_fields = self.get_search_fields(request)
+        if not search_fields or not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            queryset = queryset.filter(reduce(or_, (self._search_q(field, bit) for field in search_fields)))
+        return queryset, False
+
 
 class DestinationImageInline(admin.TabularInline):
     model = DestinationImage
@@ -15,22 +109,65 @@ class PointOfInterestInline(admin.TabularInline):
 class DestinationAdmin(admin.ModelAdmin):
     list_display = ['name', 'location', 'price_per_person', 'destination_type', 'is_active', 'is_featured']
     list_filter = ['destination_type', 'is_active', 'is_featured', 'created_at']
-    search_fields = ['name', 'location', 'description']
+    search_fields = ['^name', '^location']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     prepopulated_fields = {'slug': ('name',)}
     inlines = [DestinationImageInline, PointOfInterestInline]
     filter_horizontal = ['tags']
+    change_list_template = 'admin/core/destination/change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_catalog_view), name='core_destination_import'),
+        ]
+        return urls + super().get_urls()
+
+    def import_catalog_view(self, request):
+        if not self.has_add_permission(request):
+            return redirect('admin:core_destination_changelist')
+        form = CatalogImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['catalog']
+            fmt = 'jsonl' if upload.name.endswith(('.jsonl', '.ndjson')) else 'csv'
+            try:
+                stats = import_file(upload.file, fmt, upsert=form.cleaned_data['upsert'])
+            except (CatalogError, ValueError) as exc:
+                messages.error(request, f'Import failed: {exc}')
+            else:
+                messages.success(
+                    request,
+                    f"Imported catalog: {stats['created']} created, {stats['updated']} updated.",
+                )
+                return redirect('admin:core_destination_changelist')
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Import destinations',
+            'opts': self.model._meta,
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/core/destination/import_catalog.html', context)
 
 @admin.register(DestinationImage)
 class DestinationImageAdmin(admin.ModelAdmin):
     list_display = ['destination', 'caption', 'is_primary']
-    list_filter = ['destination', 'is_primary']
-    search_fields = ['destination__name', 'caption']
+    list_filter = ['is_primary']
+    list_select_related = ['destination']
+    search_fields = ['^destination__name', '^caption']
+    autocomplete_fields = ['destination']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Testimonial)
-class TestimonialAdmin(admin.ModelAdmin):
+class TestimonialAdmin(SubquerySearchMixin, admin.ModelAdmin):
     list_display = ['name', 'rating', 'destination', 'is_active', 'created_at']
     list_filter = ['rating', 'is_active', 'created_at']
-    search_fields = ['name', 'feedback', 'destination__name']
+    list_select_related = ['destination']
+    search_fields = ['^name', '^destination__name']
+    actions = [export_selected_csv, export_selected_jsonl]
+    autocomplete_fields = ['destination']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
@@ -40,15 +177,19 @@ class TagAdmin(admin.ModelAdmin):
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'slug']
+    list_display = ['name', 'slug', 'destination_count']
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ['name']
+    autocomplete_fields = ['destinations']
 
 @admin.register(PointOfInterest)
 class PointOfInterestAdmin(admin.ModelAdmin):
     list_display = ['name', 'destination', 'x_percent', 'y_percent']
-    list_filter = ['destination']
-    search_fields = ['name', 'destination__name']
+    list_select_related = ['destination']
+    search_fields = ['^name', '^destination__name']
+    autocomplete_fields = ['destination']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
@@ -74,9 +215,38 @@ class CourseAdmin(admin.ModelAdmin):
 @admin.register(CourseApplication)
 class CourseApplicationAdmin(admin.ModelAdmin):
     list_display = ['full_name', 'course', 'email', 'status', 'created_at']
-    list_filter = ['course', 'status', 'created_at']
-    search_fields = ['full_name', 'email', 'message']
+    list_filter = [('course', admin.RelatedOnlyFieldListFilter), 'status', 'created_at']
+    list_select_related = ['course']
+    search_fields = ['^full_name', '=email']
+    actions = [export_selected_csv, export_selected_jsonl]
+    autocomplete_fields = ['course']
     readonly_fields = ['created_at', 'updated_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/core/courseapplication/change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path('funnel/', self.admin_site.admin_view(self.funnel_view), name='core_courseapplication_funnel'),
+        ]
+        return urls + super().get_urls()
+
+    def funnel_view(self, request):
+        if not self.has_view_permission(request):
+            return redirect('admin:index')
+        today = timezone.localdate()
+        form = ReportPeriodForm(request.GET or {'start': today - timedelta(days=89), 'end': today})
+        funnels = None
+        if form.is_valid():
+            funnels = course_funnels(form.cleaned_data['start'], form.cleaned_data['end'])
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Application funnel',
+            'opts': self.model._meta,
+            'form': form,
+            'funnels': funnels,
+        }
+        return TemplateResponse(request, 'admin/core/courseapplication/funnel.html', context)
 
 @admin.register(Exam)
 class ExamAdmin(admin.ModelAdmin):
@@ -85,11 +255,15 @@ class ExamAdmin(admin.ModelAdmin):
     search_fields = ['title', 'description']
 
 
+# Caravans listed in each of the dashboard's least and most utilized tables
+UTILIZATION_LIST_SIZE = 25
+
+
 @admin.register(Caravan)
 class CaravanAdmin(admin.ModelAdmin):
     list_display = ['name', 'caravan_type', 'capacity', 'daily_rate', 'is_available', 'is_featured', 'created_at']
     list_filter = ['caravan_type', 'is_available', 'is_featured', 'fuel_type', 'transmission', 'year']
-    search_fields = ['name', 'description', 'pickup_locations']
+    search_fields = ['^name', 'pickup_locations']
     list_editable = ['is_available', 'is_featured']
     readonly_fields = ['slug', 'created_at', 'updated_at']
     
@@ -120,17 +294,75 @@ class CaravanAdmin(admin.ModelAdmin):
         }),
     )
     
-    def get_queryset(self, request):
-        return super().get_queryset(request).select_related()
+    change_list_template = 'admin/core/caravan/change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path('utilization/', self.admin_site.admin_view(self.utilization_view), name='core_caravan_utilization'),
+        ]
+        return urls + super().get_urls()
+
+    def utilization_view(self, request):
+        if not self.has_view_permission(request):
+            return redirect('admin:index')
+        today = timezone.localdate()
+        form = ReportPeriodForm(request.GET or {'start': today - timedelta(days=89), 'end': today})
+        report = None
+        try:
+            from . import analytics
+        except ImportError:
+            messages.error(request, 'Fleet utilization needs the numpy package.')
+        else:
+            if form.is_valid():
+                report = analytics.fleet_utilization(form.cleaned_data['start'], form.cleaned_data['end'])
+                for row in report['types']:
+                    row['weeks'] = analytics.weekly_rates(row['daily'], row['caravans'])
+                by_utilization = sorted(report['caravans'], key=lambda row: (row['utilization'], row['name']))
+                report['idlest'] = by_utilization[:UTILIZATION_LIST_SIZE]
+                report['busiest'] = by_utilization[::-1][:UTILIZATION_LIST_SIZE]
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Fleet utilization',
+            'opts': self.model._meta,
+            'form': form,
+            'report': report,
+        }
+        return TemplateResponse(request, 'admin/core/caravan/utilization.html', context)
+
+    def changelist_view(self, request, extra_context=None):
+        # list_editable saves are collected by save_model and written with a
+        # single bulk_update instead of one UPDATE per row
+        request._bulk_edits = []
+        with transaction.atomic():
+            response = super().changelist_view(request, extra_context)
+            if request._bulk_edits:
+                Caravan.objects.bulk_update(request._bulk_edits, list(self.list_editable) + ['updated_at'])
+                # bulk_update sends no post_save: do what the caravan
+                # receivers would (caravan_type isn't editable here, so the
+                # revenue rollups need no retyping)
+                facets.invalidate('caravans')
+        return response
+
+    def save_model(self, request, obj, form, change):
+        pending = getattr(request, '_bulk_edits', None)
+        if change and pending is not None:
+            obj.updated_at = timezone.now()
+            pending.append(obj)
+            return
+        super().save_model(request, obj, form, change)
 
 
 @admin.register(CaravanBooking)
-class CaravanBookingAdmin(admin.ModelAdmin):
+class CaravanBookingAdmin(SubquerySearchMixin, admin.ModelAdmin):
     list_display = ['id', 'caravan', 'user', 'full_name', 'pickup_date', 'return_date', 'status', 'total_amount', 'created_at']
     list_filter = ['status', 'pickup_date', 'return_date', 'caravan__caravan_type']
-    search_fields = ['full_name', 'email', 'phone', 'caravan__name']
+    search_fields = ['^full_name', '=email', '=phone', '^caravan__name']
     list_editable = ['status']
     readonly_fields = ['created_at', 'updated_at', 'total_amount']
+    actions = [export_selected_csv, export_selected_jsonl]
+    autocomplete_fields = ['caravan', 'user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     fieldsets = (
         ('Booking Details', {
@@ -150,5 +382,71 @@ class CaravanBookingAdmin(admin.ModelAdmin):
         }),
     )
     
+    change_list_template = 'admin/core/caravanbooking/change_list.html'
+
+    def get_urls(self):
+        urls = [
+            path('revenue/', self.admin_site.admin_view(self.revenue_view), name='core_caravanbooking_revenue'),
+        ]
+        return urls + super().get_urls()
+
+    def revenue_view(self, request):
+        if not self.has_view_permission(request):
+            return redirect('admin:index')
+        today = timezone.localdate()
+        first_month = (today.replace(day=1) - timedelta(days=11 * 31)).replace(day=1)
+        form = ReportPeriodForm(request.GET or {'start': first_month, 'end': today})
+        summary = None
+        if form.is_valid():
+            summary = revenue_summary(form.cleaned_data['start'], form.cleaned_data['end'])
+            summary['top_month'] = max([row['earned'] for row in summary['months']], default=0)
+            summary['top_type'] = max([row['earned'] for row in summary['types']], default=0)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Revenue',
+            'opts': self.model._meta,
+            'form': form,
+            'summary': summary,
+        }
+        return TemplateResponse(request, 'admin/core/caravanbooking/revenue.html', context)
+
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('caravan', 'user')
\ No newline at end of file
+        return super().get_queryset(request).select_related('caravan', 'user')
+
+
+class JobResultInline(admin.TabularInline):
+    model = JobResult
+    extra = 0
+    can_delete = False
+    fields = ['attempt', 'succeeded', 'value', 'error', 'worker', 'started_at', 'duration']
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.action(description='Run selected jobs again now')
+def requeue_jobs(modeladmin, request, queryset):
+    requeued = 0
+    for pk in queryset.filter(status__in=[Job.DONE, Job.FAILED]).values_list('pk', flat=True):
+        try:
+            with transaction.atomic():
+                requeued += Job.objects.filter(pk=pk).update(
+                    status=Job.QUEUED, run_at=timezone.now(), attempts=0, finished_at=None,
+                )
+        except IntegrityError:
+            # The same work is queued already
+            continue
+    messages.success(request, f'{requeued} jobs queued.')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_at', 'locked_by', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['=name', '=dedupe_key']
+    readonly_fields = ['attempts', 'locked_by', 'locked_at', 'created_at', 'finished_at']
+    inlines = [JobResultInline]
+    actions = [requeue_jobs]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -0,0 +1,253 @@
+"""Fleet utilization computed from caravan bookings.
+
+Every non-cancelled booking is loaded once into numpy columns (caravan,
+pickup, return and creation day, pickup location) and kept in the
+worker's memory until ``core.availability.invalidate()`` (called on
+every booking change) bumps the shared version, so any window is then
+answered without touching the database again.
+
+For a window the bookings are turned into a caravans x days occupancy
+matrix: +1 on each pickup day and -1 on each return day of a difference
+array, summed along the days, so a caravan is busy on a day when at
+least one booking holds it (the return day is free, as in
+``core.availability``). Utilization, idle streaks and per-type daily
+occupancy are reductions of that matrix; lead times and weekly-rate
+uptake are computed over the bookings picked up inside the window, so
+adjacent windows never count a booking twice.
+
+Only active caravans are reported. Requires numpy.
+"""
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+from django.db.models import CharField
+from django.db.models.functions import Cast
+
+from . import availability, versions
+from .metrics import record_cache
+from .models import Caravan, CaravanBooking
+
+# Idle stretches at least this long are counted as idle streaks
+IDLE_STREAK_DAYS = 7
+# Bookings this long are charged the weekly rate (see views.caravan_detail)
+WEEKLY_RATE_DAYS = 7
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def _ordinals(dates):
+    return np.fromiter(map(date.toordinal, dates), dtype=np.int64, count=len(dates))
+
+
+class BookingSnapshot:
+    """Non-cancelled bookings as numpy columns; days are ``date.toordinal()`` numbers."""
+
+    def __init__(self):
+        bookings = CaravanBooking.objects.exclude(status__in=availability.FREE_STATUSES).order_by()
+        # created_at as text: its first ten characters are the (UTC) day,
+        # parsed by numpy instead of one datetime object per row
+        rows = bookings.values_list(
+            'caravan_id', 'pickup_date', 'return_date', Cast('created_at', CharField()), 'pickup_location',
+        )
+        columns = list(zip(*rows)) or [(), (), (), (), ()]
+        caravan_ids, pickups, returns, created, locations = columns
+        self.caravan_ids = np.array(caravan_ids, dtype=np.int64)
+        self.pickups = _ordinals(pickups)
+        self.returns = _ordinals(returns)
+        self.created = np.array(created, dtype='U10').astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+        # Spellings of the same place ("kolkata ", "Kolkata") share one code
+        raw_codes = {}
+        codes = np.fromiter((raw_codes.setdefault(location, len(raw_codes)) for location in locations),
+                            dtype=np.int64, count=len(locations))
+        names = sorted({' '.join(raw.split()).title() for raw in raw_codes})
+        name_codes = {name: i for i, name in enumerate(names)}
+        to_name = np.array([name_codes[' '.join(raw.split()).title()] for raw in raw_codes], dtype=np.int64)
+        self.locations = names
+        self.location_codes = to_name[codes] if len(codes) else codes
+
+    def __len__(self):
+        return len(self.caravan_ids)
+
+
+_lock = threading.Lock()
+_snapshot = None
+_snapshot_version = None
+
+
+def get_snapshot():
+    """This worker's bookings snapshot, reloaded if any booking changed since it was loaded."""
+    global _snapshot, _snapshot_version
+    version = versions.current(availability.VERSION_KEY)
+    current = _snapshot is not None and _snapshot_version == version
+    record_cache('fleet_bookings', current)
+    if not current:
+        snapshot = BookingSnapshot()
+        with _lock:
+            _snapshot, _snapshot_version = snapshot, version
+    return _snapshot
+
+
+def _daily_counts(rows, starts, ends, n_rows, n_days):
+    """``n_rows x n_days`` counts of the half-open day ranges ``[starts, ends)`` covering each day."""
+    diff = np.zeros((n_rows, n_days + 1), dtype=np.int32)
+    np.add.at(diff, (rows, np.clip(starts, 0, n_days)), 1)
+    np.add.at(diff, (rows, np.clip(ends, 0, n_days)), -1)
+    return np.cumsum(diff[:, :n_days], axis=1)
+
+
+def _idle_streaks(occupied, min_days):
+    """Longest idle run and number of idle runs of ``min_days`` or more, per row."""
+    n_rows, n_days = occupied.shape
+    # A busy day on both sides of every row keeps runs from crossing rows
+    padded = np.ones((n_rows, n_days + 2), dtype=bool)
+    padded[:, 1:-1] = occupied
+    busy = np.flatnonzero(padded)
+    runs = np.diff(busy) - 1
+    row_of_run = busy[:-1] // (n_days + 2)
+    longest = np.zeros(n_rows, dtype=np.int64)
+    np.maximum.at(longest, row_of_run, runs)
+    streaks = np.bincount(row_of_run, weights=runs >= min_days, minlength=n_rows).astype(np.int64)
+    return longest, streaks
+
+
+def _group_stats(groups, n_groups, lead_days, weekly):
+    """Per group: bookings, median lead time (None when empty) and weekly-rate share."""
+    counts = np.bincount(groups, minlength=n_groups)
+    weekly_counts = np.bincount(groups, weights=weekly, minlength=n_groups)
+    # Sorting by (group, lead time) puts each group's median in its middle
+    order = np.lexsort((lead_days, groups))
+    sorted_leads = lead_days[order].astype(float)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    medians = []
+    for group in range(n_groups):
+        count = counts[group]
+        if not count:
+            medians.append(None)
+            continue
+        middle = offsets[group] + (count - 1) / 2
+        medians.append(float((sorted_leads[int(np.floor(middle))] + sorted_leads[int(np.ceil(middle))]) / 2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shares = np.where(counts > 0, weekly_counts / np.maximum(counts, 1), 0.0)
+    return counts, medians, shares
+
+
+def weekly_rates(daily, size):
+    """Mean share of ``size`` caravans booked in each 7-day block of ``daily`` (last block may be shorter)."""
+    if not size or not len(daily):
+        return []
+    return [float(daily[i:i + 7].mean() / size) for i in range(0, len(daily), 7)]
+
+
+def fleet_utilization(start, end, idle_streak_days=IDLE_STREAK_DAYS):
+    """Utilization of the active fleet from ``start`` to ``end`` (inclusive dates).
+
+    Returns a dict with ``fleet`` totals and per-``caravans``, per-``types``
+    and per-``locations`` rows. ``daily`` entries are numpy arrays of
+    booked caravans per day; ``occupancy`` is the caravans x days matrix,
+    in the order of ``caravans``.
+    """
+    n_days = (end - start).days + 1
+    if n_days <= 0:
+        raise ValueError('The window must end on or after its start')
+    caravans = list(
+        Caravan.objects.filter(is_active=True).order_by('pk').values_list('pk', 'name', 'caravan_type')
+    )
+    caravan_ids = np.array([pk for pk, _, _ in caravans], dtype=np.int64)
+
+    bookings = get_snapshot()
+    rows = np.searchsorted(caravan_ids, bookings.caravan_ids)
+    # Bookings of inactive caravans have no row of their own; drop them
+    active = np.zeros(len(bookings), dtype=bool)
+    found = rows < len(caravan_ids)
+    active[found] = caravan_ids[rows[found]] == bookings.caravan_ids[found]
+    first = start.toordinal()
+    selected = active & (bookings.pickups <= end.toordinal()) & (bookings.returns > first)
+    rows = rows[selected]
+    starts = bookings.pickups[selected] - first
+    ends = bookings.returns[selected] - first
+    created = bookings.created[selected] - first
+    location_of = bookings.location_codes[selected]
+
+    occupied = _daily_counts(rows, starts, ends, len(caravans), n_days) > 0
+    booked_days = occupied.sum(axis=1)
+    longest_idle, idle_streaks = _idle_streaks(occupied, idle_streak_days)
+
+    # Lead times and weekly uptake only count bookings picked up inside the window
+    picked_up = (starts >= 0) & (starts < n_days)
+    lead_days = np.maximum(starts - created, 0)[picked_up]
+    weekly = ((ends - starts) >= WEEKLY_RATE_DAYS)[picked_up]
+    caravan_counts, caravan_leads, caravan_weekly = _group_stats(rows[picked_up], len(caravans), lead_days, weekly)
+
+    type_labels = dict(Caravan.CARAVAN_TYPES)
+    type_keys = sorted({caravan_type for _, _, caravan_type in caravans})
+    type_of = np.array([type_keys.index(caravan_type) for _, _, caravan_type in caravans], dtype=np.int64)
+    type_matrix = np.zeros((len(type_keys), len(caravans)), dtype=np.float32)
+    type_matrix[type_of, np.arange(len(caravans))] = 1
+    type_daily = (type_matrix @ occupied.astype(np.float32)).astype(np.int64)
+    type_sizes = type_matrix.sum(axis=1).astype(np.int64)
+    type_counts, type_leads, type_weekly = _group_stats(type_of[rows[picked_up]], len(type_keys), lead_days, weekly)
+
+    location_keys = bookings.locations
+    location_daily = _daily_counts(location_of, starts, ends, len(location_keys), n_days)
+    location_counts, location_leads, location_weekly = _group_stats(
+        location_of[picked_up], len(location_keys), lead_days, weekly,
+    )
+
+    fleet_daily = occupied.sum(axis=0)
+    capacity = len(caravans) * n_days
+    return {
+        'start': start,
+        'end': end,
+        'days': n_days,
+        'dates': [start + timedelta(days=offset) for offset in range(n_days)],
+        'fleet': {
+            'caravans': len(caravans),
+            'booked_days': int(booked_days.sum()),
+            'utilization': float(booked_days.sum() / capacity) if capacity else 0.0,
+            'bookings': int(picked_up.sum()),
+            'lead_days': float(np.median(lead_days)) if len(lead_days) else None,
+            'weekly_share': float(weekly.mean()) if len(weekly) else 0.0,
+            'daily': fleet_daily,
+        },
+        'caravans': [
+            {
+                'id': pk,
+                'name': name,
+                'type': caravan_type,
+                'booked_days': int(booked_days[i]),
+                'utilization': float(booked_days[i] / n_days),
+                'longest_idle': int(longest_idle[i]),
+                'idle_streaks': int(idle_streaks[i]),
+                'bookings': int(caravan_counts[i]),
+                'lead_days': caravan_leads[i],
+                'weekly_share': float(caravan_weekly[i]),
+            }
+            for i, (pk, name, caravan_type) in enumerate(caravans)
+        ],
+        'types': [
+            {
+                'type': key,
+                'label': type_labels.get(key, key),
+                'caravans': int(type_sizes[i]),
+                'booked_days': int(type_daily[i].sum()),
+                'utilization': float(type_daily[i].sum() / (type_sizes[i] * n_days)),
+                'bookings': int(type_counts[i]),
+                'lead_days': type_leads[i],
+                'weekly_share': float(type_weekly[i]),
+                'daily': type_daily[i],
+            }
+            for i, key in enumerate(type_keys)
+        ],
+        'locations': [
+            {
+                'location': key,
+                'booked_days': int(location_daily[i].sum()),
+                'bookings': int(location_counts[i]),
+                'lead_days': location_leads[i],
+                'weekly_share': float(location_weekly[i]),
+                'daily': location_daily[i],
+            }
+            for i, key in enumerate(location_keys)
+        ],
+        'occupancy': occupied,
+    }
@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.conf import settings
+        from django.utils.module_loading import autodiscover_modules
+
+        from . import signals  # noqa: F401
+        from .metrics import install_template_timing
+
+        # Registers every app's background jobs (see core.jobs)
+        autodiscover_modules('tasks')
+
+        if getattr(settings, 'METRICS_ENABLED', True):
+            install_template_timing()
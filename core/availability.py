@@ -0,0 +1,106 @@
+"""Blocked booking dates for the caravan calendar.
+
+A booking blocks its caravan from ``pickup_date`` up to, but not
+including, ``return_date``: the return day is free for the next pickup.
+Blocked days are returned run-length encoded as inclusive
+``[first, last]`` date ranges, with overlapping and adjacent bookings
+merged, so a month is a handful of pairs however many bookings it has.
+
+All caravans' bookings for a period come from one ranged query. Results
+are cached per period until ``invalidate()``, which ``core.signals``
+calls whenever a booking is saved or deleted.
+"""
+import calendar
+import re
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.core.cache import cache
+
+from . import versions
+from .metrics import record_cache
+from .models import CaravanBooking
+
+VERSION_KEY = 'availability:version'
+CACHE_TIMEOUT = 60 * 60
+# Statuses that do not hold the caravan
+FREE_STATUSES = ['cancelled']
+
+MONTH_RE = re.compile(r'^(\d{4})-(\d{2})$')
+QUARTER_RE = re.compile(r'^(\d{4})-Q([1-4])$', re.IGNORECASE)
+
+
+def parse_period(month=None, quarter=None, today=None):
+    """``(first day, last day)`` of ``month`` (YYYY-MM) or ``quarter`` (YYYY-Qn).
+
+    Defaults to the current month; raises ValueError for malformed input.
+    """
+    if quarter:
+        match = QUARTER_RE.match(quarter)
+        if not match:
+            raise ValueError('quarter must look like 2025-Q3')
+        year, first_month, months = int(match[1]), (int(match[2]) - 1) * 3 + 1, 3
+    elif month:
+        match = MONTH_RE.match(month)
+        if not match or not 1 <= int(match[2]) <= 12:
+            raise ValueError('month must look like 2025-07')
+        year, first_month, months = int(match[1]), int(match[2]), 1
+    else:
+        today = today or date.today()
+        year, first_month, months = today.year, today.month, 1
+    last_month = first_month + months - 1
+    return date(year, first_month, 1), date(year, last_month, calendar.monthrange(year, last_month)[1])
+
+
+def invalidate():
+    versions.bump(VERSION_KEY)
+
+
+def _ranges(bookings, start, end):
+    """Merge ``(pickup, return)`` pairs sorted by pickup into inclusive ranges clipped to the period."""
+    ranges = []
+    for pickup, returned in bookings:
+        first, last = max(pickup, start), min(returned - timedelta(days=1), end)
+        if first > last:
+            continue
+        if ranges and first <= ranges[-1][1] + timedelta(days=1):
+            ranges[-1][1] = max(ranges[-1][1], last)
+        else:
+            ranges.append([first, last])
+    return ranges
+
+
+def blocked_ranges(start, end, caravan_id=None):
+    """``{caravan id: [[first, last], ...]}`` of days booked between ``start`` and ``end``.
+
+    Limited to one caravan when ``caravan_id`` is given; caravans with no
+    bookings in the period are left out.
+    """
+    key = f"availability:{versions.current(VERSION_KEY)}:{caravan_id or 'fleet'}:{start}:{end}"
+    result = cache.get(key)
+    record_cache('availability', result is not None)
+    if result is not None:
+        return result
+
+    bookings = CaravanBooking.objects.filter(
+        pickup_date__lte=end, return_date__gt=start,
+    ).exclude(status__in=FREE_STATUSES)
+    if caravan_id is not None:
+        bookings = bookings.filter(caravan_id=caravan_id)
+    by_caravan = defaultdict(list)
+    rows = bookings.order_by('caravan_id', 'pickup_date').values_list('caravan_id', 'pickup_date', 'return_date')
+    for caravan, pickup, returned in rows:
+        by_caravan[caravan].append((pickup, returned))
+    result = {caravan: _ranges(pairs, start, end) for caravan, pairs in by_caravan.items()}
+    cache.set(key, result, CACHE_TIMEOUT)
+    return result
+
+
+def is_available(caravan_id, pickup, returned, exclude=None):
+    """Whether no other booking holds the caravan on any day from ``pickup`` to the day before ``returned``."""
+    clashes = CaravanBooking.objects.filter(
+        caravan_id=caravan_id, pickup_date__lt=returned, return_date__gt=pickup,
+    ).exclude(status__in=FREE_STATUSES)
+    if exclude is not None:
+        clashes = clashes.exclude(pk=exclude)
+    return not clashes.exists()
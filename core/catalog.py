@@ -0,0 +1,318 @@
+"""Bulk import of destination catalogs from CSV or JSON Lines.
+
+Each record describes one destination. JSONL records may carry nested
+``images`` and ``points_of_interest`` lists; CSV rows use ``|``-separated
+``tags`` and ``images`` columns. Image values are paths relative to
+``MEDIA_ROOT`` that are already in place; they are stored as-is. When a
+record updates an existing destination, only the child sets it has a
+column for are replaced; records repeating a slug are applied in order.
+The whole import runs in one transaction, so a file with an invalid
+record imports nothing.
+"""
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import facets, search
+from .models import Category, Destination, DestinationImage, PointOfInterest, Tag
+
+DESTINATION_FIELDS = [
+    'name', 'location', 'description', 'price_per_person', 'duration', 'image', 'map_image',
+    'destination_type', 'shower_count', 'bed_count', 'near_mountain', 'near_beach', 'is_active', 'is_featured',
+]
+POI_FIELDS = ['name', 'description', 'x_percent', 'y_percent', 'icon', 'latitude', 'longitude', 'google_place_id']
+REQUIRED_POI_FIELDS = ['name', 'x_percent', 'y_percent']
+BOOLEAN_FIELDS = {'near_mountain', 'near_beach', 'is_active', 'is_featured', 'is_primary'}
+INTEGER_FIELDS = {'duration', 'shower_count', 'bed_count'}
+DECIMAL_FIELDS = {'price_per_person', 'x_percent', 'y_percent', 'latitude', 'longitude'}
+REQUIRED_FIELDS = ['name', 'location', 'price_per_person', 'duration', 'destination_type']
+SLUG_LENGTH = Destination._meta.get_field('slug').max_length
+DESTINATION_TYPES = {code for code, _ in Destination.DESTINATION_TYPES}
+
+
+class CatalogError(ValueError):
+    pass
+
+
+def _coerce(field, value):
+    if value is None or value == '':
+        return None
+    if field in BOOLEAN_FIELDS:
+        if isinstance(value, str):
+            return value.strip().lower() in ('1', 'true', 'yes', 'y', 'on')
+        return bool(value)
+    try:
+        if field in INTEGER_FIELDS:
+            return int(value)
+        if field in DECIMAL_FIELDS:
+            return Decimal(str(value))
+    except (ValueError, TypeError, InvalidOperation):
+        raise ValueError(f'invalid {field} {value!r}') from None
+    return value
+
+
+def _split(value):
+    if not value:
+        return []
+    if isinstance(value, list):
+        return value
+    return [part.strip() for part in value.split('|') if part.strip()]
+
+
+def _children(row, key):
+    """The record's ``key`` list, or None when it has no such column."""
+    if key not in row:
+        return None
+    return _split(row[key])
+
+
+def _read_poi(poi):
+    values = {field: _coerce(field, poi.get(field)) for field in POI_FIELDS}
+    missing = [field for field in REQUIRED_POI_FIELDS if values[field] is None]
+    if missing:
+        raise ValueError(f"point of interest {values['name'] or ''!r} is missing {', '.join(missing)}")
+    values['description'] = values['description'] or ''
+    values['google_place_id'] = values['google_place_id'] or ''
+    return values
+
+
+def _read_record(row):
+    fields = {
+        field: _coerce(field, row[field])
+        for field in DESTINATION_FIELDS
+        if field in row and row[field] not in (None, '')
+    }
+    if 'destination_type' in fields and fields['destination_type'] not in DESTINATION_TYPES:
+        raise ValueError(f"unknown destination_type {fields['destination_type']!r}")
+    images = _children(row, 'images')
+    if images is not None:
+        images = [image if isinstance(image, dict) else {'image': image} for image in images]
+        for image in images:
+            if not image.get('image'):
+                raise ValueError('image without a path')
+            image['is_primary'] = bool(_coerce('is_primary', image.get('is_primary')))
+    points_of_interest = _children(row, 'points_of_interest')
+    if points_of_interest is not None:
+        points_of_interest = [_read_poi(poi) for poi in points_of_interest]
+    return {
+        'slug': row.get('slug') or '',
+        'fields': fields,
+        'tags': _children(row, 'tags'),
+        'images': images,
+        'points_of_interest': points_of_interest,
+    }
+
+
+def read_records(fh, fmt):
+    """Yield normalized catalog records from a text file object.
+
+    Unreadable or invalid records raise ``CatalogError`` with their number.
+    """
+    if fmt == 'jsonl':
+        rows = (line for line in fh if line.strip())
+    else:
+        rows = csv.DictReader(fh)
+    for line_no, row in enumerate(rows, start=1):
+        try:
+            if fmt == 'jsonl':
+                row = json.loads(row)
+            if not row.get('name'):
+                raise ValueError('missing name')
+            record = _read_record(row)
+        except (ValueError, TypeError, AttributeError) as exc:
+            raise CatalogError(f'Record {line_no}: {exc}') from exc
+        yield record
+
+
+class SlugAllocator:
+    """Hands out unique destination slugs for a whole import run.
+
+    Existing slugs are fetched once per base (one ``IN`` query per batch plus
+    a prefix query only for bases that already collide), and slugs handed
+    out during the run are remembered so batches never collide with each
+    other.
+    """
+
+    def __init__(self):
+        self.taken = set()
+        self.next_suffix = {}
+
+    def prime(self, bases):
+        unseen = [base for base in bases if base not in self.next_suffix]
+        if not unseen:
+            return
+        existing = set(Destination.objects.filter(slug__in=unseen).values_list('slug', flat=True))
+        self.taken.update(existing)
+        for base in unseen:
+            self.next_suffix[base] = 2
+            if base in existing:
+                self.taken.update(
+                    Destination.objects.filter(slug__startswith=base[:SLUG_LENGTH - 8])
+                    .values_list('slug', flat=True)
+                )
+
+    def allocate(self, base):
+        slug = base
+        while slug in self.taken:
+            suffix = f'-{self.next_suffix[base]}'
+            self.next_suffix[base] += 1
+            slug = base[:SLUG_LENGTH - len(suffix)] + suffix
+        self.taken.add(slug)
+        return slug
+
+
+def _base_slug(record):
+    base = slugify(record['slug'] or record['fields'].get('name', ''))[:SLUG_LENGTH]
+    return base or 'destination'
+
+
+def _link_tags(batch):
+    names = {name for destination, record in batch for name in record['tags'] or ()}
+    if not names:
+        return
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    missing = [Tag(name=name, slug=slugify(name)[:50]) for name in names if name not in tags]
+    if missing:
+        Tag.objects.bulk_create(missing, ignore_conflicts=True)
+        tags.update({tag.name: tag for tag in Tag.objects.filter(name__in=[tag.name for tag in missing])})
+    through = Destination.tags.through
+    links = [
+        through(destination_id=destination.pk, tag_id=tags[name].pk)
+        for destination, record in batch
+        for name in record['tags'] or ()
+        if name in tags
+    ]
+    through.objects.bulk_create(links, ignore_conflicts=True)
+
+
+def _create_children(batch):
+    images = []
+    pois = []
+    for destination, record in batch:
+        for image in record['images'] or ():
+            images.append(DestinationImage(
+                destination_id=destination.pk,
+                image=image['image'],
+                caption=image.get('caption', ''),
+                is_primary=image['is_primary'],
+            ))
+        for values in record['points_of_interest'] or ():
+            pois.append(PointOfInterest(destination_id=destination.pk, **values))
+    DestinationImage.objects.bulk_create(images)
+    PointOfInterest.objects.bulk_create(pois)
+
+
+def _supplied(rows, key):
+    return [destination.pk for destination, record in rows if record[key] is not None]
+
+
+def _merge_repeated(batch):
+    """Fold records of the batch that share a slug into the last one, as if applied in turn."""
+    merged = {}
+    for record in batch:
+        base = _base_slug(record)
+        earlier = merged.pop(base, None)
+        if earlier is not None:
+            record = {
+                **record,
+                'fields': {**earlier['fields'], **record['fields']},
+                **{
+                    key: earlier[key]
+                    for key in ('tags', 'images', 'points_of_interest')
+                    if record[key] is None
+                },
+            }
+        merged[base] = record
+    return list(merged.values())
+
+
+def _flush(batch, allocator, upsert, stats):
+    if upsert:
+        # One destination each: in_bulk would hand repeated slugs the same row
+        batch = _merge_repeated(batch)
+    bases = [_base_slug(record) for record in batch]
+    existing = {}
+    if upsert:
+        existing = Destination.objects.in_bulk(bases, field_name='slug')
+    allocator.prime(bases)
+
+    created, updated, update_fields = [], [], set()
+    now = timezone.now()
+    for base, record in zip(bases, batch):
+        destination = existing.get(base)
+        if destination is not None:
+            for field, value in record['fields'].items():
+                setattr(destination, field, value)
+                update_fields.add(field)
+            destination.updated_at = now
+            updated.append((destination, record))
+        else:
+            missing = [field for field in REQUIRED_FIELDS if record['fields'].get(field) is None]
+            if missing:
+                raise CatalogError(f"{record['fields']['name']}: missing {', '.join(missing)}")
+            destination = Destination(slug=allocator.allocate(base), **record['fields'])
+            created.append((destination, record))
+
+    if created:
+        Destination.objects.bulk_create([destination for destination, _ in created])
+    if updated:
+        Destination.objects.bulk_update(
+            [destination for destination, _ in updated],
+            sorted(update_fields | {'updated_at'}),
+        )
+        # Upserted rows take the catalog's tags, images and POIs, for
+        # each set the record has a column for
+        Destination.tags.through.objects.filter(destination_id__in=_supplied(updated, 'tags')).delete()
+        DestinationImage.objects.filter(destination_id__in=_supplied(updated, 'images')).delete()
+        PointOfInterest.objects.filter(destination_id__in=_supplied(updated, 'points_of_interest')).delete()
+    rows = created + updated
+    _link_tags(rows)
+    _create_children(rows)
+    if 'is_active' in update_fields:
+        # bulk_update skips the signals that keep the counts current
+        memberships = Category.destinations.through.objects.filter(
+            destination_id__in=[destination.pk for destination, _ in updated],
+        )
+        Category.refresh_destination_counts(memberships.values('category_id'))
+
+    stats['created'] += len(created)
+    stats['updated'] += len(updated)
+
+
+def import_catalog(records, upsert=False, batch_size=1000, progress=None):
+    """Import catalog records in batches and return created/updated counts.
+
+    Nothing is committed unless every record imports. ``progress`` is
+    called with the running stats after every batch.
+    """
+    allocator = SlugAllocator()
+    stats = {'created': 0, 'updated': 0}
+    batch = []
+    with transaction.atomic():
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                _flush(batch, allocator, upsert, stats)
+                batch = []
+                if progress:
+                    progress(stats)
+        if batch:
+            _flush(batch, allocator, upsert, stats)
+            if progress:
+                progress(stats)
+    # Bulk writes skip the model signals that normally refresh facet counts
+    facets.invalidate('destinations')
+    search.invalidate()
+    return stats
+
+
+def import_file(fh, fmt, **kwargs):
+    """Import from a binary or text file object in ``csv`` or ``jsonl`` format."""
+    if not isinstance(fh, io.TextIOBase):
+        fh = io.TextIOWrapper(fh, encoding='utf-8', newline='')
+    return import_catalog(read_records(fh, fmt), **kwargs)
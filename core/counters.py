@@ -0,0 +1,120 @@
+"""Buffered page-view counters.
+
+Views call ``record_view(obj)``, which only bumps an in-process dict. The
+buffered deltas are written to ``ViewCount`` in a single transaction at
+most once every ``VIEW_COUNTER_FLUSH_INTERVAL`` seconds (checked on the
+next recorded view) and when the worker shuts down.
+
+The buffer is swapped out before writing and only merged back if the
+transaction rolls back, so a delta is applied exactly once or not at all:
+a worker that is killed loses at most one interval of views but never
+counts any of them twice.
+
+``total_views()`` is cached for ``VIEW_TOTAL_CACHE_TIMEOUT`` seconds and
+dropped from the cache by every flush.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TOTAL_VIEWS_KEY = 'counters:total-views'
+
+
+class ViewCounterBuffer:
+    def __init__(self, interval=None):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = defaultdict(int)
+        self._last_flush = time.monotonic()
+
+    def get_interval(self):
+        if self.interval is not None:
+            return self.interval
+        return getattr(settings, 'VIEW_COUNTER_FLUSH_INTERVAL', 5)
+
+    def record(self, kind, object_id, amount=1):
+        with self._lock:
+            self._pending[(kind, object_id)] += amount
+            due = time.monotonic() - self._last_flush >= self.get_interval()
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write buffered deltas; returns the number of counters touched."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(int)
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            self._write(pending)
+        except DatabaseError:
+            logger.exception('Could not flush %d view counters; keeping them for the next flush', len(pending))
+            with self._lock:
+                for key, delta in pending.items():
+                    self._pending[key] += delta
+            return 0
+        return len(pending)
+
+    def _write(self, pending):
+        from .models import ViewCount
+
+        # Group keys that share a delta so each group is a single UPDATE
+        groups = defaultdict(list)
+        for (kind, object_id), delta in pending.items():
+            groups[(kind, delta)].append(object_id)
+        now = timezone.now()
+        with transaction.atomic():
+            ViewCount.objects.bulk_create(
+                [ViewCount(kind=kind, object_id=object_id) for kind, object_id in pending],
+                ignore_conflicts=True,
+            )
+            for (kind, delta), object_ids in groups.items():
+                ViewCount.objects.filter(kind=kind, object_id__in=object_ids).update(
+                    count=F('count') + delta, updated_at=now
+                )
+        cache.delete(TOTAL_VIEWS_KEY)
+
+    def reset(self):
+        """Drop buffered deltas without writing them."""
+        with self._lock:
+            self._pending.clear()
+            self._last_flush = time.monotonic()
+
+
+view_counter = ViewCounterBuffer()
+atexit.register(view_counter.flush)
+
+
+def record_view(obj):
+    """Count one view of a Destination, Caravan or Course."""
+    view_counter.record(obj._meta.model_name, obj.pk)
+
+
+def total_views():
+    from .models import ViewCount
+
+    total = cache.get(TOTAL_VIEWS_KEY)
+    if total is None:
+        total = ViewCount.objects.aggregate(total=Sum('count'))['total'] or 0
+        cache.set(TOTAL_VIEWS_KEY, total, getattr(settings, 'VIEW_TOTAL_CACHE_TIMEOUT', 300))
+    return total
+
+
+def view_counts(kind, object_ids):
+    """Return ``{object_id: count}`` for the given objects of one kind."""
+    from .models import ViewCount
+
+    return dict(
+        ViewCount.objects.filter(kind=kind, object_id__in=object_ids).values_list('object_id', 'count')
+    )
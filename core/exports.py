@@ -0,0 +1,134 @@
+import csv
+import json
+import zlib
+
+from django.contrib import admin
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from agency.models import Agency
+from .models import CaravanBooking, CourseApplication, Testimonial
+
+CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024
+
+# kind -> (model, exported columns, filter name -> lookup)
+EXPORTS = {
+    'bookings': (
+        CaravanBooking,
+        ['id', 'caravan__name', 'caravan__caravan_type', 'user__username', 'full_name', 'email', 'phone',
+         'pickup_date', 'return_date', 'pickup_location', 'return_location', 'destination', 'purpose',
+         'total_amount', 'security_deposit_paid', 'status', 'created_at'],
+        {'status': 'status', 'caravan': 'caravan__slug'},
+    ),
+    'applications': (
+        CourseApplication,
+        ['id', 'course__name', 'course__category', 'full_name', 'email', 'phone', 'status', 'created_at'],
+        {'status': 'status', 'course': 'course__slug'},
+    ),
+    'agencies': (
+        Agency,
+        ['id', 'name', 'owner_name', 'email', 'phone', 'website', 'city', 'state', 'country', 'approved',
+         'created_at'],
+        {},
+    ),
+    'testimonials': (
+        Testimonial,
+        ['id', 'name', 'position', 'rating', 'destination__name', 'feedback', 'is_active', 'created_at'],
+        {},
+    ),
+}
+
+
+class _Echo:
+    """File-like object whose ``write`` hands back the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows, fields):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _jsonl_lines(rows, fields):
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def _buffered(lines, compress):
+    """Group lines into ~64 KB blocks, gzip-compressing them if asked."""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES:
+            block = ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+            if compressor:
+                block = compressor.compress(block)
+                if not block:
+                    continue
+            yield block
+    block = ''.join(buffer).encode('utf-8')
+    if compressor:
+        block = compressor.compress(block) + compressor.flush()
+    if block:
+        yield block
+
+
+def filter_export(kind, queryset, filters):
+    """Apply the cleaned ``ExportFilterForm`` values to ``queryset``."""
+    _, _, lookups = EXPORTS[kind]
+    if filters.get('start'):
+        queryset = queryset.filter(created_at__date__gte=filters['start'])
+    if filters.get('end'):
+        queryset = queryset.filter(created_at__date__lte=filters['end'])
+    for name, lookup in lookups.items():
+        if filters.get(name):
+            queryset = queryset.filter(**{lookup: filters[name]})
+    return queryset
+
+
+def stream_export(kind, queryset=None, fmt='csv', compress=False):
+    """Return a constant-memory streaming response for an export.
+
+    Rows are read as tuples with ``iterator(chunk_size=...)`` so only one
+    chunk is held in memory (server-side cursors on PostgreSQL).
+    """
+    model, fields, _ = EXPORTS[kind]
+    if queryset is None:
+        queryset = model.objects.all()
+    rows = queryset.order_by('pk').values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+    lines = _jsonl_lines(rows, fields) if fmt == 'jsonl' else _csv_lines(rows, fields)
+
+    content_type = 'application/x-ndjson' if fmt == 'jsonl' else 'text/csv'
+    filename = f'{kind}.{fmt}'
+    if compress:
+        content_type = 'application/gzip'
+        filename += '.gz'
+    response = StreamingHttpResponse(_buffered(lines, compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _model_kind(model):
+    for kind, (export_model, _, _) in EXPORTS.items():
+        if export_model is model:
+            return kind
+    raise KeyError(model)
+
+
+@admin.action(description='Export selected as CSV')
+def export_selected_csv(modeladmin, request, queryset):
+    return stream_export(_model_kind(queryset.model), queryset, 'csv')
+
+
+@admin.action(description='Export selected as JSONL')
+def export_selected_jsonl(modeladmin, request, queryset):
+    return stream_export(_model_kind(queryset.model), queryset, 'jsonl')
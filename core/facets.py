@@ -0,0 +1,329 @@
+"""Faceted filtering with single-query facet counts.
+
+Facet counts are computed with conditional aggregation (``Count(...,
+filter=Q(...))``) over the unfiltered base set, so every option count,
+the price histogram and the price bounds come back from one query. Each
+count applies all active filters except those of its own facet group,
+which is what lets a visitor see how many results a second choice in the
+same group would add. Results are cached per normalized filter set; the
+cache is invalidated wholesale by bumping a version whenever a row of
+the faceted model changes.
+
+Destinations and caravans are faceted; caravan capacity and price bands
+come from the ``CARAVAN_CAPACITY_BANDS`` and ``CARAVAN_PRICE_BANDS``
+settings.
+"""
+import hashlib
+import json
+import math
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Min, Q
+
+from . import versions
+from .metrics import record_cache
+from .models import Caravan, Destination, Tag
+
+CACHE_TIMEOUT = 60 * 10
+
+# (value, label, lower bound, upper bound) -- bounds are inclusive, None is open
+DURATION_BANDS = [
+    ('1-2', '1-2 days', 1, 2),
+    ('3-5', '3-5 days', 3, 5),
+    ('6-', '6+ days', 6, None),
+]
+BED_OPTIONS = [1, 2, 3, 4]
+# Edges of the destination price histogram; buckets are [edge, next edge), the last open-ended
+PRICE_EDGES = [0, 2000, 5000, 10000, 20000, 50000]
+MAX_TAG_FACETS = 30
+
+DEFAULT_CARAVAN_CAPACITY_BANDS = [
+    ('2', '2+ People', 2, None),
+    ('4', '4+ People', 4, None),
+    ('6', '6+ People', 6, None),
+    ('8', '8+ People', 8, None),
+]
+DEFAULT_CARAVAN_PRICE_BANDS = [
+    ('1000-3000', '₹1,000 - ₹3,000', 1000, 3000),
+    ('3000-5000', '₹3,000 - ₹5,000', 3000, 5000),
+    ('5000-8000', '₹5,000 - ₹8,000', 5000, 8000),
+    ('8000+', '₹8,000+', 8000, None),
+]
+
+
+def _band_q(field, low, high, upper='lte'):
+    q = Q(**{f'{field}__gte': low})
+    if high is not None:
+        q &= Q(**{f'{field}__{upper}': high})
+    return q
+
+
+def _any(queries):
+    return reduce(or_, queries) if queries else Q()
+
+
+def _version(name):
+    return versions.current(f'facets:{name}:version')
+
+
+def invalidate(name):
+    """Drop every cached facet result of ``name`` (``destinations`` or ``caravans``)."""
+    versions.bump(f'facets:{name}:version')
+
+
+def _cached(name, filters, compute):
+    normalized = json.dumps(filters, sort_keys=True, default=str)
+    digest = hashlib.sha1(normalized.encode()).hexdigest()
+    key = f'facets:{name}:{_version(name)}:{digest}'
+    result = cache.get(key)
+    record_cache(f'facets_{name}', result is not None)
+    if result is None:
+        result = compute()
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
+
+
+def normalize_destination_filters(data):
+    """Reduce cleaned ``SearchForm`` data to the facet filters, in canonical form."""
+    price_max = data.get('price_max')
+    if data.get('price_limit') and (price_max is None or data['price_limit'] < price_max):
+        price_max = data['price_limit']
+    return {
+        'q': (data.get('destination') or '').strip().lower(),
+        'type': sorted(data.get('destination_type') or []),
+        'near_mountain': bool(data.get('near_mountain')),
+        'near_beach': bool(data.get('near_beach')),
+        'beds': int(data['min_beds']) if data.get('min_beds') else None,
+        'duration': sorted(data.get('duration') or []),
+        'tags': sorted(data.get('tags') or []),
+        'price_min': data.get('price_min'),
+        'price_max': price_max,
+    }
+
+
+def _destination_group_filters(filters):
+    """``{facet group: Q}`` for every active filter except the free-text query."""
+    groups = {}
+    if filters['type']:
+        groups['type'] = Q(destination_type__in=filters['type'])
+    if filters['near_mountain']:
+        groups['near_mountain'] = Q(near_mountain=True)
+    if filters['near_beach']:
+        groups['near_beach'] = Q(near_beach=True)
+    if filters['beds']:
+        groups['beds'] = Q(bed_count__gte=filters['beds'])
+    if filters['duration']:
+        bands = {value: (low, high) for value, _, low, high in DURATION_BANDS}
+        groups['duration'] = _any([_band_q('duration', *bands[value]) for value in filters['duration']])
+    if filters['tags']:
+        # A subquery keeps the tag join from duplicating destination rows
+        tagged = Destination.tags.through.objects.filter(tag__slug__in=filters['tags']).values('destination_id')
+        groups['tags'] = Q(pk__in=tagged)
+    price = Q()
+    if filters['price_min'] is not None:
+        price &= Q(price_per_person__gte=filters['price_min'])
+    if filters['price_max'] is not None:
+        price &= Q(price_per_person__lte=filters['price_max'])
+    if price:
+        groups['price'] = price
+    return groups
+
+
+def _destination_base(filters):
+    queryset = Destination.objects.filter(is_active=True)
+    if filters['q']:
+        queryset = queryset.filter(Q(name__icontains=filters['q']) | Q(location__icontains=filters['q']))
+    return queryset
+
+
+def filter_destinations(filters):
+    """Active destinations matching every filter."""
+    queryset = _destination_base(filters)
+    for q in _destination_group_filters(filters).values():
+        queryset = queryset.filter(q)
+    return queryset
+
+
+def _price_buckets():
+    buckets = []
+    for i, low in enumerate(PRICE_EDGES):
+        high = PRICE_EDGES[i + 1] if i + 1 < len(PRICE_EDGES) else None
+        label = f'₹{low:,}+' if high is None else f'₹{low:,} - ₹{high:,}'
+        buckets.append((f'{low}-{high or ""}', label, low, high))
+    return buckets
+
+
+def _compute_destination_facets(filters):
+    groups = _destination_group_filters(filters)
+
+    def others(*excluded):
+        q = Q()
+        for group, group_q in groups.items():
+            if group not in excluded:
+                q &= group_q
+        return q
+
+    tags = list(Tag.objects.order_by('name').values_list('slug', 'name')[:MAX_TAG_FACETS])
+    through = Destination.tags.through.objects
+    price_buckets = _price_buckets()
+
+    aggregates = {'total': Count('pk', filter=others())}
+    for code, _ in Destination.DESTINATION_TYPES:
+        aggregates[f'type:{code}'] = Count('pk', filter=others('type') & Q(destination_type=code))
+    aggregates['surroundings:near_mountain'] = Count('pk', filter=others('near_mountain') & Q(near_mountain=True))
+    aggregates['surroundings:near_beach'] = Count('pk', filter=others('near_beach') & Q(near_beach=True))
+    for beds in BED_OPTIONS:
+        aggregates[f'beds:{beds}'] = Count('pk', filter=others('beds') & Q(bed_count__gte=beds))
+    for value, _, low, high in DURATION_BANDS:
+        aggregates[f'duration:{value}'] = Count('pk', filter=others('duration') & _band_q('duration', low, high))
+    for slug, _ in tags:
+        tagged = Q(pk__in=through.filter(tag__slug=slug).values('destination_id'))
+        aggregates[f'tag:{slug}'] = Count('pk', filter=others('tags') & tagged)
+    for value, _, low, high in price_buckets:
+        aggregates[f'price:{value}'] = Count('pk', filter=others('price') & _band_q('price_per_person', low, high, 'lt'))
+    # Slider bounds ignore the price filter itself so the handles can move back out
+    aggregates['bounds:min'] = Min('price_per_person', filter=others('price'))
+    aggregates['bounds:max'] = Max('price_per_person', filter=others('price'))
+
+    row = _destination_base(filters).aggregate(**aggregates)
+
+    def options(prefix, choices):
+        return [
+            {'value': str(value), 'label': label, 'count': row[f'{prefix}:{value}'],
+             'selected': str(value) in map(str, selected)}
+            for value, label, selected in choices
+        ]
+
+    return {
+        'total': row['total'],
+        'type': options('type', [(code, label, filters['type']) for code, label in Destination.DESTINATION_TYPES]),
+        'near_mountain': row['surroundings:near_mountain'],
+        'near_beach': row['surroundings:near_beach'],
+        'beds': options('beds', [(beds, f'{beds}+ beds', [filters['beds'] or '']) for beds in BED_OPTIONS]),
+        'duration': options('duration', [(value, label, filters['duration']) for value, label, _, _ in DURATION_BANDS]),
+        'tags': options('tag', [(slug, name, filters['tags']) for slug, name in tags]),
+        'price_histogram': [
+            {'value': value, 'label': label, 'count': row[f'price:{value}']}
+            for value, label, _, _ in price_buckets
+        ],
+        'price_bounds': {
+            'min': int(row['bounds:min'] or 0),
+            'max': math.ceil(row['bounds:max'] or 0),
+        },
+    }
+
+
+def destination_facets(filters):
+    """Facet counts, price histogram and price bounds for normalized filters (cached)."""
+    return _cached('destinations', filters, lambda: _compute_destination_facets(filters))
+
+
+def caravan_capacity_bands():
+    return getattr(settings, 'CARAVAN_CAPACITY_BANDS', DEFAULT_CARAVAN_CAPACITY_BANDS)
+
+
+def caravan_price_bands():
+    return getattr(settings, 'CARAVAN_PRICE_BANDS', DEFAULT_CARAVAN_PRICE_BANDS)
+
+
+def caravan_amenities():
+    """``(field name, label)`` of every ``has_*`` flag on ``Caravan``."""
+    return [
+        (field.name, str(field.verbose_name))
+        for field in Caravan._meta.concrete_fields
+        if field.name.startswith('has_')
+    ]
+
+
+def normalize_caravan_filters(data):
+    """Reduce cleaned ``CaravanSearchForm`` data to the facet filters, in canonical form."""
+    return {
+        'type': data.get('caravan_type') or '',
+        'capacity': data.get('capacity') or '',
+        'price': data.get('price_range') or '',
+        'fuel': data.get('fuel_type') or '',
+        'transmission': data.get('transmission') or '',
+        'amenities': sorted(name for name, _ in caravan_amenities() if data.get(name)),
+    }
+
+
+def _caravan_group_filters(filters):
+    """``{facet group: Q}`` for every active filter; each amenity is its own group."""
+    groups = {}
+    if filters['type']:
+        groups['type'] = Q(caravan_type=filters['type'])
+    bands = {value: (low, high) for value, _, low, high in caravan_capacity_bands()}
+    if filters['capacity'] in bands:
+        groups['capacity'] = _band_q('capacity', *bands[filters['capacity']])
+    bands = {value: (low, high) for value, _, low, high in caravan_price_bands()}
+    if filters['price'] in bands:
+        groups['price'] = _band_q('daily_rate', *bands[filters['price']])
+    if filters['fuel']:
+        groups['fuel'] = Q(fuel_type=filters['fuel'])
+    if filters['transmission']:
+        groups['transmission'] = Q(transmission=filters['transmission'])
+    for name in filters['amenities']:
+        groups[name] = Q(**{name: True})
+    return groups
+
+
+def _caravan_base():
+    return Caravan.objects.filter(is_active=True, is_available=True)
+
+
+def filter_caravans(filters):
+    """Available caravans matching every filter."""
+    queryset = _caravan_base()
+    for q in _caravan_group_filters(filters).values():
+        queryset = queryset.filter(q)
+    return queryset
+
+
+def _compute_caravan_facets(filters):
+    groups = _caravan_group_filters(filters)
+
+    def others(*excluded):
+        q = Q()
+        for group, group_q in groups.items():
+            if group not in excluded:
+                q &= group_q
+        return q
+
+    # group -> [(value, label, Q)] for every option shown with a count
+    choices = {
+        'type': [(code, label, Q(caravan_type=code)) for code, label in Caravan.CARAVAN_TYPES],
+        'capacity': [(value, label, _band_q('capacity', low, high)) for value, label, low, high in caravan_capacity_bands()],
+        'price': [(value, label, _band_q('daily_rate', low, high)) for value, label, low, high in caravan_price_bands()],
+        'fuel': [(code, label, Q(fuel_type=code)) for code, label in Caravan.FUEL_TYPES],
+        'transmission': [(code, label, Q(transmission=code)) for code, label in Caravan.TRANSMISSION_TYPES],
+    }
+    aggregates = {'total': Count('pk', filter=others())}
+    for group, options in choices.items():
+        for i, (_, _, option_q) in enumerate(options):
+            aggregates[f'{group}:{i}'] = Count('pk', filter=others(group) & option_q)
+    for name, _ in caravan_amenities():
+        aggregates[f'amenity:{name}'] = Count('pk', filter=others(name) & Q(**{name: True}))
+
+    row = _caravan_base().aggregate(**aggregates)
+
+    facets = {'total': row['total']}
+    for group, options in choices.items():
+        facets[group] = [
+            {'value': value, 'label': label, 'count': row[f'{group}:{i}'], 'selected': value == filters[group]}
+            for i, (value, label, _) in enumerate(options)
+        ]
+    facets['amenities'] = [
+        {'value': name, 'label': label, 'count': row[f'amenity:{name}'], 'selected': name in filters['amenities']}
+        for name, label in caravan_amenities()
+    ]
+    return facets
+
+
+def caravan_facets(filters):
+    """Counts for every caravan facet option under normalized filters (cached)."""
+    # The bands are part of the key so changing them never serves stale options
+    key = dict(filters, bands=[caravan_capacity_bands(), caravan_price_bands()])
+    return _cached('caravans', key, lambda: _compute_caravan_facets(filters))
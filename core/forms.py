@@ -1,5 +1,7 @@
 from django import forms
-from .models import CourseApplication, Testimonial, Caravan, CaravanBooking
+from .availability import is_available
+from .facets import BED_OPTIONS, DURATION_BANDS, caravan_capacity_bands, caravan_price_bands
+from .models import CourseApplication, Testimonial, Caravan, CaravanBooking, Destination, Tag
 from agency.models import Agency
 
 class SearchForm(forms.Form):
@@ -10,6 +12,32 @@ class SearchForm(forms.Form):
             'class': 'form-control'
         })
     )
+    price_limit = forms.IntegerField(required=False, min_value=0)
+    price_min = forms.IntegerField(required=False, min_value=0)
+    price_max = forms.IntegerField(required=False, min_value=0)
+    destination_type = forms.MultipleChoiceField(
+        choices=Destination.DESTINATION_TYPES,
+        required=False,
+        widget=forms.CheckboxSelectMultiple
+    )
+    near_mountain = forms.BooleanField(required=False)
+    near_beach = forms.BooleanField(required=False)
+    min_beds = forms.TypedChoiceField(
+        choices=[('', 'Any')] + [(beds, f'{beds}+ beds') for beds in BED_OPTIONS],
+        coerce=int,
+        required=False,
+        empty_value=None
+    )
+    duration = forms.MultipleChoiceField(
+        choices=[(value, label) for value, label, _, _ in DURATION_BANDS],
+        required=False,
+        widget=forms.CheckboxSelectMultiple
+    )
+    tags = forms.MultipleChoiceField(required=False, widget=forms.CheckboxSelectMultiple)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['tags'].choices = Tag.objects.order_by('name').values_list('slug', 'name')
 
 class CourseApplicationForm(forms.ModelForm):
     class Meta:
@@ -58,30 +86,27 @@ class CaravanSearchForm(forms.Form):
         widget=forms.Select(attrs={'class': 'form-control'})
     )
     capacity = forms.ChoiceField(
-        choices=[
-            ('', 'Any Capacity'),
-            ('2', '2 People'),
-            ('4', '4 People'),
-            ('6', '6 People'),
-            ('8', '8+ People')
-        ],
         required=False,
         widget=forms.Select(attrs={'class': 'form-control'})
     )
     price_range = forms.ChoiceField(
-        choices=[
-            ('', 'Any Price'),
-            ('1000-3000', '₹1,000 - ₹3,000'),
-            ('3000-5000', '₹3,000 - ₹5,000'),
-            ('5000-8000', '₹5,000 - ₹8,000'),
-            ('8000+', '₹8,000+')
-        ],
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    fuel_type = forms.ChoiceField(
+        choices=[('', 'Any Fuel')] + Caravan.FUEL_TYPES,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    transmission = forms.ChoiceField(
+        choices=[('', 'Any Transmission')] + Caravan.TRANSMISSION_TYPES,
         required=False,
         widget=forms.Select(attrs={'class': 'form-control'})
     )
     has_ac = forms.BooleanField(required=False, label='Air Conditioning')
     has_kitchen = forms.BooleanField(required=False, label='Kitchen')
     has_bathroom = forms.BooleanField(required=False, label='Bathroom')
+    has_generator = forms.BooleanField(required=False, label='Generator')
     pickup_date = forms.DateField(
         required=False,
         widget=forms.DateInput(attrs={
@@ -97,6 +122,36 @@ class CaravanSearchForm(forms.Form):
         })
     )
 
+    # Facet group of each select field, as named by core.facets
+    FACET_GROUPS = {
+        'caravan_type': 'type',
+        'capacity': 'capacity',
+        'price_range': 'price',
+        'fuel_type': 'fuel',
+        'transmission': 'transmission',
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['capacity'].choices = [('', 'Any Capacity')] + [
+            (value, label) for value, label, _, _ in caravan_capacity_bands()
+        ]
+        self.fields['price_range'].choices = [('', 'Any Price')] + [
+            (value, label) for value, label, _, _ in caravan_price_bands()
+        ]
+
+    def apply_facets(self, facets):
+        """Show the number of matching caravans next to every option."""
+        for field_name, group in self.FACET_GROUPS.items():
+            field = self.fields[field_name]
+            field.choices = [field.choices[0]] + [
+                (option['value'], f"{option['label']} ({option['count']})") for option in facets[group]
+            ]
+        for option in facets['amenities']:
+            if option['value'] in self.fields:
+                field = self.fields[option['value']]
+                field.label = f"{field.label} ({option['count']})"
+
 
 class CaravanBookingForm(forms.ModelForm):
     class Meta:
@@ -156,6 +211,10 @@ class CaravanBookingForm(forms.ModelForm):
             }),
         }
     
+    def __init__(self, *args, caravan=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.caravan = caravan
+    
     def clean(self):
         cleaned_data = super().clean()
         pickup_date = cleaned_data.get('pickup_date')
@@ -168,9 +227,57 @@ class CaravanBookingForm(forms.ModelForm):
             from datetime import date
             if pickup_date < date.today():
                 raise forms.ValidationError("Pickup date cannot be in the past")
+            
+            if self.caravan is not None and not is_available(
+                self.caravan.pk, pickup_date, return_date, exclude=self.instance.pk
+            ):
+                raise forms.ValidationError("This caravan is already booked for some of those dates")
         
         return cleaned_data
 
+class ExportFilterForm(forms.Form):
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('jsonl', 'JSON Lines'),
+    ]
+
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False)
+    gzip = forms.BooleanField(required=False)
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    status = forms.CharField(required=False)
+    caravan = forms.SlugField(required=False)
+    course = forms.SlugField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get('start')
+        end = cleaned_data.get('end')
+        if start and end and start > end:
+            raise forms.ValidationError("Start date must be on or before end date")
+        return cleaned_data
+
+class ReportPeriodForm(forms.Form):
+    # Five years, leap days included; reports hold a row per day of the period
+    MAX_DAYS = 5 * 365 + 2
+
+    start = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start = cleaned_data.get('start')
+        end = cleaned_data.get('end')
+        if start and end and start > end:
+            raise forms.ValidationError("Start date must be on or before end date")
+        if start and end and (end - start).days >= self.MAX_DAYS:
+            raise forms.ValidationError("The period can be at most five years long")
+        return cleaned_data
+
+class CatalogImportForm(forms.Form):
+    catalog = forms.FileField(help_text='CSV or JSONL catalog; image columns are paths under MEDIA_ROOT')
+    upsert = forms.BooleanField(required=False, help_text='Update destinations whose slug already exists')
+
 class AgencyRegistrationForm(forms.ModelForm):
     class Meta:
         model = Agency
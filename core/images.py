@@ -0,0 +1,117 @@
+"""Stored image dimensions and blur placeholders for lazy ``<img>`` markup.
+
+Models with image fields carry an ``image_meta`` JSON column mapping each
+image field to ``{"name", "width", "height", "placeholder"}``, where the
+placeholder is a tiny JPEG data URI. It is computed once, after the upload
+is saved, so rendering never has to open the image file; ``lazy_img``
+turns it into an ``<img loading="lazy">`` with intrinsic width/height and
+the placeholder painted behind it until the real image arrives.
+"""
+import base64
+import io
+import logging
+
+from django.db import models
+from django.utils.html import format_html, format_html_join
+from PIL import ExifTags, Image, ImageFilter, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+META_FIELD = 'image_meta'
+PLACEHOLDER_SIZE = 16
+# EXIF orientations that rotate the picture by 90 degrees
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def image_fields(model):
+    return [field for field in model._meta.concrete_fields if isinstance(field, models.ImageField)]
+
+
+def has_image_meta(model):
+    return any(field.name == META_FIELD for field in model._meta.concrete_fields)
+
+
+def image_info(field_file):
+    """Return ``{name, width, height, placeholder}`` for a stored image, or None."""
+    if not field_file.storage.exists(field_file.name):
+        return None
+    try:
+        with field_file.open('rb') as fh, Image.open(fh) as img:
+            width, height = img.size
+            if img.getexif().get(ExifTags.Base.Orientation) in TRANSPOSED_ORIENTATIONS:
+                width, height = height, width
+            # Lets the JPEG decoder downscale while decoding instead of afterwards
+            img.draft('RGB', (PLACEHOLDER_SIZE * 8, PLACEHOLDER_SIZE * 8))
+            thumb = ImageOps.exif_transpose(img).convert('RGB')
+            thumb.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+            buffer = io.BytesIO()
+            thumb.filter(ImageFilter.GaussianBlur(1)).save(buffer, 'JPEG', quality=40, optimize=True)
+    except (OSError, UnidentifiedImageError, ValueError):
+        logger.warning('Could not read image %s', field_file.name)
+        return None
+    return {
+        'name': field_file.name,
+        'width': width,
+        'height': height,
+        'placeholder': 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii'),
+    }
+
+
+def stale_fields(instance):
+    """Image fields whose stored meta does not describe the current file."""
+    meta = getattr(instance, META_FIELD) or {}
+    stale = []
+    for field in image_fields(type(instance)):
+        name = getattr(instance, field.attname).name or ''
+        if (meta.get(field.name) or {}).get('name', '') != name:
+            stale.append(field)
+    return stale
+
+
+def refresh_image_meta(instance, force=False):
+    """Recompute meta for changed image fields and save just that column.
+
+    Returns True if the row was updated.
+    """
+    fields = image_fields(type(instance)) if force else stale_fields(instance)
+    if not fields:
+        return False
+    meta = dict(getattr(instance, META_FIELD) or {})
+    for field in fields:
+        field_file = getattr(instance, field.attname)
+        info = image_info(field_file) if field_file else None
+        # Unreadable files are remembered by name so they are not retried on every save
+        meta[field.name] = info or {'name': field_file.name or ''}
+    setattr(instance, META_FIELD, meta)
+    type(instance)._base_manager.filter(pk=instance.pk).update(**{META_FIELD: meta})
+    return True
+
+
+def lazy_img(obj, field_name, alt='', fallback='', **attrs):
+    """``<img>`` markup for ``obj.<field_name>`` with size, placeholder and lazy loading.
+
+    ``fallback`` is used as the ``src`` when the field is empty; extra keyword
+    arguments become attributes (``css_class`` is written as ``class``).
+    """
+    field_file = getattr(obj, field_name, None)
+    if field_file:
+        src = field_file.url
+    elif fallback:
+        src = fallback
+    else:
+        return ''
+    info = (getattr(obj, META_FIELD, None) or {}).get(field_name) or {}
+    if field_file and info.get('name') != field_file.name:
+        info = {}
+
+    attributes = {'src': src, 'alt': alt, 'loading': 'lazy', 'decoding': 'async'}
+    if info.get('width'):
+        attributes['width'] = info['width']
+        attributes['height'] = info['height']
+    if 'css_class' in attrs:
+        attrs['class'] = attrs.pop('css_class')
+    attributes.update(attrs)
+    if info.get('placeholder'):
+        style = f"background-size:cover;background-image:url({info['placeholder']})"
+        attributes['style'] = f"{attributes['style']};{style}" if attributes.get('style') else style
+    return format_html('<img{}>', format_html_join('', ' {}="{}"', attributes.items()))
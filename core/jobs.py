@@ -0,0 +1,360 @@
+"""Durable background jobs stored in the project database.
+
+Functions decorated with ``@job('name')`` (kept in each app's ``tasks``
+module, imported at startup) can be queued with ``enqueue``; the row is
+written in the caller's transaction, so a job is only ever seen by the
+workers if the request that queued it committed. ``manage.py runworker``
+polls for due jobs and runs them in a thread or process pool.
+
+Workers claim a job with a conditional ``UPDATE ... WHERE status =
+'queued'``, which works on every backend (SQLite has no ``SKIP LOCKED``):
+whichever worker's update matches the row owns the job. A failing job is
+retried with exponential backoff until ``max_attempts``; each attempt,
+successful or not, is recorded as a ``JobResult``. While a job runs, its
+worker refreshes the job's ``locked_at`` every ``HEARTBEAT_INTERVAL``
+seconds; a job not refreshed for ``JOB_LOCK_TIMEOUT`` seconds is assumed
+lost with its worker and is queued again. ``PERIODIC_JOBS`` maps job names to an interval in seconds;
+workers keep exactly one queued run of each.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, IntegrityError, close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job, JobResult
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+# Seconds between the worker's housekeeping passes (periodic jobs, lost jobs)
+MAINTENANCE_INTERVAL = 30
+# Seconds between refreshes of the running jobs' locks; well under JOB_LOCK_TIMEOUT
+HEARTBEAT_INTERVAL = 60
+
+_registry = {}
+
+
+class UnknownJob(Exception):
+    pass
+
+
+def job(name, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Register the decorated function as the job ``name``.
+
+    Arguments and return values must be JSON-serializable.
+    """
+    def decorator(func):
+        if name in _registry and _registry[name] is not func:
+            raise ValueError(f'Job {name!r} is already registered')
+        func.job_name = name
+        func.max_attempts = max_attempts
+        _registry[name] = func
+        return func
+
+    return decorator
+
+
+def get_job(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise UnknownJob(name) from None
+
+
+def enqueue(name, args=(), kwargs=None, *, run_at=None, delay=None, priority=0, dedupe_key='',
+            max_attempts=None):
+    """Queue ``name`` (a registered name or ``@job`` function) and return its ``Job``.
+
+    If a job with the same ``dedupe_key`` is already queued, that job is
+    returned instead (moved earlier if this one was due sooner). ``delay``
+    is in seconds.
+    """
+    if callable(name):
+        name = name.job_name
+    func = get_job(name)
+    if run_at is None:
+        run_at = timezone.now() + timedelta(seconds=delay or 0)
+    if dedupe_key:
+        existing = Job.objects.filter(status=Job.QUEUED, dedupe_key=dedupe_key).first()
+        if existing is not None:
+            return _sooner(existing, run_at)
+    new = Job(
+        name=name,
+        args=list(args),
+        kwargs=kwargs or {},
+        run_at=run_at,
+        priority=priority,
+        dedupe_key=dedupe_key,
+        max_attempts=max_attempts or func.max_attempts,
+    )
+    try:
+        with transaction.atomic():
+            new.save()
+    except IntegrityError:
+        if not dedupe_key:
+            raise
+        # Another request queued the same key between our check and insert
+        return _sooner(Job.objects.get(status=Job.QUEUED, dedupe_key=dedupe_key), run_at)
+    return new
+
+
+def _sooner(existing, run_at):
+    if run_at < existing.run_at:
+        Job.objects.filter(pk=existing.pk, status=Job.QUEUED).update(run_at=run_at)
+        existing.run_at = run_at
+    return existing
+
+
+def retry_delay(attempt):
+    """Seconds to wait before retrying after failed attempt number ``attempt``."""
+    base = getattr(settings, 'JOB_RETRY_BACKOFF', 10)
+    cap = getattr(settings, 'JOB_RETRY_BACKOFF_MAX', 3600)
+    # Jitter keeps jobs that failed together (e.g. on an outage) from retrying together
+    return min(base * 2 ** (attempt - 1), cap) * random.uniform(0.75, 1.25)
+
+
+def claim(worker, limit):
+    """Mark up to ``limit`` due jobs as running by ``worker``; returns their ids."""
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('-priority', 'run_at', 'pk')
+    claimed = []
+    # Over-fetch a little: other workers may win some of the candidates
+    for pk in due.values_list('pk', flat=True)[:limit * 2]:
+        won = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+        )
+        if won:
+            claimed.append(pk)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def _json_value(value):
+    try:
+        return json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+    except (TypeError, ValueError):
+        return repr(value)
+
+
+def execute(pk, worker):
+    """Run the claimed job ``pk`` and record the attempt; returns True on success."""
+    job = Job.objects.get(pk=pk)
+    started_at = timezone.now()
+    started = time.perf_counter()
+    value, error, retry = None, '', True
+    try:
+        value = _json_value(get_job(job.name)(*job.args, **job.kwargs))
+    except UnknownJob:
+        # Retrying cannot help until the code is deployed
+        error, retry = f'No job is registered as {job.name!r}', False
+        logger.error('Job #%s: %s', pk, error)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Job %s #%s attempt %s failed', job.name, pk, job.attempts, exc_info=True)
+    duration = time.perf_counter() - started
+    JobResult.objects.create(
+        job=job, attempt=job.attempts, succeeded=not error, value=value, error=error,
+        worker=worker, started_at=started_at, duration=duration,
+    )
+    _finish(job, worker, error, retry)
+    return not error
+
+
+def _execute_in_pool(pk, worker):
+    # Pool threads and processes outlive jobs, like request threads outlive requests
+    close_old_connections()
+    try:
+        return execute(pk, worker)
+    finally:
+        close_old_connections()
+
+
+def _finish(job, worker, error, retry=True):
+    now = timezone.now()
+    owned = Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=worker)
+    if not error:
+        updated = owned.update(status=Job.DONE, finished_at=now, locked_by='', locked_at=None)
+    elif retry and job.attempts < job.max_attempts:
+        try:
+            with transaction.atomic():
+                updated = owned.update(
+                    status=Job.QUEUED, run_at=now + timedelta(seconds=retry_delay(job.attempts)),
+                    locked_by='', locked_at=None,
+                )
+        except IntegrityError:
+            # The same work was queued again meanwhile; that run replaces the retry
+            updated = owned.update(status=Job.FAILED, finished_at=now, locked_by='', locked_at=None)
+    else:
+        updated = owned.update(status=Job.FAILED, finished_at=now, locked_by='', locked_at=None)
+    if not updated:
+        logger.warning(
+            'Job %s #%s attempt %s ended on worker %s, which no longer held it; its status was left as is',
+            job.name, job.pk, job.attempts, worker,
+        )
+    interval = periodic_jobs().get(job.name)
+    if interval and job.dedupe_key == periodic_key(job.name):
+        enqueue(job.name, run_at=now + timedelta(seconds=interval), dedupe_key=job.dedupe_key)
+
+
+def periodic_jobs():
+    return getattr(settings, 'PERIODIC_JOBS', {})
+
+
+def periodic_key(name):
+    return f'periodic:{name}'
+
+
+def schedule_periodic():
+    """Queue a run of every periodic job that has none queued or running."""
+    for name in periodic_jobs():
+        key = periodic_key(name)
+        if not Job.objects.filter(dedupe_key=key, status__in=[Job.QUEUED, Job.RUNNING]).exists():
+            enqueue(name, dedupe_key=key)
+
+
+def heartbeat(worker, pks):
+    """Refresh the locks ``worker`` holds on the running jobs ``pks``."""
+    if not pks:
+        return 0
+    return Job.objects.filter(pk__in=pks, status=Job.RUNNING, locked_by=worker).update(locked_at=timezone.now())
+
+
+def requeue_lost():
+    """Queue again the jobs whose lock has not been refreshed for ``JOB_LOCK_TIMEOUT``."""
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'JOB_LOCK_TIMEOUT', 15 * 60))
+    requeued = 0
+    for lost in Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff):
+        logger.warning('Job %s #%s was lost by worker %s', lost.name, lost.pk, lost.locked_by)
+        stale = Job.objects.filter(pk=lost.pk, status=Job.RUNNING, locked_by=lost.locked_by)
+        failed = {'status': Job.FAILED, 'finished_at': timezone.now(), 'locked_by': '', 'locked_at': None}
+        if lost.attempts >= lost.max_attempts:
+            stale.update(**failed)
+            continue
+        try:
+            with transaction.atomic():
+                requeued += stale.update(status=Job.QUEUED, locked_by='', locked_at=None)
+        except IntegrityError:
+            # The same work is queued already
+            stale.update(**failed)
+    return requeued
+
+
+def prune(days=None):
+    """Delete done and failed jobs (and their results) older than ``JOB_RESULT_TTL_DAYS``."""
+    days = getattr(settings, 'JOB_RESULT_TTL_DAYS', 14) if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    finished = Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=cutoff)
+    deleted, _ = finished.delete()
+    return deleted
+
+
+def run_pending(worker='inline'):
+    """Run every due job in this thread until none is left; returns how many ran."""
+    ran = 0
+    while True:
+        claimed = claim(worker, 1)
+        if not claimed:
+            return ran
+        execute(claimed[0], worker)
+        ran += 1
+
+
+class Worker:
+    """Polls for due jobs and runs up to ``concurrency`` of them at a time.
+
+    With ``burst`` the worker exits once no job is due, and periodic jobs
+    are not scheduled.
+    """
+
+    def __init__(self, concurrency=4, pool='thread', burst=False, name=None, poll_interval=None):
+        self.concurrency = concurrency
+        self.pool = pool
+        self.burst = burst
+        self.name = (name or f'{socket.gethostname()}:{os.getpid()}')[:100]
+        self.poll_interval = poll_interval or getattr(settings, 'JOB_POLL_INTERVAL', 1)
+        self.stopping = threading.Event()
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def _executor(self):
+        if self.pool == 'process':
+            # Spawned children set Django up themselves instead of sharing
+            # the parent's database connections
+            connections.close_all()
+            return ProcessPoolExecutor(
+                self.concurrency, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup,
+            )
+        return ThreadPoolExecutor(self.concurrency, thread_name_prefix='job')
+
+    def run(self):
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+        ran = 0
+        # future -> id of the job it runs
+        running = {}
+        last_maintenance = last_heartbeat = None
+        with self._executor() as executor:
+            while not self.stopping.is_set():
+                done = [future for future in running if future.done()]
+                for future in done:
+                    if future.exception() is not None:
+                        logger.error('Worker could not run a job', exc_info=future.exception())
+                    del running[future]
+                ran += len(done)
+
+                try:
+                    if last_heartbeat is None or time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                        heartbeat(self.name, list(running.values()))
+                        last_heartbeat = time.monotonic()
+                    if last_maintenance is None or time.monotonic() - last_maintenance >= MAINTENANCE_INTERVAL:
+                        requeue_lost()
+                        if not self.burst:
+                            schedule_periodic()
+                        last_maintenance = time.monotonic()
+                    claimed = claim(self.name, self.concurrency - len(running))
+                except DatabaseError:
+                    logger.exception('Worker could not poll for jobs')
+                    # Reconnect on the next poll
+                    connections.close_all()
+                    claimed = []
+                for pk in claimed:
+                    running[executor.submit(_execute_in_pool, pk, self.name)] = pk
+                if claimed:
+                    continue
+                if self.burst and not running:
+                    break
+                if running:
+                    wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                else:
+                    self.stopping.wait(self.poll_interval)
+            # Wait for the jobs in flight, keeping their locks fresh
+            while running:
+                try:
+                    heartbeat(self.name, list(running.values()))
+                except DatabaseError:
+                    logger.exception('Worker could not refresh its job locks')
+                finished, _ = wait(running, timeout=HEARTBEAT_INTERVAL)
+                for future in finished:
+                    del running[future]
+                ran += len(finished)
+        return ran
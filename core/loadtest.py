@@ -0,0 +1,507 @@
+"""Replay of recorded or generated traffic for load tests.
+
+A workload is a list of requests, read from JSON lines such as::
+
+    {"method": "GET", "path": "/caravans/", "query": "caravan_type=family", "user": null}
+
+``user`` is a username (the request is sent with a fresh session cookie
+of that user) or null/"anonymous"; POST entries may carry form ``data``.
+``generate_workload`` builds a default one from the named routes in
+``core.urls``, with arguments drawn from the database.
+
+Requests are sent by ``concurrency`` threads, either to the project's
+WSGI application in this process (``InProcessTarget``) or to a running
+server (``HttpTarget``), optionally paced to a fixed rate. ``replay``
+returns latency percentiles, status counts and errors per URL name.
+
+In process, every database statement that takes or waits for a write
+lock (writes and ``SELECT ... FOR UPDATE``) is timed: those slower than
+``LOCK_WAIT_THRESHOLD`` seconds count as lock waits, and "database is
+locked" failures as lock errors. A remote server's database cannot be
+observed, so ``HttpTarget`` reports no lock figures.
+"""
+import io
+import json
+import math
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+from importlib import import_module
+from urllib.error import HTTPError, URLError
+from urllib.parse import unquote_to_bytes, urlencode
+from urllib.request import HTTPRedirectHandler, Request, build_opener
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.wsgi import get_wsgi_application
+from django.db import OperationalError, connections
+from django.template.loader import render_to_string
+from django.urls import NoReverseMatch, Resolver404, resolve, reverse
+from django.utils import timezone
+
+from .metrics import LATENCY_BUCKETS
+
+DEFAULT_CONCURRENCY = 8
+PERCENTILES = (50, 90, 95, 99)
+# Locking statements slower than this (seconds) are counted as lock waits
+LOCK_WAIT_THRESHOLD = 0.05
+LOCKING_SQL = re.compile(r'^\s*(INSERT|UPDATE|DELETE|REPLACE)\b|\bFOR\s+UPDATE\b', re.IGNORECASE)
+USER_AGENT = 'replay_traffic'
+
+# Share of the default workload per core URL name; other named routes get
+# DEFAULT_WEIGHT. session_fragment follows most page views (js/session.js).
+ROUTE_WEIGHTS = {
+    'home': 20,
+    'destination_list': 12,
+    'destination_detail': 18,
+    'search_destinations': 8,
+    'destinations_by_category': 4,
+    'destinations_by_type': 4,
+    'caravan_list': 8,
+    'caravan_detail': 8,
+    'caravan_availability': 3,
+    'fleet_availability': 1,
+    'courses': 3,
+    'course_detail': 3,
+    'about': 2,
+    'contact': 2,
+    'session_fragment': 25,
+}
+DEFAULT_WEIGHT = 1
+# Aliases of other routes, staff-only and internal endpoints
+SKIPPED_ROUTES = {'index', 'destination', 'export_data', 'metrics', 'sitemap_shard'}
+# Share of generated requests sent as a signed-in visitor
+AUTHENTICATED_SHARE = 0.1
+
+
+def read_log(lines):
+    """Parse JSON lines into workload entries; raises ValueError on a malformed line."""
+    entries = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            path, _, inline_query = record['path'].partition('?')
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise ValueError(f'Line {number} is not a JSON object with a "path"') from None
+        query = record.get('query') or inline_query
+        if isinstance(query, dict):
+            query = urlencode(query, doseq=True)
+        user = record.get('user') or None
+        entries.append({
+            'method': (record.get('method') or 'GET').upper(),
+            'path': path,
+            'query': query.lstrip('?'),
+            'user': None if user == 'anonymous' else user,
+            'data': record.get('data') or None,
+        })
+    return entries
+
+
+def write_log(entries, stream):
+    for entry in entries:
+        record = {key: value for key, value in entry.items() if value is not None or key == 'user'}
+        stream.write(json.dumps(record) + '\n')
+
+
+def _popular(queryset, field):
+    """Values of ``field``, most popular first, with Zipf-like weights."""
+    values = list(queryset.order_by('-popularity', 'pk').values_list(field, flat=True))
+    return values, [1 / (rank + 1) for rank in range(len(values))]
+
+
+def _route_samplers(rng):
+    """Route name -> callable returning ``(kwargs, query)`` for one request, or None if it has no data."""
+    from .models import Caravan, Category, Course, Destination
+
+    today = timezone.localdate()
+    destinations = _popular(Destination.objects.filter(is_active=True), 'slug')
+    names = list(Destination.objects.filter(is_active=True).values_list('name', flat=True)[:200])
+    caravans = _popular(Caravan.objects.filter(is_active=True), 'slug')
+    courses = _popular(Course.objects.filter(is_active=True), 'slug')
+    categories = list(Category.objects.values_list('slug', flat=True))
+    destination_types = [key for key, _ in Destination.DESTINATION_TYPES]
+    caravan_types = [key for key, _ in Caravan.CARAVAN_TYPES]
+
+    def pick(values_weights):
+        values, weights = values_weights
+        return rng.choices(values, weights)[0] if values else None
+
+    def listing(filters):
+        # Mostly the first page, some filtered, a few deeper pages
+        roll = rng.random()
+        if roll < 0.6:
+            return {}, ''
+        if roll < 0.9:
+            return {}, urlencode(filters())
+        return {}, urlencode({'page': rng.randint(2, 4)})
+
+    def with_slug(values_weights, query=''):
+        slug = pick(values_weights)
+        return None if slug is None else ({'slug': slug}, query)
+
+    def search():
+        if not names:
+            return {}, urlencode({'q': rng.choice(destination_types)})
+        word = rng.choice(rng.choice(names).split())
+        if len(word) > 4 and rng.random() < 0.3:
+            # A dropped letter, as typed in a hurry
+            cut = rng.randrange(1, len(word) - 1)
+            word = word[:cut] + word[cut + 1:]
+        return {}, urlencode({'q': word.lower()})
+
+    def month():
+        return urlencode({'month': (today + timedelta(days=31 * rng.randint(0, 3))).strftime('%Y-%m')})
+
+    samplers = {
+        'destination_list': lambda: listing(lambda: {'destination_type': rng.choice(destination_types)}),
+        'destination_detail': lambda: with_slug(destinations),
+        'search_destinations': search,
+        'destinations_by_category': lambda: (
+            ({'category_slug': rng.choice(categories)}, '') if categories else None
+        ),
+        'destinations_by_type': lambda: ({'destination_type': rng.choice(destination_types)}, ''),
+        'caravan_list': lambda: listing(lambda: {'caravan_type': rng.choice(caravan_types)}),
+        'caravan_detail': lambda: with_slug(caravans),
+        'caravan_availability': lambda: with_slug(caravans, month()),
+        'fleet_availability': lambda: ({}, month()),
+        'course_detail': lambda: with_slug(courses),
+    }
+    # Give up on routes whose data is missing (no caravans yet, say)
+    return {name: sampler for name, sampler in samplers.items() if sampler() is not None}
+
+
+def generate_workload(count, seed=None, authenticated_share=AUTHENTICATED_SHARE):
+    """``count`` GET requests over the named routes of ``core.urls``, weighted by ``ROUTE_WEIGHTS``."""
+    from . import urls
+
+    rng = random.Random(seed)
+    samplers = _route_samplers(rng)
+    routes, weights = [], []
+    for pattern in urls.urlpatterns:
+        name = getattr(pattern, 'name', None)
+        if not name or name in SKIPPED_ROUTES or name in routes:
+            continue
+        if pattern.pattern.converters and name not in samplers:
+            continue
+        routes.append(name)
+        weights.append(ROUTE_WEIGHTS.get(name, DEFAULT_WEIGHT))
+
+    visitors = get_user_model().objects.filter(is_active=True, is_staff=False).order_by('pk')
+    users = list(visitors.values_list('username', flat=True)[:50])
+    entries = []
+    while len(entries) < count:
+        name = rng.choices(routes, weights)[0]
+        kwargs, query = samplers[name]() if name in samplers else ({}, '')
+        try:
+            path = reverse(name, kwargs=kwargs)
+        except NoReverseMatch:
+            continue
+        user = rng.choice(users) if users and rng.random() < authenticated_share else None
+        entries.append({'method': 'GET', 'path': path, 'query': query, 'user': user, 'data': None})
+    return entries
+
+
+class SessionCookies:
+    """One signed-in session per replayed username, created on first use."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cookies = {}
+
+    def get(self, username):
+        if username is None:
+            return ''
+        with self._lock:
+            if username not in self._cookies:
+                self._cookies[username] = self._login(username)
+            return self._cookies[username]
+
+    def _login(self, username):
+        User = get_user_model()
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            raise LookupError(f'No user named {username!r}') from None
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+
+def _result(entry, status, started, size=0, error='', locks=None):
+    return {
+        'method': entry['method'],
+        'path': entry['path'],
+        'status': status,
+        'seconds': time.perf_counter() - started,
+        'bytes': size,
+        'error': error,
+        'locks': locks,
+    }
+
+
+class InProcessTarget:
+    """Calls the project's WSGI application from the replay threads."""
+    name = 'in-process'
+
+    def __init__(self, host=None):
+        self.application = get_wsgi_application()
+        self.host = host or default_host()
+        self.cookies = SessionCookies()
+
+    def send(self, entry):
+        body = urlencode(entry['data'], doseq=True).encode() if entry['data'] else b''
+        environ = {
+            'REQUEST_METHOD': entry['method'],
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote_to_bytes(entry['path']).decode('iso-8859-1'),
+            'QUERY_STRING': entry['query'],
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'HTTP_HOST': self.host,
+            'HTTP_USER_AGENT': USER_AGENT,
+            'HTTP_COOKIE': self.cookies.get(entry['user']),
+            'CONTENT_LENGTH': str(len(body)),
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded' if body else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        locks = {'waits': 0, 'wait_seconds': 0.0, 'errors': 0}
+
+        def watch_locks(execute, sql, params, many, context):
+            if not LOCKING_SQL.search(sql):
+                return execute(sql, params, many, context)
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            except OperationalError as exc:
+                if 'locked' in str(exc):
+                    locks['errors'] += 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                if elapsed >= LOCK_WAIT_THRESHOLD:
+                    locks['waits'] += 1
+                    locks['wait_seconds'] += elapsed
+
+        status = []
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(watch_locks))
+                response = self.application(environ, lambda line, headers, exc_info=None: status.append(line))
+                try:
+                    size = sum(len(chunk) for chunk in response)
+                finally:
+                    response.close()
+        except Exception as exc:
+            return _result(entry, 0, started, error=repr(exc), locks=locks)
+        return _result(entry, int(status[0].split()[0]), started, size, locks=locks)
+
+    def close_thread(self):
+        connections.close_all()
+
+
+class _NoRedirects(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        # Replayed as recorded: the redirect is the response
+        return None
+
+
+class HttpTarget:
+    """Sends the requests to a running server (which must share this project's session store)."""
+    name = 'http'
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = SessionCookies()
+        self.opener = build_opener(_NoRedirects)
+
+    def send(self, entry):
+        url = self.base_url + entry['path'] + (f"?{entry['query']}" if entry['query'] else '')
+        body = urlencode(entry['data'], doseq=True).encode() if entry['data'] else None
+        headers = {'User-Agent': USER_AGENT}
+        cookie = self.cookies.get(entry['user'])
+        if cookie:
+            headers['Cookie'] = cookie
+        started = time.perf_counter()
+        try:
+            with self.opener.open(Request(url, data=body, headers=headers, method=entry['method']),
+                                  timeout=self.timeout) as response:
+                return _result(entry, response.status, started, len(response.read()))
+        except HTTPError as exc:
+            return _result(entry, exc.code, started, len(exc.read()))
+        except (URLError, OSError) as exc:
+            return _result(entry, 0, started, error=str(exc))
+
+    def close_thread(self):
+        pass
+
+
+def default_host():
+    """A host name the project accepts: the first plain entry of ``ALLOWED_HOSTS``, else localhost."""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+def replay(entries, target, concurrency=DEFAULT_CONCURRENCY, rate=None, duration=None):
+    """Send ``entries`` to ``target`` and return the report (see ``summarize``).
+
+    With ``rate`` (requests per second) request ``i`` is sent no earlier
+    than ``i / rate`` seconds after the start; ``duration`` (seconds)
+    cycles through the entries until it has passed instead of stopping
+    after the last one.
+    """
+    if not entries:
+        raise ValueError('The workload is empty')
+    results = []
+    lock = threading.Lock()
+    sequence = iter(range(sys.maxsize))
+    behind = [0.0]
+    failures = []
+    started = time.perf_counter()
+
+    def run():
+        try:
+            while True:
+                with lock:
+                    index = next(sequence)
+                if duration is None and index >= len(entries):
+                    return
+                if rate:
+                    delay = started + index / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        with lock:
+                            behind[0] = max(behind[0], -delay)
+                if duration is not None and time.perf_counter() - started >= duration:
+                    return
+                result = target.send(entries[index % len(entries)])
+                with lock:
+                    results.append(result)
+        except Exception as exc:
+            # Setup errors such as an unknown user stop the replay
+            failures.append(exc)
+        finally:
+            target.close_thread()
+
+    threads = [threading.Thread(target=run, name=f'replay-{n}', daemon=True) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise failures[0]
+    return summarize(results, time.perf_counter() - started, target=target.name, concurrency=concurrency,
+                     rate=rate, behind=behind[0])
+
+
+def _percentile(ordered, percent):
+    # Nearest rank
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def _latency(seconds):
+    ordered = sorted(seconds)
+    histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+    for value in ordered:
+        histogram[next((i for i, bound in enumerate(LATENCY_BUCKETS) if value <= bound), len(LATENCY_BUCKETS))] += 1
+    return {
+        'mean': statistics.fmean(ordered),
+        **{f'p{percent}': _percentile(ordered, percent) for percent in PERCENTILES},
+        'max': ordered[-1],
+        'histogram': histogram,
+    }
+
+
+_routes = {}
+
+
+def route_name(path):
+    """The URL name ``path`` resolves to (namespaced), or "unresolved"."""
+    if path not in _routes:
+        try:
+            _routes[path] = resolve(path).view_name or 'unresolved'
+        except Resolver404:
+            _routes[path] = 'unresolved'
+    return _routes[path]
+
+
+def summarize(results, elapsed, **run):
+    """Overall and per-URL-name latency (seconds), statuses, errors and lock figures."""
+    groups = {}
+    for result in results:
+        groups.setdefault(route_name(result['path']), []).append(result)
+
+    def stats(group):
+        statuses = {}
+        for result in group:
+            statuses[str(result['status'])] = statuses.get(str(result['status']), 0) + 1
+        errors = [result for result in group if result['error'] or result['status'] >= 500]
+        locked = [result['locks'] for result in group if result['locks'] is not None]
+        return {
+            'requests': len(group),
+            'errors': len(errors),
+            'error_samples': sorted({result['error'] or f"{result['status']} {result['path']}" for result in errors})[:5],
+            'statuses': dict(sorted(statuses.items())),
+            'bytes': sum(result['bytes'] for result in group),
+            'latency': _latency([result['seconds'] for result in group]),
+            'lock_waits': sum(locks['waits'] for locks in locked) if locked else None,
+            'lock_wait_seconds': sum(locks['wait_seconds'] for locks in locked) if locked else None,
+            'lock_errors': sum(locks['errors'] for locks in locked) if locked else None,
+        }
+
+    return {
+        'run': {
+            **run,
+            'requests': len(results),
+            'seconds': elapsed,
+            'throughput': len(results) / elapsed if elapsed else 0.0,
+            'latency_buckets': list(LATENCY_BUCKETS),
+            'lock_wait_threshold': LOCK_WAIT_THRESHOLD,
+        },
+        'overall': stats(results) if results else None,
+        'routes': {name: stats(group) for name, group in sorted(groups.items(), key=lambda item: -len(item[1]))},
+    }
+
+
+def render_html(report):
+    """The report as a standalone HTML page, latencies in milliseconds."""
+    def rows(stats):
+        latency = stats['latency']
+        top = max(latency['histogram']) or 1
+        return {
+            **stats,
+            'ms': {key: value * 1000 for key, value in latency.items() if key != 'histogram'},
+            'histogram': [(count, count * 100 // top) for count in latency['histogram']],
+        }
+
+    buckets = [f'≤{bound * 1000:g} ms' for bound in report['run']['latency_buckets']] + ['slower']
+    return render_to_string('loadtest/report.html', {
+        'run': report['run'],
+        'overall': rows(report['overall']) if report['overall'] else None,
+        'routes': [(name, rows(stats)) for name, stats in report['routes'].items()],
+        'buckets': buckets,
+        'percentiles': [f'p{percent}' for percent in PERCENTILES],
+    })
@@ -0,0 +1,22 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from core.images import has_image_meta, refresh_image_meta
+
+
+class Command(BaseCommand):
+    help = 'Fill image sizes and blur placeholders for rows saved before they existed (or imported in bulk)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Recompute rows whose meta is already current')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        for model in apps.get_models():
+            if not has_image_meta(model):
+                continue
+            updated = 0
+            for instance in model._base_manager.order_by('pk').iterator(chunk_size=options['batch_size']):
+                updated += refresh_image_meta(instance, force=options['force'])
+            self.stdout.write(f'{model._meta.label}: {updated} rows updated')
+        self.stdout.write(self.style.SUCCESS('Image meta backfilled.'))
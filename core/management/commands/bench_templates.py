@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.template_bench import compare
+
+
+class Command(BaseCommand):
+    help = 'Compare Django and Jinja2 render times for the hot pages on contexts captured from the live views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='*', default=['/', '/caravans/', '/hotel/'],
+                            help='Pages to render; add a /caravans/<slug>/ page for the detail template')
+        parser.add_argument('--number', type=int, default=200, help='Renders per engine')
+
+    def handle(self, *args, **options):
+        try:
+            import jinja2  # noqa: F401
+        except ImportError:
+            raise CommandError('bench_templates needs the jinja2 package')
+
+        for url in options['urls']:
+            template_name, results = compare(url, number=options['number'])
+            django_ms, jinja_ms = results['django']['median'], results['jinja2']['median']
+            self.stdout.write(f'{url} ({template_name})')
+            for name, stats in results.items():
+                self.stdout.write(f"  {name:<7} median {stats['median']:.2f} ms  p95 {stats['p95']:.2f} ms  "
+                                  f"mean {stats['mean']:.2f} ms")
+            self.stdout.write(self.style.SUCCESS(f'  jinja2 speedup: {django_ms / jinja_ms:.1f}x'))
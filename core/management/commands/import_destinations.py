@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.catalog import CatalogError, import_file
+
+
+class Command(BaseCommand):
+    help = 'Bulk import destinations (with tags, gallery images and POIs) from a CSV or JSONL catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Catalog file (.csv or .jsonl)')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--upsert', action='store_true',
+                            help='Update destinations whose slug already exists instead of adding new ones')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        started = time.monotonic()
+
+        def progress(stats):
+            done = stats['created'] + stats['updated']
+            rate = done / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f"{done} rows ({stats['created']} created, {stats['updated']} updated, {rate:.0f}/s)")
+
+        try:
+            with open(path, encoding='utf-8', newline='') as fh:
+                stats = import_file(fh, fmt, upsert=options['upsert'], batch_size=options['batch_size'],
+                                    progress=progress)
+        except (OSError, CatalogError) as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported catalog: {stats['created']} created, {stats['updated']} updated "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.prerender import build
+
+
+class Command(BaseCommand):
+    help = 'Render destination, course, caravan and category pages to static HTML, skipping unchanged pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(settings.PRERENDER_ROOT), help='Defaults to PRERENDER_ROOT')
+        parser.add_argument('--workers', type=int, default=1, help='Render in this many processes')
+        parser.add_argument('--full', action='store_true', help='Ignore the manifest and re-render every page')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def progress(done, total):
+            if done % 500 == 0 or done == total:
+                self.stdout.write(f'{done}/{total} pages rendered')
+
+        rendered, skipped, removed = build(options['output'], workers=options['workers'], full=options['full'],
+                                           progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Pre-rendered {rendered} pages ({skipped} unchanged, {removed} removed) '
+            f'in {time.monotonic() - started:.1f}s'
+        ))
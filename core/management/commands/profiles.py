@@ -0,0 +1,62 @@
+import io
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.profiling import diff, list_profiles, load_stats
+
+
+class Command(BaseCommand):
+    help = 'List, aggregate and diff the request profiles written by ProfilingMiddleware'
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest='action', required=True)
+
+        listing = subparsers.add_parser('list', help='Saved profiles, or per-URL averages with --by-url')
+        listing.add_argument('--url-name')
+        listing.add_argument('--by-url', action='store_true')
+
+        aggregate = subparsers.add_parser('aggregate', help='Merged cProfile stats for a URL name or profile id')
+        aggregate.add_argument('selector')
+        aggregate.add_argument('--sort', default='cumulative')
+        aggregate.add_argument('--limit', type=int, default=30)
+
+        compare = subparsers.add_parser('diff', help='Per-function time change between two URL names or ids')
+        compare.add_argument('before')
+        compare.add_argument('after')
+        compare.add_argument('--limit', type=int, default=30)
+
+    def handle(self, *args, **options):
+        try:
+            getattr(self, f"handle_{options['action']}")(options)
+        except LookupError as exc:
+            raise CommandError(str(exc))
+
+    def handle_list(self, options):
+        profiles = list_profiles(options['url_name'])
+        if options['by_url']:
+            groups = defaultdict(list)
+            for summary in profiles:
+                groups[summary['url_name']].append(summary)
+            for url_name, group in sorted(groups.items()):
+                avg_ms = sum(summary['ms'] for summary in group) / len(group)
+                peak = max(summary['peak_bytes'] for summary in group)
+                self.stdout.write(f'{url_name:<32} {len(group):>5} runs  avg {avg_ms:>9.1f} ms  '
+                                  f'peak {peak / 1024:>9.0f} KiB')
+            return
+        for summary in profiles:
+            self.stdout.write(f"{summary['id']}  {summary['url_name']:<32} {summary['method']:<6} "
+                              f"{summary['status']}  {summary['ms']:>9.1f} ms  {summary['path']}")
+
+    def handle_aggregate(self, options):
+        stats, runs = load_stats(options['selector'])
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats(options['sort']).print_stats(options['limit'])
+        self.stdout.write(f'{runs} profile(s) merged')
+        self.stdout.write(out.getvalue())
+
+    def handle_diff(self, options):
+        self.stdout.write(f"{'before':>10} {'after':>10} {'change':>10}  function (cumulative ms per request)")
+        for func, old, new in diff(options['before'], options['after'], options['limit']):
+            self.stdout.write(f'{old * 1000:>10.2f} {new * 1000:>10.2f} {(new - old) * 1000:>+10.2f}  {func}')
@@ -0,0 +1,75 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.loadtest import (
+    DEFAULT_CONCURRENCY, HttpTarget, InProcessTarget, generate_workload, read_log, render_html, replay, write_log,
+)
+
+
+class Command(BaseCommand):
+    help = ('Replay a JSONL access log (or a workload generated from core.urls) against the app in this process '
+            'or a running server, and report latency per URL name, errors and database lock waits. '
+            'Replayed requests write to the database (sessions, view counters): use a copy.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('log', nargs='?',
+                            help='JSON lines with method, path, query and user; default: a generated workload')
+        parser.add_argument('--requests', type=int, default=1000, help='Size of the generated workload')
+        parser.add_argument('--seed', type=int, help='Random seed of the generated workload')
+        parser.add_argument('--save-workload', metavar='PATH', help='Write the generated workload to PATH and exit')
+        parser.add_argument('--url', help='Base URL of a running server (default: call the app in process)')
+        parser.add_argument('--host', help='Host header for in-process requests (default: from ALLOWED_HOSTS)')
+        parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='Requests in flight')
+        parser.add_argument('--rate', type=float, help='Requests per second (default: as fast as possible)')
+        parser.add_argument('--duration', type=float,
+                            help='Seconds to run, cycling through the workload (default: one pass)')
+        parser.add_argument('--json', metavar='PATH', help='Write the full report as JSON')
+        parser.add_argument('--html', metavar='PATH', help='Write the report as an HTML page')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+        if options['log']:
+            try:
+                with open(options['log'], encoding='utf-8') as log:
+                    entries = read_log(log)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Could not read {options['log']}: {exc}")
+        else:
+            entries = generate_workload(options['requests'], seed=options['seed'])
+        if options['save_workload']:
+            with open(options['save_workload'], 'w', encoding='utf-8') as out:
+                write_log(entries, out)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(entries)} requests to {options['save_workload']}."))
+            return
+
+        target = HttpTarget(options['url']) if options['url'] else InProcessTarget(options['host'])
+        try:
+            report = replay(entries, target, concurrency=options['concurrency'], rate=options['rate'],
+                            duration=options['duration'])
+        except (LookupError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        run = report['run']
+        self.stdout.write(f"{run['requests']} requests in {run['seconds']:.1f} s ({run['throughput']:.1f}/s), "
+                          f"{report['overall']['errors'] if report['overall'] else 0} errors")
+        self.stdout.write(f"  {'URL name':<28} {'requests':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} "
+                          f"{'p99 ms':>8} {'lock waits':>10}")
+        for name, stats in report['routes'].items():
+            latency = stats['latency']
+            self.stdout.write(
+                f"  {name:<28} {stats['requests']:>8} {stats['errors']:>6} {latency['p50'] * 1000:>8.1f} "
+                f"{latency['p95'] * 1000:>8.1f} {latency['p99'] * 1000:>8.1f} "
+                f"{'-' if stats['lock_waits'] is None else stats['lock_waits']:>10}"
+            )
+        if options['json']:
+            Path(options['json']).write_text(json.dumps(report, indent=2))
+        if options['html']:
+            Path(options['html']).write_text(render_html(report), encoding='utf-8')
+        if run['rate'] and run['behind'] > 1:
+            self.stdout.write(self.style.WARNING(
+                f"The target fell up to {run['behind']:.1f} s behind the requested rate."
+            ))
+        self.stdout.write(self.style.SUCCESS('Replay finished.'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from core.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (see core.jobs) until stopped with SIGINT or SIGTERM'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Jobs run at the same time')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Run jobs in threads, or in processes for CPU-bound work')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no job is due (periodic jobs are not scheduled)')
+        parser.add_argument('--name', help='Worker name recorded on claimed jobs (default host:pid)')
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            concurrency=options['concurrency'], pool=options['pool'], burst=options['burst'], name=options['name'],
+        )
+        pool = 'processes' if worker.pool == 'process' else 'threads'
+        self.stdout.write(f'Worker {worker.name} started with {worker.concurrency} {pool}')
+        ran = worker.run()
+        self.stdout.write(self.style.SUCCESS(f'Worker stopped after {ran} jobs.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.popularity import update_scores
+
+
+class Command(BaseCommand):
+    help = 'Decay and refresh popularity scores for destinations, caravans and courses (run from cron)'
+
+    def handle(self, *args, **options):
+        boosted = update_scores()
+        self.stdout.write(self.style.SUCCESS(f'Popularity scores updated ({boosted} rows boosted).'))
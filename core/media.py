@@ -0,0 +1,119 @@
+import mimetypes
+import mmap
+import posixpath
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 1024 * 1024
+
+
+def _parse_range(header, size):
+    """Return ``(start, end)`` (inclusive) for a single byte range.
+
+    Returns ``None`` when the header should be ignored (missing, malformed or
+    multi-range) and ``False`` when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _mmap_range(path, start, end):
+    """Yield ``[start, end]`` of the file as slices of a read-only mmap."""
+    with open(path, 'rb') as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                pos = start
+                while pos <= end:
+                    stop = min(pos + CHUNK_SIZE, end + 1)
+                    yield bytes(view[pos:stop])
+                    pos = stop
+            finally:
+                view.release()
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve a file from ``MEDIA_ROOT`` in production.
+
+    Honours ``If-Modified-Since`` and single ``Range`` requests. When
+    ``MEDIA_ACCEL_REDIRECT`` (nginx) or ``MEDIA_SENDFILE_HEADER`` (Apache,
+    lighttpd) is set, the transfer is handed to the front proxy. Otherwise
+    full files go through ``FileResponse`` so the WSGI server can use
+    ``wsgi.file_wrapper``/``os.sendfile``, and partial content is streamed
+    from an mmap of the file.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    fullpath = Path(safe_join(settings.MEDIA_ROOT, path))
+    if not fullpath.is_file():
+        raise Http404('File not found')
+
+    statobj = fullpath.stat()
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), statobj.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type, encoding = mimetypes.guess_type(str(fullpath))
+    content_type = content_type or 'application/octet-stream'
+    last_modified = http_date(statobj.st_mtime)
+
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT', None)
+    sendfile_header = getattr(settings, 'MEDIA_SENDFILE_HEADER', None)
+    if accel_prefix or sendfile_header:
+        response = HttpResponse(content_type=content_type)
+        if accel_prefix:
+            response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(path)
+        else:
+            response[sendfile_header] = str(fullpath)
+        response['Last-Modified'] = last_modified
+        if encoding:
+            response['Content-Encoding'] = encoding
+        return response
+
+    size = statobj.st_size
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if size and (not if_range or parse_http_date_safe(if_range) == int(statobj.st_mtime)):
+        byte_range = _parse_range(request.META.get('HTTP_RANGE'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range:
+        start, end = byte_range
+        response = StreamingHttpResponse(_mmap_range(fullpath, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        response = FileResponse(fullpath.open('rb'), content_type=content_type)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = last_modified
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
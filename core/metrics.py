@@ -0,0 +1,257 @@
+"""Process-local metrics with a Prometheus text endpoint.
+
+Every worker keeps its counters and histograms in memory. When
+``METRICS_DIR`` is set, each worker also writes its cumulative values to
+``<pid>-<start>.json`` in that directory, at most every
+``METRICS_FLUSH_INTERVAL`` seconds and at exit. The endpoint sums the
+files of all workers, so any worker can serve the whole pool. Files of
+workers that have exited keep counting toward the totals, so counters
+never go backwards; empty the directory when the pool is redeployed.
+Without ``METRICS_DIR`` the endpoint reports only the worker that serves
+it.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 ** 2, 5 * 1024 ** 2, 20 * 1024 ** 2, 100 * 1024 ** 2)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by URL name, method and status', LATENCY_BUCKETS),
+    'db_queries_total': ('counter', 'Database queries executed, by URL name', None),
+    'db_query_duration_seconds_total': ('counter', 'Time spent in database queries, by URL name', None),
+    'template_render_duration_seconds': ('histogram', 'Top-level template render time by template', LATENCY_BUCKETS),
+    'cache_requests_total': ('counter', 'Application cache lookups by cache and result (hit or miss)', None),
+    'upload_size_bytes': ('histogram', 'Size of stored uploads by upload directory', SIZE_BUCKETS),
+}
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._last_flush = time.monotonic()
+        self.file_name = f'{os.getpid()}-{time.time_ns()}.json'
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+        self._maybe_flush()
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            # Per-bucket counts plus a trailing +Inf bucket, then sum and count
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * (len(buckets) + 3)
+            series[bisect_left(buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+        self._maybe_flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'histograms': [
+                    [name, list(labels), list(series)] for (name, labels), series in self._histograms.items()
+                ],
+            }
+
+    def _maybe_flush(self):
+        if getattr(settings, 'METRICS_DIR', None) is None:
+            return
+        if time.monotonic() - self._last_flush >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 15):
+            self.flush()
+
+    def flush(self):
+        """Write this worker's values to ``METRICS_DIR`` (if configured)."""
+        self._last_flush = time.monotonic()
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if directory is None:
+            return
+        try:
+            directory = Path(directory)
+            directory.mkdir(parents=True, exist_ok=True)
+            tmp = directory / f'.{self.file_name}.tmp'
+            tmp.write_text(json.dumps(self.snapshot()))
+            os.replace(tmp, directory / self.file_name)
+        except OSError:
+            logger.exception('Could not write metrics to %s', directory)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+def inc(name, labels, amount=1):
+    registry.inc(name, labels, amount)
+
+
+def observe(name, labels, value):
+    registry.observe(name, labels, value)
+
+
+def record_cache(cache_name, hit):
+    registry.inc('cache_requests_total', {'cache': cache_name, 'result': 'hit' if hit else 'miss'})
+
+
+def collect():
+    """Merged ``(counters, histograms)`` of every worker, keyed by (name, labels)."""
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if directory is None:
+        snapshots = [registry.snapshot()]
+    else:
+        registry.flush()
+        snapshots = []
+        for path in Path(directory).glob('*.json'):
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[name, tuple(map(tuple, labels))] += value
+        for name, labels, series in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], series)]
+            else:
+                histograms[key] = series
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def _number(value):
+    # Exact: the ``:g`` format keeps six significant digits, so large
+    # counters would stop moving
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """Render all metrics in the Prometheus text exposition format."""
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (series_name, labels), value in sorted(counters.items()):
+                if series_name == name:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+            continue
+        for (series_name, labels), series in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip([_number(bound) for bound in buckets] + ['+Inf'], series):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f'{name}_sum{_labels(labels)} {_number(series[-2])}')
+            lines.append(f'{name}_count{_labels(labels)} {series[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """Records request latency and database usage per URL name."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0, 0.0]
+
+        def count_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries[0] += 1
+                queries[1] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        route = (match.view_name if match else '') or 'unresolved'
+        observe('http_request_duration_seconds',
+                {'route': route, 'method': request.method, 'status': str(response.status_code)}, elapsed)
+        if queries[0]:
+            inc('db_queries_total', {'route': route}, queries[0])
+            inc('db_query_duration_seconds_total', {'route': route}, queries[1])
+        return response
+
+
+def _timed_render(render):
+    def wrapper(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            name = getattr(self.template, 'name', None) or 'string'
+            observe('template_render_duration_seconds', {'template': name}, time.perf_counter() - started)
+
+    wrapper.metrics_wrapped = True
+    return wrapper
+
+
+def install_template_timing():
+    """Time ``render()`` of both template backends' template wrappers.
+
+    Neither engine has a render hook outside the test runner, so the
+    backend ``Template`` classes are wrapped once at startup.
+    """
+    from django.template.backends import django as django_backend
+
+    backends = [django_backend]
+    try:
+        from django.template.backends import jinja2 as jinja2_backend
+    except ImportError:
+        pass
+    else:
+        backends.append(jinja2_backend)
+    for backend in backends:
+        if not getattr(backend.Template.render, 'metrics_wrapped', False):
+            backend.Template.render = _timed_render(backend.Template.render)
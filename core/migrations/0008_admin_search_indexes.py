@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_storedfile'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='destination',
+            name='location',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='destination',
+            name='name',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+        migrations.AddIndex(
+            model_name='caravanbooking',
+            index=models.Index(fields=['-created_at'], name='core_carava_created_3ca4df_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caravanbooking',
+            index=models.Index(fields=['full_name'], name='core_carava_full_na_c3e4cb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caravanbooking',
+            index=models.Index(fields=['email'], name='core_carava_email_932264_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caravanbooking',
+            index=models.Index(fields=['phone'], name='core_carava_phone_d93b15_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseapplication',
+            index=models.Index(fields=['-created_at'], name='core_course_created_b1fa8a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseapplication',
+            index=models.Index(fields=['full_name'], name='core_course_full_na_326581_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseapplication',
+            index=models.Index(fields=['email'], name='core_course_email_de2ca1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testimonial',
+            index=models.Index(fields=['name'], name='core_testim_name_bb7396_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:49
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_taken_seats(apps, schema_editor):
+    Course = apps.get_model('core', 'Course')
+    courses = list(Course.objects.annotate(
+        taken=Count('applications', filter=Q(applications__status__in=['pending', 'approved']))
+    ))
+    for course in courses:
+        course.seats_taken = course.taken
+    Course.objects.bulk_update(courses, ['seats_taken'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='seats_taken',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_taken_seats, migrations.RunPython.noop),
+    ]
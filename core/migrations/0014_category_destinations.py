@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:16
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def memberships_from_tags(apps, schema_editor):
+    # Categories used to match any tag whose name merely contained the
+    # category name; only tags that name the category exactly carry over
+    Category = apps.get_model('core', 'Category')
+    Tag = apps.get_model('core', 'Tag')
+    Destination = apps.get_model('core', 'Destination')
+    Membership = Category.destinations.through
+    for category in Category.objects.all():
+        tags = Tag.objects.filter(Q(slug=category.slug) | Q(name__iexact=category.name))
+        member_ids = Destination.tags.through.objects.filter(tag__in=tags).values_list('destination_id', flat=True)
+        Membership.objects.bulk_create(
+            [Membership(category_id=category.pk, destination_id=pk) for pk in set(member_ids)],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+    categories = list(Category.objects.annotate(
+        active=Count('destinations', filter=Q(destinations__is_active=True))
+    ))
+    for category in categories:
+        category.destination_count = category.active
+    Category.objects.bulk_update(categories, ['destination_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_image_meta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='destination_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='destinations',
+            field=models.ManyToManyField(blank=True, related_name='categories', to='core.destination'),
+        ),
+        migrations.RunPython(memberships_from_tags, migrations.RunPython.noop),
+    ]
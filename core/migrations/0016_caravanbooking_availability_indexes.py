@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='caravanbooking',
+            index=models.Index(fields=['caravan', 'return_date'], name='core_carava_caravan_773b0e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caravanbooking',
+            index=models.Index(fields=['return_date'], name='core_carava_return__92a612_idx'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_rollups(apps, schema_editor):
+    Caravan = apps.get_model('core', 'Caravan')
+    CaravanBooking = apps.get_model('core', 'CaravanBooking')
+    CourseApplication = apps.get_model('core', 'CourseApplication')
+    BookingRevenue = apps.get_model('core', 'BookingRevenue')
+    ApplicationFunnel = apps.get_model('core', 'ApplicationFunnel')
+    caravan_types = dict(Caravan.objects.values_list('pk', 'caravan_type'))
+    revenue = CaravanBooking.objects.order_by().values('pickup_date', 'caravan_id', 'status').annotate(
+        count=Count('pk'), total=Sum('total_amount'),
+    )
+    BookingRevenue.objects.bulk_create([
+        BookingRevenue(
+            day=row['pickup_date'], caravan_id=row['caravan_id'], caravan_type=caravan_types[row['caravan_id']],
+            status=row['status'], bookings=row['count'], revenue=row['total'],
+        )
+        for row in revenue
+    ], batch_size=500)
+    funnel = CourseApplication.objects.order_by().values(
+        'course_id', 'status', day=TruncDate('created_at'),
+    ).annotate(count=Count('pk'))
+    ApplicationFunnel.objects.bulk_create([
+        ApplicationFunnel(day=row['day'], course_id=row['course_id'], status=row['status'], applications=row['count'])
+        for row in funnel
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_caravanbooking_availability_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApplicationFunnel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected'), ('completed', 'Completed')], max_length=20)),
+                ('applications', models.IntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.course')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'course', 'status'), name='unique_application_funnel')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BookingRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('caravan_type', models.CharField(choices=[('luxury', 'Luxury Caravan'), ('adventure', 'Adventure Caravan'), ('family', 'Family Caravan'), ('eco', 'Eco-friendly Caravan'), ('compact', 'Compact Caravan'), ('premium', 'Premium Caravan')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('cancelled', 'Cancelled'), ('completed', 'Completed')], max_length=20)),
+                ('bookings', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('caravan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.caravan')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['caravan_type', 'day'], name='core_bookin_caravan_ba7f1f_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'caravan', 'status'), name='unique_booking_revenue')],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
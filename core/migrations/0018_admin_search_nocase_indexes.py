@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:49
+
+import core.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='caravanbooking',
+            name='core_carava_full_na_c3e4cb_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='caravanbooking',
+            name='core_carava_email_932264_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='caravanbooking',
+            name='core_carava_phone_d93b15_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='courseapplication',
+            name='core_course_full_na_326581_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='courseapplication',
+            name='core_course_email_de2ca1_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='testimonial',
+            name='core_testim_name_bb7396_idx',
+        ),
+        migrations.AlterField(
+            model_name='destination',
+            name='location',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='destination',
+            name='name',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AddIndex(
+            model_name='caravan',
+            index=core.models.CaseInsensitiveIndex(fields=['name'], name='core_carava_name_17debc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caravanbooking',
+            index=core.models.CaseInsensitiveIndex(fields=['full_name'], name='core_carava_full_na_c3e4cb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caravanbooking',
+            index=core.models.CaseInsensitiveIndex(fields=['email'], name='core_carava_email_932264_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='caravanbooking',
+            index=core.models.CaseInsensitiveIndex(fields=['phone'], name='core_carava_phone_d93b15_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseapplication',
+            index=core.models.CaseInsensitiveIndex(fields=['full_name'], name='core_course_full_na_326581_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseapplication',
+            index=core.models.CaseInsensitiveIndex(fields=['email'], name='core_course_email_de2ca1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='destination',
+            index=core.models.CaseInsensitiveIndex(fields=['name'], name='core_destin_name_ed7bac_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='destination',
+            index=core.models.CaseInsensitiveIndex(fields=['location'], name='core_destin_locatio_9f5484_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='testimonial',
+            index=core.models.CaseInsensitiveIndex(fields=['name'], name='core_testim_name_bb7396_idx'),
+        ),
+    ]
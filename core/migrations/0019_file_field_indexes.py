@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_admin_search_nocase_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='caravan',
+            name='exterior_image',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='caravans/exterior/'),
+        ),
+        migrations.AlterField(
+            model_name='caravan',
+            name='featured_image',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='caravans/'),
+        ),
+        migrations.AlterField(
+            model_name='caravan',
+            name='interior_image',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='caravans/interior/'),
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='categories/'),
+        ),
+        migrations.AlterField(
+            model_name='course',
+            name='featured_image',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='courses/'),
+        ),
+        migrations.AlterField(
+            model_name='destination',
+            name='image',
+            field=models.ImageField(db_index=True, upload_to='destinations/'),
+        ),
+        migrations.AlterField(
+            model_name='destination',
+            name='map_image',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='maps/'),
+        ),
+        migrations.AlterField(
+            model_name='destinationimage',
+            name='image',
+            field=models.ImageField(db_index=True, upload_to='destination_gallery/'),
+        ),
+        migrations.AlterField(
+            model_name='exam',
+            name='attachment',
+            field=models.FileField(blank=True, db_index=True, null=True, upload_to='exams/'),
+        ),
+        migrations.AlterField(
+            model_name='pointofinterest',
+            name='icon',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='poi_icons/'),
+        ),
+        migrations.AlterField(
+            model_name='testimonial',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='testimonials/'),
+        ),
+    ]
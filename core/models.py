@@ -1,7 +1,34 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models.functions import Cast, Coalesce, Collate, Upper
+from django.utils import timezone
 from django.utils.text import slugify
 from django.urls import reverse
 
+
+class CaseInsensitiveIndex(models.Index):
+    """Index on one text field for the admin's ``^`` and ``=`` searches.
+
+    Django runs those as ``istartswith``/``iexact``: ``col LIKE %s`` on
+    SQLite, which only a NOCASE index can serve, and ``UPPER(col::text)
+    LIKE UPPER(%s)`` on PostgreSQL, served by a ``text_pattern_ops`` index
+    on that expression. Other backends get a plain index.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        field = self.fields[0]
+        vendor = schema_editor.connection.vendor
+        if vendor == 'sqlite':
+            expression = Collate(field, 'NOCASE')
+        elif vendor == 'postgresql':
+            from django.contrib.postgres.indexes import OpClass
+
+            expression = OpClass(Upper(Cast(field, models.TextField())), name='text_pattern_ops')
+        else:
+            return super().create_sql(model, schema_editor, using, **kwargs)
+        return models.Index(expression, name=self.name).create_sql(model, schema_editor, using, **kwargs)
+
+
 class Destination(models.Model):
     DESTINATION_TYPES = [
         ('beach', 'Beach'),
@@ -18,8 +45,10 @@ class Destination(models.Model):
     description = models.TextField()
     price_per_person = models.DecimalField(max_digits=10, decimal_places=2)
     duration = models.PositiveIntegerField(help_text="Duration in days")
-    image = models.ImageField(upload_to='destinations/')
-    map_image = models.ImageField(upload_to='maps/', blank=True, null=True)
+    image = models.ImageField(upload_to='destinations/', db_index=True)
+    map_image = models.ImageField(upload_to='maps/', blank=True, null=True, db_index=True)
+    # Size and blur placeholder of each image field, filled after upload (core.images)
+    image_meta = models.JSONField(default=dict, blank=True, editable=False)
     destination_type = models.CharField(max_length=20, choices=DESTINATION_TYPES)
     
     # Amenities
@@ -33,10 +62,18 @@ class Destination(models.Model):
     is_featured = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Time-decayed score maintained by the update_popularity command
+    popularity = models.FloatField(default=0, db_index=True, editable=False)
     
     # Tags for better search
     tags = models.ManyToManyField('Tag', blank=True)
     
+    class Meta:
+        indexes = [
+            CaseInsensitiveIndex(fields=['name']),
+            CaseInsensitiveIndex(fields=['location']),
+        ]
+    
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
@@ -59,7 +96,8 @@ class DestinationImage(models.Model):
         on_delete=models.CASCADE, 
         related_name='images'  # Changed from default to avoid clash
     )
-    image = models.ImageField(upload_to='destination_gallery/')
+    image = models.ImageField(upload_to='destination_gallery/', db_index=True)
+    image_meta = models.JSONField(default=dict, blank=True, editable=False)
     caption = models.CharField(max_length=200, blank=True)
     is_primary = models.BooleanField(default=False)
     
@@ -84,7 +122,8 @@ class PointOfInterest(models.Model):
     x_percent = models.DecimalField(max_digits=5, decimal_places=2, help_text='Left position in % (0-100)')
     y_percent = models.DecimalField(max_digits=5, decimal_places=2, help_text='Top position in % (0-100)')
     # Optional visual for marker/thumbnail
-    icon = models.ImageField(upload_to='poi_icons/', blank=True, null=True)
+    icon = models.ImageField(upload_to='poi_icons/', blank=True, null=True, db_index=True)
+    image_meta = models.JSONField(default=dict, blank=True, editable=False)
     # Coordinates for Google Maps deep link
     latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
@@ -119,7 +158,8 @@ class Testimonial(models.Model):
     position = models.CharField(max_length=100, blank=True)
     feedback = models.TextField()
     rating = models.IntegerField(choices=RATING_CHOICES, default=5)
-    image = models.ImageField(upload_to='testimonials/', blank=True, null=True)
+    image = models.ImageField(upload_to='testimonials/', blank=True, null=True, db_index=True)
+    image_meta = models.JSONField(default=dict, blank=True, editable=False)
     destination = models.ForeignKey(
         Destination, 
         on_delete=models.SET_NULL, 
@@ -130,6 +170,11 @@ class Testimonial(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            CaseInsensitiveIndex(fields=['name']),
+        ]
+    
     def __str__(self):
         return f"Testimonial by {self.name}"
 
@@ -149,7 +194,12 @@ class Category(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True)
     description = models.TextField(blank=True)
-    image = models.ImageField(upload_to='categories/', blank=True, null=True)
+    image = models.ImageField(upload_to='categories/', blank=True, null=True, db_index=True)
+    image_meta = models.JSONField(default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+    destinations = models.ManyToManyField(Destination, blank=True, related_name='categories')
+    # Active member destinations, kept current by core.signals
+    destination_count = models.PositiveIntegerField(default=0, editable=False)
     
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -158,6 +208,18 @@ class Category(models.Model):
     
     def __str__(self):
         return self.name
+    
+    def get_absolute_url(self):
+        return reverse('destinations_by_category', kwargs={'category_slug': self.slug})
+    
+    @classmethod
+    def refresh_destination_counts(cls, categories=None):
+        """Recount active destinations for ``categories`` (ids or a queryset; default all)."""
+        members = cls.destinations.through.objects.filter(
+            category=models.OuterRef('pk'), destination__is_active=True,
+        ).order_by().values('category').annotate(n=models.Count('pk')).values('n')
+        queryset = cls.objects.all() if categories is None else cls.objects.filter(pk__in=categories)
+        queryset.update(destination_count=Coalesce(models.Subquery(members), 0))
 
 
 class Course(models.Model):
@@ -180,8 +242,13 @@ class Course(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     duration_weeks = models.PositiveIntegerField(help_text="Duration in weeks", default=4)
     max_students = models.PositiveIntegerField(default=20)
+    # Pending + approved applications, maintained by CourseApplication.save()
+    seats_taken = models.PositiveIntegerField(default=0, editable=False)
+    # Time-decayed score maintained by the update_popularity command
+    popularity = models.FloatField(default=0, db_index=True, editable=False)
     start_date = models.DateField(blank=True, null=True)
-    featured_image = models.ImageField(upload_to='courses/', blank=True, null=True)
+    featured_image = models.ImageField(upload_to='courses/', blank=True, null=True, db_index=True)
+    image_meta = models.JSONField(default=dict, blank=True, editable=False)
     syllabus = models.TextField(blank=True, help_text="Course outline and topics covered")
     requirements = models.TextField(blank=True, help_text="Prerequisites and requirements")
     benefits = models.TextField(blank=True, help_text="What students will gain from this course")
@@ -208,6 +275,24 @@ class Course(models.Model):
     def formatted_price(self):
         return f"₹{self.price:,.2f}"
     
+    @property
+    def seats_left(self):
+        return max(self.max_students - self.seats_taken, 0)
+    
+    @property
+    def is_full(self):
+        return self.seats_taken >= self.max_students
+    
+    def reserve_seat(self):
+        """Atomically take a seat; returns False if the course is already full"""
+        reserved = Course.objects.filter(
+            pk=self.pk, seats_taken__lt=models.F('max_students')
+        ).update(seats_taken=models.F('seats_taken') + 1)
+        return bool(reserved)
+    
+    def release_seat(self):
+        Course.objects.filter(pk=self.pk, seats_taken__gt=0).update(seats_taken=models.F('seats_taken') - 1)
+    
     @property
     def duration_text(self):
         if self.duration_weeks == 1:
@@ -223,6 +308,10 @@ class Course(models.Model):
                 return f"{months} month{'s' if months > 1 else ''} {weeks} week{'s' if weeks > 1 else ''}"
 
 
+class CourseFullError(Exception):
+    """Raised when an application would take a seat on a full course"""
+
+
 class CourseApplication(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -230,6 +319,10 @@ class CourseApplication(models.Model):
         ('rejected', 'Rejected'),
         ('completed', 'Completed'),
     ]
+    # Statuses that occupy a seat in Course.seats_taken
+    SEAT_STATUSES = ('pending', 'approved')
+    # Fields deciding the ApplicationFunnel bucket (see core.rollups)
+    ROLLUP_FIELDS = ('created_at', 'course_id', 'status')
     
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='applications')
     full_name = models.CharField(max_length=150)
@@ -242,9 +335,61 @@ class CourseApplication(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at']),
+            CaseInsensitiveIndex(fields=['full_name']),
+            CaseInsensitiveIndex(fields=['email']),
+        ]
     
     def __str__(self):
         return f"{self.full_name} - {self.course.name}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_course_id = instance.__dict__.get('course_id')
+        instance._loaded_rollup = tuple(instance.__dict__.get(name) for name in cls.ROLLUP_FIELDS)
+        return instance
+    
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        # Read again by core.rollups when needed
+        self._loaded_rollup = None
+    
+    def _seat_change(self):
+        """``(held, wanted)``: the course ids whose seat the row held when loaded and should hold now (or None)."""
+        held = getattr(self, '_loaded_course_id', None)
+        if getattr(self, '_loaded_status', None) not in self.SEAT_STATUSES:
+            held = None
+        wanted = self.course_id if self.status in self.SEAT_STATUSES else None
+        return held, wanted
+    
+    def clean(self):
+        super().clean()
+        held, wanted = self._seat_change()
+        if wanted and wanted != held:
+            if Course.objects.filter(pk=wanted, seats_taken__gte=models.F('max_students')).exists():
+                raise ValidationError('This course is full.')
+    
+    def save(self, *args, **kwargs):
+        held, wanted = self._seat_change()
+        # The row is read back, saved and rolled up (core.rollups) in this transaction too
+        with transaction.atomic():
+            if wanted != held:
+                # Moving to another course takes a seat there and frees the old one
+                if wanted and not self.course.reserve_seat():
+                    raise CourseFullError(self.course)
+                if held:
+                    Course(pk=held).release_seat()
+            super().save(*args, **kwargs)
+        self._loaded_status = self.status
+        self._loaded_course_id = self.course_id
+    
+    def delete(self, *args, **kwargs):
+        # Like save(): the seat, the row and its funnel bucket change together
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
 
 
 class Exam(models.Model):
@@ -252,7 +397,7 @@ class Exam(models.Model):
     description = models.TextField(blank=True)
     scheduled_at = models.DateTimeField(blank=True, null=True)
     external_link = models.URLField(blank=True)
-    attachment = models.FileField(upload_to='exams/', blank=True, null=True)
+    attachment = models.FileField(upload_to='exams/', blank=True, null=True, db_index=True)
     is_active = models.BooleanField(default=True)
 
     def __str__(self):
@@ -307,9 +452,10 @@ class Caravan(models.Model):
     security_deposit = models.DecimalField(max_digits=10, decimal_places=2, help_text="Security deposit required")
     
     # Images
-    featured_image = models.ImageField(upload_to='caravans/', blank=True, null=True)
-    interior_image = models.ImageField(upload_to='caravans/interior/', blank=True, null=True)
-    exterior_image = models.ImageField(upload_to='caravans/exterior/', blank=True, null=True)
+    featured_image = models.ImageField(upload_to='caravans/', blank=True, null=True, db_index=True)
+    interior_image = models.ImageField(upload_to='caravans/interior/', blank=True, null=True, db_index=True)
+    exterior_image = models.ImageField(upload_to='caravans/exterior/', blank=True, null=True, db_index=True)
+    image_meta = models.JSONField(default=dict, blank=True, editable=False)
     
     # Availability and Location
     is_available = models.BooleanField(default=True)
@@ -326,9 +472,14 @@ class Caravan(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Time-decayed score maintained by the update_popularity command
+    popularity = models.FloatField(default=0, db_index=True, editable=False)
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            CaseInsensitiveIndex(fields=['name']),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -370,6 +521,8 @@ class CaravanBooking(models.Model):
         ('cancelled', 'Cancelled'),
         ('completed', 'Completed'),
     ]
+    # Fields deciding the BookingRevenue bucket (see core.rollups)
+    ROLLUP_FIELDS = ('pickup_date', 'caravan_id', 'status', 'total_amount')
     
     caravan = models.ForeignKey(Caravan, on_delete=models.CASCADE, related_name='bookings')
     user = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='caravan_bookings')
@@ -402,10 +555,39 @@ class CaravanBooking(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at']),
+            CaseInsensitiveIndex(fields=['full_name']),
+            CaseInsensitiveIndex(fields=['email']),
+            CaseInsensitiveIndex(fields=['phone']),
+            # Availability lookups: bookings still running after a given day
+            models.Index(fields=['caravan', 'return_date']),
+            models.Index(fields=['return_date']),
+        ]
     
     def __str__(self):
         return f"{self.full_name} - {self.caravan.name} ({self.pickup_date} to {self.return_date})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_rollup = tuple(instance.__dict__.get(name) for name in cls.ROLLUP_FIELDS)
+        return instance
+    
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        # Read again by core.rollups when needed
+        self._loaded_rollup = None
+    
+    def save(self, *args, **kwargs):
+        # The row is read back, saved and rolled up (core.rollups) in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+    
     @property
     def duration_days(self):
         """Calculate duration of booking in days"""
@@ -416,4 +598,153 @@ class CaravanBooking(models.Model):
         """Check if booking is currently active"""
         from django.utils import timezone
         today = timezone.now().date()
-        return self.pickup_date <= today <= self.return_date and self.status == 'confirmed'
\ No newline at end of file
+        return self.pickup_date <= today <= self.return_date and self.status == 'confirmed'
+
+class StoredFile(models.Model):
+    """Reference-counted blob written by ``core.storage.ContentAddressedStorage``.
+
+    One row exists per distinct file content; ``ref_count`` tracks how many
+    saves currently point at it so the file is only removed from disk when
+    the last reference is deleted.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, db_index=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
+class ViewCount(models.Model):
+    """Aggregated page views per object, written by ``core.counters``."""
+    KIND_CHOICES = [
+        ('destination', 'Destination'),
+        ('caravan', 'Caravan'),
+        ('course', 'Course'),
+    ]
+    
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    count = models.PositiveBigIntegerField(default=0)
+    # Value of ``count`` already folded into the popularity scores
+    scored_count = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_view_count'),
+        ]
+    
+    def __str__(self):
+        return f"{self.kind} #{self.object_id}: {self.count}"
+
+
+class PopularityRun(models.Model):
+    """One completed run of ``core.popularity.update_scores``."""
+    ran_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"Popularity run at {self.ran_at:%Y-%m-%d %H:%M}"
+
+
+class Job(models.Model):
+    """A unit of background work, run by ``manage.py runworker`` (see ``core.jobs``)."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    # Higher runs first among due jobs
+    priority = models.SmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    # At most one queued job per non-empty key
+    dedupe_key = models.CharField(max_length=200, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_due'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status='queued') & ~models.Q(dedupe_key=''),
+                name='unique_queued_dedupe_key',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+
+class JobResult(models.Model):
+    """Outcome of one attempt at a ``Job``."""
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name='results')
+    attempt = models.PositiveSmallIntegerField()
+    succeeded = models.BooleanField()
+    value = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    started_at = models.DateTimeField()
+    duration = models.FloatField(help_text='Seconds')
+    
+    class Meta:
+        ordering = ['job', 'attempt']
+    
+    def __str__(self):
+        return f"{self.job} attempt {self.attempt}: {'ok' if self.succeeded else 'failed'}"
+
+
+class BookingRevenue(models.Model):
+    """Bookings and their ``total_amount`` per pickup day, caravan and status (see ``core.rollups``)."""
+    day = models.DateField()
+    caravan = models.ForeignKey(Caravan, on_delete=models.CASCADE, related_name='+')
+    # Copied from the caravan so reports by type need no join
+    caravan_type = models.CharField(max_length=20, choices=Caravan.CARAVAN_TYPES)
+    status = models.CharField(max_length=20, choices=CaravanBooking.STATUS_CHOICES)
+    bookings = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'caravan', 'status'], name='unique_booking_revenue'),
+        ]
+        indexes = [
+            models.Index(fields=['caravan_type', 'day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.caravan_id} {self.status}: {self.revenue}"
+
+
+class ApplicationFunnel(models.Model):
+    """Course applications per application day, course and status (see ``core.rollups``)."""
+    day = models.DateField()
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    status = models.CharField(max_length=20, choices=CourseApplication.STATUS_CHOICES)
+    applications = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'course', 'status'], name='unique_application_funnel'),
+        ]
+    
+    def __str__(self):
+        return f"{self.day} {self.course_id} {self.status}: {self.applications}"
@@ -0,0 +1,54 @@
+"""Hole-punched personalization for shared-cacheable pages.
+
+Catalog pages render the same HTML for every visitor: the anonymous user
+menu, an empty CSRF field and no messages. ``static/js/session.js``
+then fetches the ``session_fragment`` endpoint, which returns the
+visitor's user menu, CSRF token and pending messages, and patches them
+into the page. Because the page itself never reads ``request.user`` or
+the session, it neither queries ``auth_user``/``django_session`` nor
+gets ``Vary: Cookie``, and ``PublicPageMiddleware`` can mark it
+``Cache-Control: public`` for the front proxy.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import has_vary_header, patch_cache_control
+
+
+def public_page(view):
+    """Mark a view whose GET responses are the same for every visitor."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        return view(request, *args, **kwargs)
+
+    wrapper.public_page = True
+    return wrapper
+
+
+class PublicPageMiddleware:
+    """Let shared caches store successful GETs of ``@public_page`` views.
+
+    Sits above the session, CSRF and auth middleware so it sees their
+    final headers: a response that set a cookie or varies on ``Cookie``
+    was personalized after all and is left alone.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        max_age = getattr(settings, 'PUBLIC_PAGE_MAX_AGE', 0)
+        match = getattr(request, 'resolver_match', None)
+        if (
+            max_age
+            and match is not None
+            and getattr(match.func, 'public_page', False)
+            and request.method in ('GET', 'HEAD')
+            and response.status_code == 200
+            and not response.cookies
+            and not has_vary_header(response, 'Cookie')
+            and not response.has_header('Cache-Control')
+        ):
+            patch_cache_control(response, public=True, max_age=max_age)
+        return response
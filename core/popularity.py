@@ -0,0 +1,123 @@
+"""Time-decayed popularity scores for destinations, caravans and courses.
+
+Scores are updated incrementally: each run first decays every stored
+score by ``0.5 ** (days since last run / half-life)`` and then adds the
+weighted events that happened since the previous run (new page views,
+bookings, course applications and testimonial ratings). Pages only read
+the indexed ``popularity`` columns.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Sum, Value, When
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .models import (
+    Caravan, CaravanBooking, Course, CourseApplication, Destination, PopularityRun, Testimonial, ViewCount,
+)
+
+WEIGHTS = {
+    'view': 1.0,
+    'booking': 25.0,
+    'application': 25.0,
+    # Multiplied by the star rating, so a 5-star review counts 5x this
+    'rating': 4.0,
+}
+
+MODELS = {
+    'destination': Destination,
+    'caravan': Caravan,
+    'course': Course,
+}
+
+
+# Rows per grouped UPDATE: three query parameters each, within SQLite's 999
+UPDATE_BATCH = 300
+
+
+def _half_life_days():
+    return getattr(settings, 'POPULARITY_HALF_LIFE_DAYS', 7)
+
+
+def _view_gains(gains):
+    rows = list(
+        ViewCount.objects.filter(count__gt=F('scored_count')).values_list('pk', 'kind', 'object_id', 'count',
+                                                                            'scored_count')
+    )
+    for pk, kind, object_id, count, scored_count in rows:
+        gains[kind][object_id] += (count - scored_count) * WEIGHTS['view']
+    # Mark exactly what was read, so views flushed meanwhile are kept for next run
+    ViewCount.objects.bulk_update(
+        [ViewCount(pk=pk, scored_count=count) for pk, _, _, count, _ in rows], ['scored_count'],
+        batch_size=UPDATE_BATCH,
+    )
+
+
+def _add_gains(model, per_object):
+    """Add each object's gain to its score, a batch of objects per UPDATE; returns the rows updated."""
+    items = list(per_object.items())
+    updated = 0
+    for start in range(0, len(items), UPDATE_BATCH):
+        batch = items[start:start + UPDATE_BATCH]
+        gain = Case(
+            *(When(pk=object_id, then=Value(value)) for object_id, value in batch),
+            default=Value(0.0), output_field=FloatField(),
+        )
+        updated += model.objects.filter(pk__in=[object_id for object_id, _ in batch]).update(
+            popularity=F('popularity') + gain,
+        )
+    return updated
+
+
+def _event_gains(gains, since, until):
+    bookings = CaravanBooking.objects.filter(created_at__lte=until)
+    applications = CourseApplication.objects.filter(created_at__lte=until)
+    testimonials = Testimonial.objects.filter(is_active=True, destination__isnull=False, created_at__lte=until)
+    if since is not None:
+        bookings = bookings.filter(created_at__gt=since)
+        applications = applications.filter(created_at__gt=since)
+        testimonials = testimonials.filter(created_at__gt=since)
+
+    for caravan_id, total in bookings.values('caravan').annotate(n=Count('id')).values_list('caravan', 'n'):
+        gains['caravan'][caravan_id] += total * WEIGHTS['booking']
+
+    # Bookings name their destination as free text; match it to catalog names
+    by_name = dict(bookings.exclude(destination='').annotate(key=Lower('destination'))
+                   .values('key').annotate(n=Count('id')).values_list('key', 'n'))
+    if by_name:
+        matches = Destination.objects.annotate(key=Lower('name')).filter(key__in=list(by_name))
+        for destination_id, key in matches.values_list('id', 'key'):
+            gains['destination'][destination_id] += by_name[key] * WEIGHTS['booking']
+
+    for course_id, total in applications.values('course').annotate(n=Count('id')).values_list('course', 'n'):
+        gains['course'][course_id] += total * WEIGHTS['application']
+
+    rated = testimonials.values('destination').annotate(stars=Sum('rating')).values_list('destination', 'stars')
+    for destination_id, stars in rated:
+        gains['destination'][destination_id] += stars * WEIGHTS['rating']
+
+
+def update_scores(now=None):
+    """Decay and refresh all popularity scores; returns the number of rows boosted."""
+    now = now or timezone.now()
+    last_run = PopularityRun.objects.order_by('-ran_at').first()
+    since = last_run.ran_at if last_run else None
+
+    with transaction.atomic():
+        if since is not None:
+            elapsed_days = max((now - since).total_seconds(), 0) / 86400
+            decay = 0.5 ** (elapsed_days / _half_life_days())
+            if decay < 1:
+                for model in MODELS.values():
+                    model.objects.filter(popularity__gt=0).update(popularity=F('popularity') * decay)
+
+        gains = defaultdict(lambda: defaultdict(float))
+        _view_gains(gains)
+        _event_gains(gains, since, now)
+
+        boosted = sum(_add_gains(MODELS[kind], per_object) for kind, per_object in gains.items() if kind in MODELS)
+
+        PopularityRun.objects.create(ran_at=now)
+    return boosted
@@ -0,0 +1,194 @@
+"""Render public catalog pages to static HTML for a front proxy.
+
+Each page has a signature built from the rows it is rendered from and a
+fingerprint of its template chain (the template plus everything it
+extends or includes). ``manifest.json`` in the output directory records
+the signature each file was last written with, so an incremental build
+only re-renders pages whose rows or templates changed and removes pages
+that no longer exist.
+
+Detail pages are also signed with the sets they list: related rows of
+the same type by count and latest ``updated_at``, and gallery images,
+POIs and testimonials, which have no ``updated_at``, by count and
+highest id. Editing one of those in place needs a ``--full`` build.
+"""
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Count, Max
+from django.template.loader import get_template
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from .counters import view_counter
+from .models import Caravan, Category, Course, Destination, DestinationImage, PointOfInterest, Testimonial
+
+MANIFEST_NAME = 'manifest.json'
+TEMPLATE_REF_RE = re.compile(r'{%\s*(?:extends|include)\s+["\']([^"\']+)["\']')
+
+_fingerprints = {}
+
+
+def template_fingerprint(name):
+    """Hash a template together with every template it extends or includes."""
+    if name not in _fingerprints:
+        _fingerprints[name] = ''  # guards against include cycles
+        source = Path(get_template(name).origin.name).read_text(encoding='utf-8')
+        digest = hashlib.sha256(source.encode('utf-8'))
+        for ref in sorted(set(TEMPLATE_REF_RE.findall(source))):
+            digest.update(template_fingerprint(ref).encode('ascii'))
+        _fingerprints[name] = digest.hexdigest()
+    return _fingerprints[name]
+
+
+def _stamp(value):
+    return value.isoformat() if value else ''
+
+
+def _destination_set_signature(queryset):
+    stats = queryset.aggregate(total=Count('id'), lastmod=Max('updated_at'))
+    return f"{stats['total']}:{_stamp(stats['lastmod'])}"
+
+
+def _child_signatures(queryset, parent):
+    """``{parent id: "count:highest id"}`` for the rows of a child table."""
+    rows = queryset.order_by().values(parent).annotate(total=Count('id'), last=Max('id'))
+    return {row[parent]: f"{row['total']}:{row['last']}" for row in rows}
+
+
+def collect_pages():
+    """Return ``[(url, template name, row signature)]`` for every page to publish."""
+    pages = []
+    active = Destination.objects.filter(is_active=True)
+    # Detail pages list related destinations of the same type
+    type_signatures = {
+        code: _destination_set_signature(active.filter(destination_type=code))
+        for code, _ in Destination.DESTINATION_TYPES
+    }
+    children = [
+        _child_signatures(DestinationImage.objects.all(), 'destination_id'),
+        _child_signatures(PointOfInterest.objects.all(), 'destination_id'),
+        _child_signatures(Testimonial.objects.filter(is_active=True), 'destination_id'),
+    ]
+    for pk, slug, updated_at, code in active.values_list('pk', 'slug', 'updated_at', 'destination_type'):
+        signature = '|'.join([_stamp(updated_at), type_signatures.get(code, '')] + [c.get(pk, '') for c in children])
+        pages.append((reverse('destination_detail', args=[slug]), 'core/destination_detail.html', signature))
+    for slug, updated_at, seats in Course.objects.filter(is_active=True).values_list('slug', 'updated_at', 'seats_taken'):
+        pages.append((reverse('course_detail', args=[slug]), 'core/course_detail.html', f'{_stamp(updated_at)}:{seats}'))
+    related_caravans = {
+        row['caravan_type']: f"{row['total']}:{_stamp(row['lastmod'])}"
+        for row in Caravan.objects.filter(is_active=True, is_available=True).order_by()
+        .values('caravan_type').annotate(total=Count('id'), lastmod=Max('updated_at'))
+    }
+    caravans = Caravan.objects.filter(is_active=True).values_list('slug', 'updated_at', 'caravan_type')
+    for slug, updated_at, caravan_type in caravans:
+        signature = f"{_stamp(updated_at)}|{related_caravans.get(caravan_type, '')}"
+        pages.append((reverse('caravan_detail', args=[slug]), 'core/caravan_detail.html', signature))
+
+    for code, signature in type_signatures.items():
+        pages.append((reverse('destinations_by_type', args=[code]), 'core/destinations_by_type.html', signature))
+    for category in Category.objects.all():
+        members = category.destinations.filter(is_active=True)
+        signature = f'{_stamp(category.updated_at)}:{_destination_set_signature(members)}'
+        pages.append((
+            reverse('destinations_by_category', args=[category.slug]),
+            'core/destinations_by_category.html',
+            signature,
+        ))
+    return pages
+
+
+def render_page(url):
+    """Render ``url`` as an anonymous GET and return the HTML bytes."""
+    request = RequestFactory().get(url)
+    request.user = AnonymousUser()
+    match = resolve(url)
+    response = match.func(request, *match.args, **match.kwargs)
+    if response.status_code != 200:
+        raise ValueError(f'{url} returned {response.status_code}')
+    return response.content
+
+
+def output_path(root, url):
+    return Path(root) / url.strip('/') / 'index.html'
+
+
+def _render_to_disk(root, url):
+    html = render_page(url)
+    path = output_path(root, url)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    tmp.write_bytes(html)
+    os.replace(tmp, path)
+    # Pre-rendering is not a visitor; drop the views the detail pages recorded
+    view_counter.reset()
+    return url
+
+
+def _init_worker():
+    from django.db import connections
+
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+    view_counter.interval = float('inf')
+
+
+def _render_all(root, todo, workers, rendered, progress):
+    if workers > 1 and len(todo) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        from django.db import connections
+
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for url in pool.map(_render_to_disk, [root] * len(todo), todo, chunksize=16):
+                rendered.append(url)
+                if progress:
+                    progress(len(rendered), len(todo))
+    else:
+        for url in todo:
+            rendered.append(_render_to_disk(root, url))
+            if progress:
+                progress(len(rendered), len(todo))
+
+
+def load_manifest(root):
+    try:
+        return json.loads((Path(root) / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def build(root, workers=1, full=False, progress=None):
+    """Render changed pages into ``root``; returns (rendered, skipped, removed)."""
+    _fingerprints.clear()
+    manifest = {} if full else load_manifest(root)
+    pages = collect_pages()
+
+    wanted = {}
+    todo = []
+    for url, template_name, row_signature in pages:
+        signature = f'{row_signature}|{template_fingerprint(template_name)}'
+        wanted[url] = signature
+        if manifest.get(url) != signature or not output_path(root, url).exists():
+            todo.append(url)
+
+    rendered = []
+    interval, view_counter.interval = view_counter.interval, float('inf')
+    try:
+        _render_all(root, todo, workers, rendered, progress)
+    finally:
+        view_counter.interval = interval
+
+    removed = [url for url in manifest if url not in wanted]
+    for url in removed:
+        path = output_path(root, url)
+        if path.exists():
+            path.unlink()
+
+    Path(root).mkdir(parents=True, exist_ok=True)
+    (Path(root) / MANIFEST_NAME).write_text(json.dumps(wanted, indent=0, sort_keys=True))
+    return len(rendered), len(pages) - len(todo), len(removed)
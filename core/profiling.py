@@ -0,0 +1,180 @@
+"""On-demand CPU and memory profiling of single requests.
+
+``ProfilingMiddleware`` profiles a request when it carries the
+``X-Profile`` header with ``PROFILE_TOKEN``, or when it is picked by
+``PROFILE_SAMPLE_RATE``. Each profiled request leaves two files in
+``PROFILE_DIR``: the ``cProfile`` stats (``<id>.prof``) and a JSON summary
+with the URL name, timing and the top ``tracemalloc`` allocation growth
+(``<id>.json``). Only the newest ``PROFILE_KEEP`` profiles are kept.
+
+With neither a token nor a sample rate configured the middleware removes
+itself from the chain at startup, so it costs nothing when disabled.
+"""
+import cProfile
+import json
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.crypto import constant_time_compare
+
+HEADER = 'HTTP_X_PROFILE'
+TOP_ALLOCATIONS = 25
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+class ProfilingMiddleware:
+    # cProfile and tracemalloc are process-wide, so only one request is
+    # profiled at a time; concurrent candidates simply run unprofiled
+    _lock = threading.Lock()
+
+    def __init__(self, get_response):
+        self.token = getattr(settings, 'PROFILE_TOKEN', None)
+        self.sample_rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+        if not self.token and not self.sample_rate:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def wants_profile(self, request):
+        supplied = request.META.get(HEADER)
+        if supplied and self.token and constant_time_compare(supplied, self.token):
+            return True
+        return self.sample_rate and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if not self.wants_profile(request) or not self._lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request)
+        finally:
+            self._lock.release()
+
+    def profile(self, request):
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(10)
+        before = tracemalloc.take_snapshot()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - started
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+
+        match = getattr(request, 'resolver_match', None)
+        profile_id = save_profile(profiler, {
+            'url_name': (match.view_name if match else '') or 'unresolved',
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'ms': round(elapsed * 1000, 2),
+            'peak_bytes': peak,
+            'allocations': _allocation_growth(before, after),
+        })
+        response['X-Profile-Id'] = profile_id
+        return response
+
+
+def _allocation_growth(before, after):
+    ignore = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ]
+    diff = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), 'lineno')
+    return [
+        {'where': str(stat.traceback[0]), 'size_diff': stat.size_diff, 'count_diff': stat.count_diff}
+        for stat in diff[:TOP_ALLOCATIONS]
+        if stat.size_diff > 0
+    ]
+
+
+def save_profile(profiler, summary):
+    """Write the stats and summary of one profile; returns its id."""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    # Ids sort chronologically; the pid keeps concurrent workers apart
+    profile_id = f'{datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}'
+    profiler.dump_stats(directory / f'{profile_id}.prof')
+    summary = dict(summary, id=profile_id, created=time.time())
+    (directory / f'{profile_id}.json').write_text(json.dumps(summary, indent=1))
+    _rotate(directory)
+    return profile_id
+
+
+def _rotate(directory):
+    keep = getattr(settings, 'PROFILE_KEEP', 200)
+    summaries = sorted(directory.glob('*.json'))
+    for path in summaries[:max(len(summaries) - keep, 0)]:
+        path.unlink(missing_ok=True)
+        path.with_suffix('.prof').unlink(missing_ok=True)
+
+
+def list_profiles(url_name=None):
+    """Return the saved profile summaries, oldest first."""
+    profiles = []
+    for path in sorted(profile_dir().glob('*.json')):
+        try:
+            summary = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        if url_name is None or summary['url_name'] == url_name:
+            profiles.append(summary)
+    return profiles
+
+
+def _resolve(selector):
+    """Profile ids for a selector: a single profile id or a URL name."""
+    if (profile_dir() / f'{selector}.prof').exists():
+        return [selector]
+    return [summary['id'] for summary in list_profiles(selector)]
+
+
+def load_stats(selector):
+    """Merge the cProfile stats of every profile the selector matches."""
+    ids = _resolve(selector)
+    if not ids:
+        raise LookupError(f'No profiles match {selector!r}')
+    stats = pstats.Stats(str(profile_dir() / f'{ids[0]}.prof'))
+    for profile_id in ids[1:]:
+        stats.add(str(profile_dir() / f'{profile_id}.prof'))
+    return stats, len(ids)
+
+
+def _per_call_cumulative(selector):
+    stats, runs = load_stats(selector)
+    return {
+        pstats.func_std_string(func): cumtime / runs
+        for func, (_, _, _, cumtime, _) in stats.stats.items()
+    }
+
+
+def diff(before, after, limit=30):
+    """Per-request cumulative time change (seconds) for functions, largest first.
+
+    ``before`` and ``after`` are profile ids or URL names; URL names are
+    averaged over all of their profiles.
+    """
+    old = _per_call_cumulative(before)
+    new = _per_call_cumulative(after)
+    changes = [
+        (func, old.get(func, 0.0), new.get(func, 0.0))
+        for func in old.keys() | new.keys()
+    ]
+    changes.sort(key=lambda change: abs(change[2] - change[1]), reverse=True)
+    return changes[:limit]
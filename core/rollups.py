@@ -0,0 +1,272 @@
+"""Daily revenue and course-application rollups.
+
+``BookingRevenue`` holds the number of caravan bookings and their summed
+``total_amount`` per pickup day, caravan and status; ``ApplicationFunnel``
+holds the number of course applications per application day, course and
+status. Whenever a booking or application is created, re-priced, moved,
+changes status or is deleted, the signals in ``core.signals`` take it out
+of the bucket it was counted in and add it to its new one. Reports read
+only the rollups.
+
+``save()`` and ``delete()`` of both models run in a transaction, as do
+queryset deletes, so the counted values are read back under a row lock
+and the bucket moves commit or roll back with the change. Saves that go
+around ``save()`` read them back without a lock; queryset ``update()``
+and ``bulk_create()``, raw SQL and fixtures bypass the signals
+altogether. ``manage.py reconcile_rollups`` (also the nightly
+``rollups.reconcile`` job) recounts the buckets from the source tables
+and repairs any drift these leave.
+"""
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import router, transaction
+from django.db.models import CharField, Count, F, Sum
+from django.db.models.functions import Cast, Substr, TruncDate
+from django.utils import timezone
+
+from .models import ApplicationFunnel, BookingRevenue, Caravan, CaravanBooking, Course, CourseApplication
+
+# Statuses that count as earned revenue in the reports
+EARNED_STATUSES = ('confirmed', 'completed')
+
+
+def _loaded(instance, refetch):
+    """The ``ROLLUP_FIELDS`` values the instance was last counted with, or None for a new row.
+
+    Unless the instance was loaded whole and ``refetch`` is false, they
+    are read back from the database, locking the row when in a transaction.
+    """
+    model = type(instance)
+    loaded = getattr(instance, '_loaded_rollup', None)
+    if not refetch and loaded is not None and None not in loaded:
+        return loaded
+    if instance.pk is None:
+        return None
+    using = instance._state.db or router.db_for_write(model, instance=instance)
+    rows = model._base_manager.db_manager(using).filter(pk=instance.pk)
+    if transaction.get_connection(using).in_atomic_block:
+        rows = rows.select_for_update()
+    return rows.values_list(*model.ROLLUP_FIELDS).first()
+
+
+def remember_saved(instance):
+    """Capture the counted values before a save overwrites the row.
+
+    Always read back: another copy of the row may have been saved since
+    this one was loaded.
+    """
+    instance._loaded_rollup = _loaded(instance, refetch=True)
+
+
+def remember_deleted(instance):
+    """Capture the counted values before the row is deleted.
+
+    Rows deleted through a queryset or a cascade were loaded just before,
+    so their loaded values are used as they are.
+    """
+    instance._loaded_rollup = _loaded(instance, refetch=False)
+
+
+def _booking_bucket(values):
+    pickup_date, caravan_id, status, total_amount = values
+    return (pickup_date, caravan_id, status), Decimal(str(total_amount))
+
+
+def _application_bucket(values):
+    created_at, course_id, status = values
+    return (timezone.localdate(created_at), course_id, status)
+
+
+def _apply(model, key_fields, deltas, new_rows):
+    """Add ``deltas`` ({key: {field: amount}}) to ``model``'s rows, creating ``new_rows`` ({key: {field: value}}) first."""
+    deltas = {key: changes for key, changes in deltas.items() if any(changes.values())}
+    if not deltas:
+        return
+    with transaction.atomic():
+        model.objects.bulk_create(
+            [model(**dict(zip(key_fields, key)), **new_rows[key]) for key in deltas if key in new_rows],
+            ignore_conflicts=True,
+        )
+        for key, changes in deltas.items():
+            model.objects.filter(**dict(zip(key_fields, key))).update(
+                **{field: F(field) + amount for field, amount in changes.items()}
+            )
+
+
+def record_booking(booking, deleted=False):
+    """Move ``booking`` from the revenue bucket it was counted in to its current one."""
+    old = getattr(booking, '_loaded_rollup', None)
+    new = None if deleted else tuple(getattr(booking, name) for name in CaravanBooking.ROLLUP_FIELDS)
+    deltas = defaultdict(lambda: {'bookings': 0, 'revenue': Decimal(0)})
+    new_rows = {}
+    if old is not None:
+        key, amount = _booking_bucket(old)
+        deltas[key]['bookings'] -= 1
+        deltas[key]['revenue'] -= amount
+    if new is not None:
+        key, amount = _booking_bucket(new)
+        deltas[key]['bookings'] += 1
+        deltas[key]['revenue'] += amount
+        new_rows[key] = {'caravan_type': booking.caravan.caravan_type}
+    _apply(BookingRevenue, ('day', 'caravan_id', 'status'), deltas, new_rows)
+    booking._loaded_rollup = new
+
+
+def record_application(application, deleted=False):
+    """Move ``application`` from the funnel bucket it was counted in to its current one."""
+    old = getattr(application, '_loaded_rollup', None)
+    new = None if deleted else tuple(getattr(application, name) for name in CourseApplication.ROLLUP_FIELDS)
+    deltas = defaultdict(lambda: {'applications': 0})
+    new_rows = {}
+    if old is not None:
+        deltas[_application_bucket(old)]['applications'] -= 1
+    if new is not None:
+        key = _application_bucket(new)
+        deltas[key]['applications'] += 1
+        new_rows[key] = {}
+    _apply(ApplicationFunnel, ('day', 'course_id', 'status'), deltas, new_rows)
+    application._loaded_rollup = new
+
+
+def retype_caravan(caravan):
+    """Follow a change of the caravan's type in its revenue rows."""
+    BookingRevenue.objects.filter(caravan=caravan).exclude(caravan_type=caravan.caravan_type).update(
+        caravan_type=caravan.caravan_type,
+    )
+
+
+def _reconcile(model, key_fields, value_fields, expected, rows, fix):
+    """Compare ``rows`` of ``model`` with ``expected`` ({key: values}); returns the drifted keys, repaired if ``fix``."""
+    def counted(values):
+        # Rows whose counts are all zero are as good as missing
+        return values if values is not None and any(v for v in values if not isinstance(v, str)) else None
+
+    actual = {}
+    for pk, *row in rows.values_list('pk', *key_fields, *value_fields):
+        actual[tuple(row[:len(key_fields)])] = (pk, tuple(row[len(key_fields):]))
+    expected = {key: values for key, values in expected.items() if counted(values)}
+    drifted = [
+        key for key in expected.keys() | actual.keys()
+        if counted(actual.get(key, (None, None))[1]) != expected.get(key)
+    ]
+    if fix and drifted:
+        stale, changed, added = [], [], []
+        for key in drifted:
+            if key not in expected:
+                stale.append(actual[key][0])
+            elif key in actual:
+                changed.append(model(pk=actual[key][0], **dict(zip(value_fields, expected[key]))))
+            else:
+                added.append(model(**dict(zip(key_fields, key)), **dict(zip(value_fields, expected[key]))))
+        with transaction.atomic():
+            model.objects.filter(pk__in=stale).delete()
+            model.objects.bulk_update(changed, value_fields, batch_size=500)
+            model.objects.bulk_create(added, batch_size=500)
+    return sorted(drifted, key=str)
+
+
+def reconcile_revenue(since=None, fix=True):
+    """Recount ``BookingRevenue`` from the bookings (picked up on or after ``since``)."""
+    bookings = CaravanBooking.objects.order_by()
+    rows = BookingRevenue.objects.all()
+    if since is not None:
+        bookings = bookings.filter(pickup_date__gte=since)
+        rows = rows.filter(day__gte=since)
+    caravan_types = dict(Caravan.objects.values_list('pk', 'caravan_type'))
+    expected = {
+        (day, caravan_id, status): (caravan_types[caravan_id], count, total)
+        for day, caravan_id, status, count, total in bookings.values('pickup_date', 'caravan_id', 'status')
+        .annotate(count=Count('pk'), total=Sum('total_amount'))
+        .values_list('pickup_date', 'caravan_id', 'status', 'count', 'total')
+    }
+    return _reconcile(
+        BookingRevenue, ('day', 'caravan_id', 'status'), ('caravan_type', 'bookings', 'revenue'), expected, rows, fix,
+    )
+
+
+def reconcile_funnel(since=None, fix=True):
+    """Recount ``ApplicationFunnel`` from the applications (made on or after ``since``)."""
+    applications = CourseApplication.objects.order_by()
+    rows = ApplicationFunnel.objects.all()
+    if since is not None:
+        applications = applications.filter(created_at__date__gte=since)
+        rows = rows.filter(day__gte=since)
+    counts = applications.values('course_id', 'status', day=TruncDate('created_at')).annotate(count=Count('pk'))
+    expected = {(row['day'], row['course_id'], row['status']): (row['count'],) for row in counts}
+    return _reconcile(ApplicationFunnel, ('day', 'course_id', 'status'), ('applications',), expected, rows, fix)
+
+
+def revenue_by_month(start=None, end=None):
+    """Monthly rows of bookings and revenue per caravan type and status, oldest month first."""
+    rows = BookingRevenue.objects.order_by()
+    if start is not None:
+        rows = rows.filter(day__gte=start)
+    if end is not None:
+        rows = rows.filter(day__lte=end)
+    # Grouped on the ISO date's "YYYY-MM" prefix: TruncMonth is a Python
+    # function call per row on SQLite and takes twice as long
+    rows = (
+        rows.values('caravan_type', 'status', month=Substr(Cast('day', CharField()), 1, 7))
+        .annotate(bookings=Sum('bookings'), revenue=Sum('revenue'))
+        .filter(bookings__gt=0)
+        .order_by('month', 'caravan_type', 'status')
+    )
+    return [{**row, 'month': date.fromisoformat(row['month'] + '-01')} for row in rows]
+
+
+def revenue_summary(start=None, end=None):
+    """Revenue per month and per caravan type: earned (``EARNED_STATUSES``), pending and cancelled."""
+    type_labels = dict(Caravan.CARAVAN_TYPES)
+    blank = lambda: {'bookings': 0, 'earned': Decimal(0), 'pending': Decimal(0), 'cancelled': Decimal(0)}
+    months, types, total = defaultdict(blank), defaultdict(blank), blank()
+    for row in revenue_by_month(start, end):
+        for summary in (months[row['month']], types[row['caravan_type']], total):
+            summary['bookings'] += row['bookings']
+            if row['status'] in EARNED_STATUSES:
+                summary['earned'] += row['revenue']
+            elif row['status'] in ('pending', 'cancelled'):
+                summary[row['status']] += row['revenue']
+    return {
+        'months': [{'month': month, **summary} for month, summary in months.items()],
+        'types': sorted(
+            ({'type': key, 'label': type_labels.get(key, key), **summary} for key, summary in types.items()),
+            key=lambda summary: -summary['earned'],
+        ),
+        'total': total,
+    }
+
+
+def course_funnels(start=None, end=None):
+    """Per course: applications made in the period and how far they got.
+
+    ``approved`` counts applications approved or since completed.
+    """
+    rows = ApplicationFunnel.objects.order_by()
+    if start is not None:
+        rows = rows.filter(day__gte=start)
+    if end is not None:
+        rows = rows.filter(day__lte=end)
+    by_course = defaultdict(lambda: dict.fromkeys(dict(CourseApplication.STATUS_CHOICES), 0))
+    for course_id, status, count in rows.values_list('course_id', 'status').annotate(count=Sum('applications')):
+        by_course[course_id][status] += count
+    names = dict(Course.objects.filter(pk__in=by_course).values_list('pk', 'name'))
+    funnels = []
+    for course_id, counts in by_course.items():
+        applied = sum(counts.values())
+        if not applied:
+            continue
+        approved = counts['approved'] + counts['completed']
+        funnels.append({
+            'course_id': course_id,
+            'course': names.get(course_id, course_id),
+            'applied': applied,
+            'pending': counts['pending'],
+            'rejected': counts['rejected'],
+            'approved': approved,
+            'completed': counts['completed'],
+            'approval_rate': approved / applied,
+            'completion_rate': counts['completed'] / applied,
+        })
+    return sorted(funnels, key=lambda funnel: (-funnel['applied'], str(funnel['course'])))
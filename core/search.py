@@ -0,0 +1,229 @@
+"""Typo- and transliteration-tolerant destination search.
+
+Destination names, locations, types and tags are split into words, and
+each word is normalized so that common romanizations of the same Bengali
+word agree (``Darjeeling``/``Darjiling``, ``Shantiniketan``/
+``Santiniketan``, ``Bishnupur``/``Vishnupur``). Normalized words are
+indexed by their trigrams. A query word looks up the words sharing its
+trigrams through the inverted index, scores them by trigram similarity
+and contributes the best score of each destination that contains a close
+word; destinations are ranked by the sum over the query words.
+
+The index lives in each worker's memory. ``invalidate()`` (called from
+``core.signals`` whenever a destination or tag changes) bumps a version
+token in the shared cache (see ``core.versions``), and each worker rebuilds on its next search after
+seeing the new version.
+"""
+import logging
+import math
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter, defaultdict
+from functools import lru_cache
+from heapq import nlargest
+from itertools import chain
+from operator import itemgetter
+
+from django.db import connection
+
+from . import versions
+from .metrics import record_cache
+from .models import Destination
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'search:version'
+# Minimum trigram similarity for a word to count as a match
+MIN_SIMILARITY = 0.35
+# Close words considered per query word
+MAX_WORD_MATCHES = 20
+FIELD_WEIGHTS = {'name': 1.0, 'location': 0.8, 'type': 0.6, 'tag': 0.6}
+
+# Applied in order to each lowercase ASCII word. Bengali has no v/b or
+# s/sh distinction and romanizations disagree on long vowels and aspirates.
+TRANSLITERATION_RULES = [
+    (re.compile(r'ee|ea|ie'), 'i'),
+    (re.compile(r'oo|ou'), 'u'),
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'([bcdgjkpst])h'), r'\1'),
+    (re.compile(r'v'), 'b'),
+    (re.compile(r'z'), 'j'),
+    (re.compile(r'q|ck'), 'k'),
+    (re.compile(r'y'), 'i'),
+    (re.compile(r'([a-z])\1+'), r'\1'),
+]
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+@lru_cache(maxsize=100_000)
+def normalize_word(word):
+    for pattern, replacement in TRANSLITERATION_RULES:
+        word = pattern.sub(replacement, word)
+    return word
+
+
+def words(text):
+    """Lowercase ASCII words of ``text`` with accents removed."""
+    folded = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode('ascii')
+    return WORD_RE.findall(folded.lower())
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    def __init__(self, entries):
+        """``entries`` is an iterable of ``(destination id, field, text)``."""
+        vocabulary = {}
+        spellings = defaultdict(Counter)
+        postings = defaultdict(dict)
+        for destination_id, field, text in entries:
+            weight = FIELD_WEIGHTS[field]
+            for raw in words(text):
+                word = normalize_word(raw)
+                word_id = vocabulary.setdefault(word, len(vocabulary))
+                spellings[word_id][raw] += 1
+                if postings[word_id].get(destination_id, 0) < weight:
+                    postings[word_id][destination_id] = weight
+
+        self.vocabulary = vocabulary
+        self.words = list(vocabulary)
+        self.spellings = [spellings[i].most_common(1)[0][0] for i in range(len(self.words))]
+        # Destination ids of each word grouped by field weight, so whole
+        # groups can be scored and merged with dict operations
+        self.postings = []
+        for word_id in range(len(self.words)):
+            groups = defaultdict(lambda: array('I'))
+            for destination_id, weight in postings[word_id].items():
+                groups[weight].append(destination_id)
+            self.postings.append(dict(groups))
+        self.trigram_counts = array('H')
+        inverted = defaultdict(lambda: array('I'))
+        for word_id, word in enumerate(self.words):
+            word_trigrams = trigrams(word)
+            self.trigram_counts.append(len(word_trigrams))
+            for trigram in word_trigrams:
+                inverted[trigram].append(word_id)
+        self.inverted = dict(inverted)
+
+    def __len__(self):
+        return len(self.words)
+
+    def similar_words(self, raw):
+        """``[(similarity, word id)]`` of the indexed words closest to ``raw``, best first."""
+        query = trigrams(normalize_word(raw))
+        size = len(query)
+        # Shared trigram counts for every word in one C-level pass over the
+        # posting arrays; words sharing fewer than `needed` cannot reach
+        # MIN_SIMILARITY and are dropped before any arithmetic
+        shared = Counter(chain.from_iterable(self.inverted.get(t, ()) for t in query))
+        needed = math.ceil(MIN_SIMILARITY * size)
+        counts = self.trigram_counts
+        matches = [
+            (common / (size + counts[word_id] - common), word_id)
+            for word_id, common in shared.items()
+            if common >= needed
+        ]
+        return nlargest(MAX_WORD_MATCHES, (match for match in matches if match[0] >= MIN_SIMILARITY))
+
+    def search(self, query, limit=60):
+        """Return ``(destination ids best first, suggestion or None)``."""
+        totals = {}
+        suggestion = []
+        corrected = False
+        for raw in words(query):
+            matches = self.similar_words(raw)
+            if not matches:
+                suggestion.append(raw)
+                continue
+            # Applying scores in ascending order leaves each destination's best
+            scored = sorted(
+                (similarity * weight, ids)
+                for similarity, word_id in matches
+                for weight, ids in self.postings[word_id].items()
+            )
+            best = {}
+            for score, ids in scored:
+                best.update(dict.fromkeys(ids, score))
+            # Sum into the totals; only destinations already there need arithmetic
+            overlap = {key: totals[key] + best[key] for key in best.keys() & totals.keys()}
+            totals.update(best)
+            totals.update(overlap)
+            spelling = self.spellings[matches[0][1]]
+            suggestion.append(spelling)
+            corrected = corrected or spelling != raw
+        ranked = [destination_id for destination_id, _ in nlargest(limit, totals.items(), key=itemgetter(1))]
+        return ranked, (' '.join(suggestion) if corrected and ranked else None)
+
+
+def _entries():
+    queryset = Destination.objects.filter(is_active=True)
+    types = dict(Destination.DESTINATION_TYPES)
+    for pk, name, location, destination_type in queryset.values_list('pk', 'name', 'location', 'destination_type'):
+        yield pk, 'name', name
+        yield pk, 'location', location
+        yield pk, 'type', types.get(destination_type, destination_type)
+    tags = Destination.tags.through.objects.filter(destination__is_active=True)
+    for pk, tag_name in tags.values_list('destination_id', 'tag__name').iterator(chunk_size=2000):
+        yield pk, 'tag', tag_name
+
+
+# Indexes with more words than this are rebuilt in a background thread
+# while the stale one keeps serving; smaller ones rebuild inline
+BACKGROUND_REBUILD_WORDS = 20_000
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+_rebuilding = False
+
+
+def invalidate():
+    versions.bump(VERSION_KEY)
+
+
+def _rebuild(version):
+    global _index, _index_version
+    index = SearchIndex(_entries())
+    with _lock:
+        _index, _index_version = index, version
+
+
+def _rebuild_in_background(version):
+    global _rebuilding
+    try:
+        _rebuild(version)
+    except Exception:
+        logger.exception('Could not rebuild the search index')
+    finally:
+        _rebuilding = False
+        connection.close()
+
+
+def get_index():
+    """This worker's index, rebuilt if destinations changed since it was built."""
+    global _rebuilding
+    version = versions.current(VERSION_KEY)
+    current = _index is not None and _index_version == version
+    record_cache('search_index', current)
+    if current:
+        return _index
+    if _index is not None and len(_index) > BACKGROUND_REBUILD_WORDS:
+        with _lock:
+            if not _rebuilding:
+                _rebuilding = True
+                threading.Thread(target=_rebuild_in_background, args=(version,), daemon=True).start()
+        return _index
+    _rebuild(version)
+    return _index
+
+
+def search_destinations(query, limit=60):
+    """Active destinations matching ``query`` best first, plus a "did you mean" suggestion."""
+    ids, suggestion = get_index().search(query, limit)
+    found = Destination.objects.in_bulk(ids)
+    return [found[pk] for pk in ids if pk in found], suggestion
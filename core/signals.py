@@ -0,0 +1,156 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import availability, facets, jobs, rollups, search, storage, tasks
+from .images import has_image_meta, stale_fields
+from .models import Caravan, CaravanBooking, Category, Course, CourseApplication, Destination, Tag
+
+
+def release_stored_files(sender, instance, **kwargs):
+    """Drop one reference for each content-addressed file the deleted row pointed at."""
+    for model, field in storage.file_fields():
+        if model is sender:
+            field.storage.delete(getattr(instance, field.attname).name)
+
+
+def remember_stored_files(sender, instance, raw=False, **kwargs):
+    """Note the file names an existing row had before the save."""
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    names = [field.attname for model, field in storage.file_fields() if model is sender]
+    instance._previous_files = sender._base_manager.filter(pk=instance.pk).values(*names).first() or {}
+
+
+def release_replaced_files(sender, instance, raw=False, **kwargs):
+    """Drop the reference of each file the save replaced or cleared."""
+    previous = getattr(instance, '_previous_files', None) or {}
+    instance._previous_files = None
+    for model, field in storage.file_fields():
+        if model is sender and previous.get(field.attname) and previous[field.attname] != getattr(
+            instance, field.attname
+        ).name:
+            field.storage.delete(previous[field.attname])
+
+
+def connect_storage_receivers():
+    # Only models with content-addressed files: a post_delete receiver
+    # turns off fast (single-query) deletes for its sender
+    for model in {model for model, _ in storage.file_fields()}:
+        post_delete.connect(release_stored_files, sender=model, dispatch_uid=f'release_stored_files:{model._meta.label}')
+        pre_save.connect(remember_stored_files, sender=model, dispatch_uid=f'remember_stored_files:{model._meta.label}')
+        post_save.connect(release_replaced_files, sender=model, dispatch_uid=f'release_replaced_files:{model._meta.label}')
+
+
+connect_storage_receivers()
+
+
+@receiver(post_delete, sender=CourseApplication)
+def release_course_seat(sender, instance, **kwargs):
+    # Also runs for queryset and cascade deletes, unlike Model.delete()
+    held, _ = instance._seat_change()
+    if held:
+        Course(pk=held).release_seat()
+
+
+@receiver(post_save)
+def fill_image_meta(sender, instance, raw=False, **kwargs):
+    """Queue size and placeholder computation for newly uploaded images (only when a file changed)."""
+    if not raw and has_image_meta(sender) and stale_fields(instance):
+        label = sender._meta.label
+        jobs.enqueue(tasks.refresh_image_meta_job, [label, instance.pk], dedupe_key=f'image-meta:{label}:{instance.pk}')
+
+
+@receiver(post_save, sender=Destination)
+@receiver(post_delete, sender=Destination)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(m2m_changed, sender=Destination.tags.through)
+def invalidate_destination_indexes(sender, **kwargs):
+    facets.invalidate('destinations')
+    search.invalidate()
+
+
+@receiver(post_save, sender=Caravan)
+@receiver(post_delete, sender=Caravan)
+def invalidate_caravan_facets(sender, **kwargs):
+    facets.invalidate('caravans')
+
+
+@receiver(post_save, sender=CaravanBooking)
+@receiver(post_delete, sender=CaravanBooking)
+def invalidate_availability(sender, **kwargs):
+    availability.invalidate()
+
+
+@receiver(pre_save, sender=CaravanBooking)
+@receiver(pre_save, sender=CourseApplication)
+def remember_rollup_bucket(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rollups.remember_saved(instance)
+
+
+@receiver(pre_delete, sender=CaravanBooking)
+@receiver(pre_delete, sender=CourseApplication)
+def remember_deleted_rollup_bucket(sender, instance, **kwargs):
+    rollups.remember_deleted(instance)
+
+
+@receiver(post_save, sender=CaravanBooking)
+def roll_up_booking(sender, instance, raw=False, **kwargs):
+    # Fixtures are left to reconcile_rollups
+    if not raw:
+        rollups.record_booking(instance)
+
+
+@receiver(post_delete, sender=CaravanBooking)
+def roll_up_deleted_booking(sender, instance, **kwargs):
+    rollups.record_booking(instance, deleted=True)
+
+
+@receiver(post_save, sender=CourseApplication)
+def roll_up_application(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rollups.record_application(instance)
+
+
+@receiver(post_delete, sender=CourseApplication)
+def roll_up_deleted_application(sender, instance, **kwargs):
+    rollups.record_application(instance, deleted=True)
+
+
+@receiver(post_save, sender=Caravan)
+def retype_caravan_revenue(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        rollups.retype_caravan(instance)
+
+
+@receiver(m2m_changed, sender=Category.destinations.through)
+def count_category_members(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            Category.refresh_destination_counts([instance.pk])
+    elif action == 'pre_clear':
+        instance._cleared_categories = list(instance.categories.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        Category.refresh_destination_counts(instance._cleared_categories)
+    elif action in ('post_add', 'post_remove'):
+        Category.refresh_destination_counts(pk_set)
+
+
+@receiver(post_save, sender=Destination)
+def recount_destination_categories(sender, instance, created, raw=False, **kwargs):
+    # A new destination has no categories yet; saves may toggle is_active
+    if not created and not raw:
+        Category.refresh_destination_counts(instance.categories.values('pk'))
+
+
+@receiver(pre_delete, sender=Destination)
+def remember_destination_categories(sender, instance, **kwargs):
+    # The membership rows are gone by post_delete
+    instance._deleted_categories = list(instance.categories.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Destination)
+def recount_after_destination_delete(sender, instance, **kwargs):
+    if getattr(instance, '_deleted_categories', None):
+        Category.refresh_destination_counts(instance._deleted_categories)
@@ -0,0 +1,145 @@
+"""Sharded, gzip-compressed sitemaps for the public catalog.
+
+Every section is split into shards of ``SHARD_SIZE`` primary keys, so a
+shard never holds more than the 50,000 URLs the protocol allows and rows
+keep their shard as the table grows. A shard's signature is its row count
+plus its newest ``updated_at``; the compressed XML is cached under that
+signature, so only shards whose rows changed are ever regenerated.
+"""
+import gzip
+import io
+from xml.sax.saxutils import escape
+
+from django.core.cache import cache
+from django.db.models import Count, F, Max
+from django.urls import reverse
+
+from .metrics import record_cache
+from .models import Caravan, Category, Course, Destination
+
+SHARD_SIZE = 50000
+CHUNK_SIZE = 2000
+CACHE_TIMEOUT = 60 * 60 * 24
+INDEX_CACHE_TIMEOUT = 60 * 5
+
+SECTIONS = {
+    'destinations': lambda: Destination.objects.filter(is_active=True),
+    'courses': lambda: Course.objects.filter(is_active=True),
+    'caravans': lambda: Caravan.objects.filter(is_active=True),
+    'categories': lambda: Category.objects.all(),
+}
+URL_NAMES = {
+    'destinations': ('destination_detail', 'slug'),
+    'courses': ('course_detail', 'slug'),
+    'caravans': ('caravan_detail', 'slug'),
+    'categories': ('destinations_by_category', 'category_slug'),
+}
+
+
+def shard_signatures(section):
+    """Return ``{shard: (row count, newest updated_at)}`` in one grouped query."""
+    queryset = SECTIONS[section]().order_by()
+    rows = (
+        queryset.annotate(shard=(F('pk') - 1) / SHARD_SIZE)
+        .values('shard')
+        .annotate(total=Count('pk'), lastmod=Max('updated_at'))
+        .values_list('shard', 'total', 'lastmod')
+    )
+    return {int(shard): (total, lastmod) for shard, total, lastmod in rows}
+
+
+def _type_locations():
+    return [
+        reverse('destinations_by_type', args=[code])
+        for code, _ in Destination.DESTINATION_TYPES
+    ]
+
+
+def _shard_locations(section, shard):
+    if section == 'types':
+        for location in _type_locations():
+            yield location, None
+        return
+    url_name, kwarg = URL_NAMES[section]
+    # Reversing once and substituting the slug keeps per-row cost to string work
+    marker = 'SLUG-PLACEHOLDER'
+    template = reverse(url_name, kwargs={kwarg: marker})
+    rows = (
+        SECTIONS[section]()
+        .filter(pk__gt=shard * SHARD_SIZE, pk__lte=(shard + 1) * SHARD_SIZE)
+        .order_by('pk')
+        .values_list('slug', 'updated_at')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    for slug, updated_at in rows:
+        yield template.replace(marker, slug), updated_at
+
+
+def render_shard(section, shard, base_url):
+    """Build the gzip-compressed ``<urlset>`` for one shard."""
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as out:
+        out.write(b'<?xml version="1.0" encoding="UTF-8"?>\n'
+                  b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+        for location, lastmod in _shard_locations(section, shard):
+            entry = f'<url><loc>{escape(base_url + location)}</loc>'
+            if lastmod:
+                entry += f'<lastmod>{lastmod.isoformat(timespec="seconds")}</lastmod>'
+            out.write((entry + '</url>\n').encode('utf-8'))
+        out.write(b'</urlset>\n')
+    return buffer.getvalue()
+
+
+def get_shard(section, shard, base_url):
+    """Return cached gzip bytes for a shard, regenerating only if its rows changed.
+
+    Returns ``None`` for a shard that does not exist.
+    """
+    if section == 'types':
+        if shard != 0:
+            return None
+        signature = ('types', len(Destination.DESTINATION_TYPES))
+    else:
+        signature = shard_signatures(section).get(shard)
+        if signature is None:
+            return None
+    key = f'sitemap:{base_url}:{section}:{shard}'
+    cached = cache.get(key)
+    hit = bool(cached) and cached[0] == signature
+    record_cache('sitemap_shard', hit)
+    if hit:
+        return cached[1]
+    content = render_shard(section, shard, base_url)
+    cache.set(key, (signature, content), CACHE_TIMEOUT)
+    return content
+
+
+def get_index(base_url):
+    """Return the sitemap index, cached for a few minutes."""
+    key = f'sitemap:{base_url}:index'
+    content = cache.get(key)
+    record_cache('sitemap_index', content is not None)
+    if content is None:
+        content = render_index(base_url)
+        cache.set(key, content, INDEX_CACHE_TIMEOUT)
+    return content
+
+
+def render_index(base_url):
+    """Build the ``<sitemapindex>`` listing every shard of every section."""
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">',
+    ]
+    shards = [('types', 0, None)]
+    for section in SECTIONS:
+        for shard, (_, lastmod) in sorted(shard_signatures(section).items()):
+            shards.append((section, shard, lastmod))
+    for section, shard, lastmod in shards:
+        location = reverse('sitemap_shard', kwargs={'section': section, 'shard': shard})
+        entry = f'<sitemap><loc>{escape(base_url + location)}</loc>'
+        if lastmod:
+            entry += f'<lastmod>{lastmod.isoformat(timespec="seconds")}</lastmod>'
+        lines.append(entry + '</sitemap>')
+    lines.append('</sitemapindex>')
+    return '\n'.join(lines) + '\n'
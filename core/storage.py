@@ -0,0 +1,133 @@
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import class_prepared
+
+from .metrics import observe
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File storage that keeps one copy of each distinct upload.
+
+    Uploads are hashed (SHA-256) while being streamed to a temporary file
+    inside ``MEDIA_ROOT``. The file is then stored as ``cas/ab/cd/<digest>.ext``;
+    if that content is already stored the temporary copy is dropped and the
+    existing name is returned. ``StoredFile`` keeps a reference count so that
+    ``delete()`` only unlinks the blob when nothing uses it any more.
+    """
+    prefix = 'cas'
+
+    def _blob_name(self, digest, name):
+        ext = os.path.splitext(name)[1].lower()
+        return '/'.join([self.prefix, digest[:2], digest[2:4], digest + ext])
+
+    def _save(self, name, content):
+        from .models import StoredFile
+
+        os.makedirs(self.location, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.location, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            digest = hasher.hexdigest()
+            observe('upload_size_bytes', {'directory': name.split('/')[0] if '/' in name else ''}, size)
+
+            with transaction.atomic():
+                updated = StoredFile.objects.filter(digest=digest).update(ref_count=F('ref_count') + 1)
+                if updated:
+                    stored = StoredFile.objects.get(digest=digest)
+                    if self.exists(stored.name):
+                        return stored.name
+                    # Row survived but the blob did not; write it back below
+                    blob_name = stored.name
+                else:
+                    blob_name = self._blob_name(digest, name)
+                    try:
+                        with transaction.atomic():
+                            StoredFile.objects.create(digest=digest, name=blob_name, size=size, ref_count=1)
+                    except IntegrityError:
+                        # Another worker stored the same content first
+                        StoredFile.objects.filter(digest=digest).update(ref_count=F('ref_count') + 1)
+                        return StoredFile.objects.get(digest=digest).name
+
+                full_path = self.path(blob_name)
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.replace(tmp_path, full_path)
+                tmp_path = None
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+                return blob_name
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def delete(self, name):
+        """Drop one reference to ``name``; the blob is unlinked once the last one is committed.
+
+        Names without a ``StoredFile`` row (legacy ``upload_to`` paths,
+        possibly shared by several rows) are never removed.
+        """
+        from .models import StoredFile
+
+        if not name:
+            return
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(name=name).first()
+            if stored is None:
+                return
+            if stored.ref_count > 1:
+                StoredFile.objects.filter(pk=stored.pk).update(ref_count=F('ref_count') - 1)
+                return
+            stored.delete()
+            # A rollback keeps the file along with the row
+            transaction.on_commit(lambda: self._unlink_unreferenced(stored))
+
+    def _unlink_unreferenced(self, stored):
+        from .models import StoredFile
+
+        if StoredFile.objects.filter(name=stored.name).exists():
+            # Uploaded again since
+            return
+        # One indexed lookup per field: they are all declared with db_index
+        references = sum(
+            model._base_manager.filter(**{field.name: stored.name}).count() for model, field in file_fields()
+        )
+        if references:
+            # Rows written without the storage (bulk_create, raw SQL) still use it
+            StoredFile.objects.create(digest=stored.digest, name=stored.name, size=stored.size, ref_count=references)
+            return
+        super().delete(stored.name)
+
+
+@lru_cache(maxsize=None)
+def file_fields():
+    """``(model, field)`` for every concrete FileField kept in a ``ContentAddressedStorage``."""
+    from django.apps import apps
+    from django.db import models
+
+    return tuple(
+        (model, field)
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField) and isinstance(field.storage, ContentAddressedStorage)
+    )
+
+
+def _forget_file_fields(sender, **kwargs):
+    file_fields.cache_clear()
+
+
+# Models defined later (e.g. in tests) must be picked up
+class_prepared.connect(_forget_file_fields)
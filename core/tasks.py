@@ -0,0 +1,31 @@
+"""Background jobs of the core app (see ``core.jobs``)."""
+from django.apps import apps
+
+from . import jobs, popularity, rollups
+from .images import refresh_image_meta
+
+
+@jobs.job('images.refresh_meta')
+def refresh_image_meta_job(model_label, pk):
+    """Compute size and placeholder of the row's changed images."""
+    instance = apps.get_model(model_label)._base_manager.filter(pk=pk).first()
+    # Deleted before the job ran
+    return instance is not None and refresh_image_meta(instance)
+
+
+@jobs.job('popularity.update')
+def update_popularity():
+    return popularity.update_scores()
+
+
+@jobs.job('jobs.prune')
+def prune_jobs():
+    return jobs.prune()
+
+
+@jobs.job('rollups.reconcile')
+def reconcile_rollups():
+    return {
+        'revenue': len(rollups.reconcile_revenue()),
+        'funnel': len(rollups.reconcile_funnel()),
+    }
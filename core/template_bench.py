@@ -0,0 +1,89 @@
+"""Render-time comparison of the Django and Jinja2 ports of the hot pages.
+
+Contexts are captured from the real views (so they hold the same
+querysets, forms and pagers production renders) and then rendered
+repeatedly by each engine, excluding view and database time.
+"""
+import statistics
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.template import engines
+from django.template.utils import InvalidTemplateEngineError
+from django.test import RequestFactory
+from django.urls import resolve
+from django.utils.module_loading import import_string
+
+from . import views
+from .counters import view_counter
+
+# Templates that have a Jinja2 port under jinja2/
+PORTED_TEMPLATES = ['core/index.html', 'core/caravan_list.html', 'core/caravan_detail.html', 'agency/hotel_base.html']
+
+
+def jinja2_engine():
+    try:
+        return engines['jinja2']
+    except InvalidTemplateEngineError:
+        params = dict(settings.JINJA2_TEMPLATES)
+        return import_string(params.pop('BACKEND'))(params)
+
+
+def capture(url, user=None):
+    """Run the view for ``url`` and return ``(template name, context, request)``."""
+    request = RequestFactory().get(url)
+    request.user = user or AnonymousUser()
+    captured = {}
+
+    def fake_render(request, template_name, context=None, *args, **kwargs):
+        captured.update(template_name=template_name, context=context or {})
+        return HttpResponse()
+
+    match = resolve(request.path_info)
+    with mock.patch.object(views, 'render', fake_render):
+        match.func(request, *match.args, **match.kwargs)
+    # Benchmark renders are not visitors
+    view_counter.reset()
+    return captured['template_name'], captured['context'], request
+
+
+def _evaluate(context):
+    # Slicing, exists() and count() on an evaluated queryset use its cached
+    # rows, which keeps the database out of every timed run
+    for value in context.values():
+        if hasattr(value, '_fetch_all'):
+            value._fetch_all()
+
+
+def render_both(url, user=None):
+    """Return ``{engine name: html}`` for one page."""
+    template_name, context, request = capture(url, user)
+    return {
+        name: engine.get_template(template_name).render(context, request)
+        for name, engine in (('django', engines['django']), ('jinja2', jinja2_engine()))
+    }
+
+
+def compare(url, number=200, user=None):
+    """Time ``number`` renders of the page in each engine; returns per-engine stats in ms."""
+    template_name, context, request = capture(url, user)
+    _evaluate(context)
+    results = {}
+    for name, engine in (('django', engines['django']), ('jinja2', jinja2_engine())):
+        template = engine.get_template(template_name)
+        template.render(context, request)
+        timings = []
+        for _ in range(number):
+            started = time.perf_counter()
+            template.render(context, request)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[name] = {
+            'median': statistics.median(timings),
+            'p95': timings[int(len(timings) * 0.95) - 1],
+            'mean': statistics.fmean(timings),
+        }
+    return template_name, results
@@ -0,0 +1,11 @@
+from django import template
+
+from core.images import lazy_img as lazy_img_html
+
+register = template.Library()
+
+
+@register.simple_tag
+def lazy_img(obj, field_name, alt='', fallback='', **attrs):
+    """{% lazy_img destination 'image' alt=destination.name css_class='card-cover' %}"""
+    return lazy_img_html(obj, field_name, alt=alt, fallback=fallback, **attrs)
@@ -1,3 +1,1527 @@
-from django.test import TestCase
+import gzip
+import importlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache, caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection
+from django.db.models import F
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from . import sitemaps
+from .catalog import CatalogError, import_file
+from .facets import caravan_facets, destination_facets, normalize_caravan_filters, normalize_destination_filters
+from .counters import ViewCounterBuffer, total_views, view_counter, view_counts
+from .popularity import update_scores
+from .search import SearchIndex, normalize_word
+from . import jobs, loadtest, metrics, rollups, search, versions
+from .profiling import ProfilingMiddleware, diff, list_profiles
+from .images import lazy_img
+from .prerender import MANIFEST_NAME, build, output_path
+from .template_bench import render_both
+from .models import ApplicationFunnel, BookingRevenue, Caravan, CaravanBooking, Category, Course, CourseApplication, CourseFullError, Destination, Job, JobResult, StoredFile, Tag, Testimonial, ViewCount
+from .storage import ContentAddressedStorage, file_fields
+from agency.models import Agency
+
+try:
+    import jinja2
+except ImportError:
+    jinja2 = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+@contextmanager
+def assert_queries_outside_cache(test, num):
+    """``assertNumQueries`` not counting reads and writes of the database cache tables."""
+    with CaptureQueriesContext(connection) as captured:
+        yield
+    queries = [
+        query['sql'] for query in captured.captured_queries
+        if '"django_cache' not in query['sql'] and not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))
+    ]
+    test.assertEqual(len(queries), num, '\n'.join(queries))
+
+
+class ContentAddressedStorageTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_duplicate_upload_returns_existing_file(self):
+        first = self.storage.save('agencies/logos/a.png', ContentFile(b'same bytes'))
+        second = self.storage.save('destinations/b.png', ContentFile(b'same bytes'))
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith('cas/'))
+        self.assertEqual(StoredFile.objects.get(name=first).ref_count, 2)
+
+        other = self.storage.save('destinations/c.png', ContentFile(b'other bytes'))
+        self.assertNotEqual(first, other)
+
+    def test_blob_removed_with_last_reference(self):
+        name = self.storage.save('a.txt', ContentFile(b'payload'))
+        self.storage.save('b.txt', ContentFile(b'payload'))
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete(name)
+            # Unlinked only once the delete commits
+            self.assertTrue(self.storage.exists(name))
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_file_fields_are_cached_and_indexed(self):
+        self.assertIs(file_fields(), file_fields())
+        # The last reference's delete counts the rows still naming the blob
+        self.assertEqual([field for _, field in file_fields() if not field.db_index], [])
+
+    def test_unknown_names_are_never_removed(self):
+        with open(self.storage.path('legacy.jpg'), 'wb') as legacy:
+            legacy.write(b'old upload')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.storage.delete('legacy.jpg')
+        self.assertTrue(self.storage.exists('legacy.jpg'))
+
+    def test_model_rows_release_their_files(self):
+        from django.core.files.storage import default_storage
+
+        first = default_storage.save('testimonials/a.jpg', ContentFile(b'first'))
+        second = default_storage.save('testimonials/b.jpg', ContentFile(b'second'))
+        testimonial = Testimonial.objects.create(name='Asha', feedback='Lovely', image=first)
+        with self.captureOnCommitCallbacks(execute=True):
+            testimonial.image = second
+            testimonial.save()
+        self.assertFalse(default_storage.exists(first))
+
+        # A row written without the storage keeps the blob alive
+        Testimonial.objects.bulk_create([Testimonial(name='Ravi', feedback='Good', image=second)])
+        with self.captureOnCommitCallbacks(execute=True):
+            testimonial.delete()
+        self.assertTrue(default_storage.exists(second))
+        self.assertEqual(StoredFile.objects.get(name=second).ref_count, 1)
+
+
+class MediaServingTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        with open(f'{self.media_root}/doc.pdf', 'wb') as fh:
+            fh.write(bytes(range(256)) * 4)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_full_file(self):
+        response = self.client.get('/media/doc.pdf')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(len(b''.join(response.streaming_content)), 1024)
+
+    def test_byte_range(self):
+        response = self.client.get('/media/doc.pdf', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+        response = self.client.get('/media/doc.pdf', HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(252, 256)))
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get('/media/doc.pdf', HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_if_modified_since(self):
+        response = self.client.get('/media/doc.pdf', HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_file_and_traversal(self):
+        self.assertEqual(self.client.get('/media/nope.pdf').status_code, 404)
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 400)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_accel_redirect(self):
+        response = self.client.get('/media/doc.pdf')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/doc.pdf')
+        self.assertEqual(response.content, b'')
+
+        with open(f'{self.media_root}/dakshineswar kali.pdf', 'wb') as fh:
+            fh.write(b'pdf')
+        response = self.client.get('/media/dakshineswar%20kali.pdf')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/dakshineswar%20kali.pdf')
+
+
+class AdminChangelistTest(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'adminpass123')
+        self.client.force_login(self.admin)
+
+    def make_caravan(self, name):
+        return Caravan.objects.create(
+            name=name, description='d', capacity=4, mileage=10, year=2023,
+            daily_rate=1000, weekly_rate=6000, security_deposit=5000,
+            pickup_locations='Kolkata', max_distance=500,
+        )
+
+    def test_changelists_render(self):
+        for name in ['destinationimage', 'testimonial', 'pointofinterest', 'courseapplication', 'caravanbooking']:
+            response = self.client.get(reverse(f'admin:core_{name}_changelist'))
+            self.assertEqual(response.status_code, 200, name)
+
+    def test_catalog_import_page(self):
+        response = self.client.get(reverse('admin:core_destination_import'))
+        self.assertEqual(response.status_code, 200)
+        upload = SimpleUploadedFile('catalog.csv', (
+            b'name,location,description,price_per_person,duration,destination_type\n'
+            b'Bishnupur,Bankura,Terracotta temples,3500,2,historical\n'
+        ))
+        response = self.client.post(reverse('admin:core_destination_import'), {'catalog': upload})
+        self.assertRedirects(response, reverse('admin:core_destination_changelist'))
+        self.assertTrue(Destination.objects.filter(slug='bishnupur').exists())
+
+    def test_caravan_list_editable_bulk_update(self):
+        first, second = self.make_caravan('Alpha'), self.make_caravan('Beta')
+        self.assertEqual(caravan_facets(normalize_caravan_filters({}))['total'], 2)
+        response = self.client.post(reverse('admin:core_caravan_changelist'), {
+            'form-TOTAL_FORMS': '2',
+            'form-INITIAL_FORMS': '2',
+            'form-0-id': first.pk,
+            'form-0-is_featured': 'on',
+            'form-0-is_available': 'on',
+            'form-1-id': second.pk,
+            '_save': 'Save',
+        })
+        self.assertEqual(response.status_code, 302)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertTrue(first.is_featured)
+        self.assertFalse(second.is_available)
+        self.assertEqual(caravan_facets(normalize_caravan_filters({}))['total'], 1)
+
+    @skipUnless(connection.vendor == 'sqlite', 'plans are checked on SQLite')
+    def test_searches_use_indexes(self):
+        from django.contrib import admin
+        from django.test import RequestFactory
+        request = RequestFactory().get('/')
+        for model, term in [
+            (Destination, 'Darj'), (Testimonial, 'Asha'), (CourseApplication, 'asha@example.com'),
+            (CaravanBooking, 'asha@example.com'),
+        ]:
+            model_admin = admin.site._registry[model]
+            queryset, _ = model_admin.get_search_results(request, model.objects.all(), term)
+            plan = queryset.explain()
+            self.assertNotIn(f'SCAN {model._meta.db_table}', plan, model.__name__)
+            self.assertIn('USING INDEX', plan, model.__name__)
+
+    def test_estimated_count_past_the_last_page(self):
+        from .admin import EstimatedCountPaginator
+        tags = [Tag.objects.create(name=f'tag {i}', slug=f'tag-{i}') for i in range(6)]
+        Tag.objects.filter(pk__in=[tag.pk for tag in tags[1:5]]).delete()
+        paginator = EstimatedCountPaginator(Tag.objects.order_by('pk'), 1)
+        paginator.exact_below = 0
+        self.assertGreaterEqual(paginator.count, 6)
+        page = paginator.page(3)
+        self.assertEqual((page.number, list(page.object_list)), (2, [tags[5]]))
+        self.assertEqual((paginator.count, paginator.num_pages), (2, 2))
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from django.contrib.auth.models import Permission
+        self.staff = User.objects.create_user('staff', 'staff@example.com', 'staffpass123', is_staff=True)
+        self.staff.user_permissions.add(Permission.objects.get(codename='view_courseapplication'))
+        guide = Course.objects.create(name='Tour Guide Basics', description='d')
+        other = Course.objects.create(name='Local Cuisine', description='d')
+        CourseApplication.objects.create(course=guide, full_name='Asha Sen', email='asha@example.com', status='approved')
+        CourseApplication.objects.create(course=other, full_name='Bimal Roy', email='bimal@example.com')
+
+    def test_requires_staff(self):
+        response = self.client.get(reverse('export_data', args=['applications']))
+        self.assertEqual(response.status_code, 302)
+
+    def test_requires_view_permission_for_the_model(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('export_data', args=['bookings']))
+        self.assertEqual(response.status_code, 403)
+
+    def test_csv_export_with_filters(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('export_data', args=['applications']), {'course': 'tour-guide-basics'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Asha Sen', lines[1])
+
+    def test_gzip_jsonl_export(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('export_data', args=['applications']), {'format': 'jsonl', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual({row['full_name'] for row in rows}, {'Asha Sen', 'Bimal Roy'})
+
+
+class CatalogImportTest(TestCase):
+    def jsonl(self, *records):
+        return io.StringIO(''.join(json.dumps(record) + '\n' for record in records))
+
+    def record(self, name, **extra):
+        record = {
+            'name': name, 'location': 'West Bengal', 'description': 'd', 'price_per_person': '4999',
+            'duration': 2, 'destination_type': 'beach', 'image': 'destinations/x.jpg',
+        }
+        record.update(extra)
+        return record
+
+    def test_import_with_children_and_unique_slugs(self):
+        Destination.objects.create(
+            name='Digha', location='x', description='d', price_per_person=1, duration=1, destination_type='beach',
+        )
+        stats = import_file(self.jsonl(
+            self.record('Digha', tags=['Beach', 'Weekend'], images=['gallery/a.jpg'],
+                        points_of_interest=[{'name': 'Old Digha', 'x_percent': 10, 'y_percent': 20}]),
+            self.record('Digha', tags=['Beach']),
+        ), 'jsonl', batch_size=1)
+        self.assertEqual(stats, {'created': 2, 'updated': 0})
+        self.assertEqual(
+            sorted(Destination.objects.values_list('slug', flat=True)), ['digha', 'digha-2', 'digha-3']
+        )
+        imported = Destination.objects.get(slug='digha-2')
+        self.assertEqual(sorted(imported.tags.values_list('name', flat=True)), ['Beach', 'Weekend'])
+        self.assertEqual(imported.images.count(), 1)
+        self.assertEqual(imported.points_of_interest.get().name, 'Old Digha')
+
+    def test_csv_upsert_updates_existing(self):
+        import_file(self.jsonl(self.record('Mandarmani')), 'jsonl')
+        csv_data = io.StringIO('slug,name,price_per_person,tags\nmandarmani,Mandarmani,2500,Beach|Sea\n')
+        stats = import_file(csv_data, 'csv', upsert=True)
+        self.assertEqual(stats, {'created': 0, 'updated': 1})
+        destination = Destination.objects.get(slug='mandarmani')
+        self.assertEqual(destination.price_per_person, 2500)
+        self.assertEqual(destination.tags.count(), 2)
+
+    def test_upsert_refreshes_category_counts(self):
+        import_file(self.jsonl(self.record('Mandarmani')), 'jsonl')
+        category = Category.objects.create(name='Beaches')
+        category.destinations.add(Destination.objects.get(slug='mandarmani'))
+        category.refresh_from_db()
+        self.assertEqual(category.destination_count, 1)
+        import_file(io.StringIO('slug,name,is_active\nmandarmani,Mandarmani,no\n'), 'csv', upsert=True)
+        category.refresh_from_db()
+        self.assertEqual(category.destination_count, 0)
+
+    def test_upsert_keeps_child_sets_the_record_has_no_column_for(self):
+        import_file(self.jsonl(self.record('Mandarmani', tags=['Beach'], images=['gallery/a.jpg'])), 'jsonl')
+        import_file(io.StringIO('slug,name,price_per_person\nmandarmani,Mandarmani,2500\n'), 'csv', upsert=True)
+        destination = Destination.objects.get(slug='mandarmani')
+        self.assertEqual(list(destination.tags.values_list('name', flat=True)), ['Beach'])
+        self.assertEqual(list(destination.images.values_list('image', flat=True)), ['gallery/a.jpg'])
+
+        import_file(self.jsonl({'slug': 'mandarmani', 'name': 'Mandarmani', 'tags': []}), 'jsonl', upsert=True)
+        self.assertFalse(destination.tags.exists())
+        self.assertEqual(destination.images.count(), 1)
+
+    def test_invalid_values_name_the_record(self):
+        catalog = tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False)
+        self.addCleanup(os.remove, catalog.name)
+        with catalog:
+            for record in [self.record('Digha'), self.record('Bakkhali', price_per_person='abc')]:
+                catalog.write(json.dumps(record) + '\n')
+        with self.assertRaisesMessage(CommandError, "Record 2: invalid price_per_person 'abc'"):
+            call_command('import_destinations', catalog.name, '--batch-size', '1', stdout=io.StringIO())
+        # The first record's batch was rolled back with the rest
+        self.assertFalse(Destination.objects.exists())
+        with self.assertRaisesMessage(CatalogError, "Record 1: unknown destination_type 'volcano'"):
+            import_file(self.jsonl(self.record('Digha', destination_type='volcano')), 'jsonl')
+        with self.assertRaisesMessage(CatalogError, "Record 1: point of interest 'Old Digha' is missing y_percent"):
+            import_file(self.jsonl(self.record(
+                'Digha', points_of_interest=[{'name': 'Old Digha', 'x_percent': 10}],
+            )), 'jsonl')
+
+    def test_upsert_applies_repeated_slugs_in_turn(self):
+        stats = import_file(self.jsonl(
+            self.record('Digha', tags=['Beach'], images=['gallery/a.jpg'],
+                        points_of_interest=[{'name': 'Old Digha', 'x_percent': 10, 'y_percent': 20}]),
+            {'slug': 'digha', 'name': 'Digha', 'price_per_person': '2500', 'images': ['gallery/b.jpg']},
+        ), 'jsonl', upsert=True)
+        self.assertEqual(stats, {'created': 1, 'updated': 0})
+        destination = Destination.objects.get()
+        self.assertEqual((destination.slug, destination.price_per_person), ('digha', 2500))
+        self.assertEqual(list(destination.images.values_list('image', flat=True)), ['gallery/b.jpg'])
+        self.assertEqual(destination.points_of_interest.count(), 1)
+        self.assertEqual(list(destination.tags.values_list('name', flat=True)), ['Beach'])
+
+
+class CourseSeatTest(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(name='Travel Photography', description='d', max_students=2)
+
+    def apply(self, name):
+        return self.client.post(reverse('course_detail', args=[self.course.slug]), {
+            'full_name': name, 'email': f'{name.lower()}@example.com',
+        })
+
+    def test_applications_stop_when_full(self):
+        self.apply('Asha')
+        self.apply('Bimal')
+        response = self.apply('Chitra')
+        self.assertContains(response, 'this course is full')
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 2)
+        self.assertEqual(self.course.applications.count(), 2)
+
+    def test_status_changes_and_deletes_release_seats(self):
+        first = CourseApplication.objects.create(course=self.course, full_name='Asha', email='a@example.com')
+        second = CourseApplication.objects.create(course=self.course, full_name='Bimal', email='b@example.com')
+        with self.assertRaises(CourseFullError):
+            CourseApplication.objects.create(course=self.course, full_name='Chitra', email='c@example.com')
+
+        first.status = 'rejected'
+        first.save()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_left, 1)
+
+        CourseApplication.objects.filter(pk=second.pk).delete()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 0)
+
+    def test_moving_to_another_course_moves_the_seat(self):
+        other = Course.objects.create(name='Local Cuisine', description='d', max_students=1)
+        application = CourseApplication.objects.create(course=self.course, full_name='Asha', email='a@example.com')
+        application = CourseApplication.objects.get(pk=application.pk)
+        application.course = other
+        application.save()
+        self.course.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.course.seats_taken, other.seats_taken), (0, 1))
+
+        second = CourseApplication.objects.create(course=self.course, full_name='Bimal', email='b@example.com')
+        second.course = other
+        with self.assertRaises(CourseFullError):
+            second.save()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.seats_taken, 1)
+
+        application.delete()
+        other.refresh_from_db()
+        self.assertEqual(other.seats_taken, 0)
+
+    def test_course_list_shows_seats_without_per_row_queries(self):
+        Course.objects.create(name='Local Cuisine', description='d')
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('courses'))
+        self.assertContains(response, '2 seats left')
+
+
+@override_settings(VIEW_COUNTER_FLUSH_INTERVAL=3600)
+class ViewCounterTest(TestCase):
+    def setUp(self):
+        view_counter.reset()
+        self.addCleanup(view_counter.reset)
+        self.course = Course.objects.create(name='Bengali for Travellers', description='d')
+
+    def test_views_are_buffered_then_flushed_once(self):
+        for _ in range(3):
+            self.client.get(reverse('course_detail', args=[self.course.slug]))
+        self.assertFalse(ViewCount.objects.exists())
+        self.assertEqual(view_counter.flush(), 1)
+        self.assertEqual(view_counter.flush(), 0)
+        self.assertEqual(ViewCount.objects.get(kind='course', object_id=self.course.pk).count, 3)
+
+        self.client.get(reverse('course_detail', args=[self.course.slug]))
+        view_counter.flush()
+        self.assertEqual(view_counts('course', [self.course.pk]), {self.course.pk: 4})
+        self.assertEqual(total_views(), 4)
+        with assert_queries_outside_cache(self, 0):
+            self.assertEqual(total_views(), 4)
+        self.client.get(reverse('course_detail', args=[self.course.slug]))
+        view_counter.flush()
+        self.assertEqual(total_views(), 5)
+
+    def test_failed_flush_keeps_deltas(self):
+        buffer = ViewCounterBuffer(interval=3600)
+        buffer.record('course', self.course.pk, 2)
+        with mock.patch.object(buffer, '_write', side_effect=DatabaseError):
+            with self.assertLogs('core.counters', 'ERROR'):
+                self.assertEqual(buffer.flush(), 0)
+        buffer.record('course', self.course.pk)
+        buffer.flush()
+        self.assertEqual(ViewCount.objects.get(object_id=self.course.pk).count, 3)
+
+
+class PopularityTest(TestCase):
+    def make_destination(self, name, location):
+        return Destination.objects.create(
+            name=name, location=location, description='d', price_per_person=1000, duration=2,
+            destination_type='beach', is_featured=True, image='destinations/x.jpg',
+        )
+
+    def test_scores_decay_and_drive_home_ordering(self):
+        quiet = self.make_destination('Bakkhali', 'South 24 Parganas')
+        busy = self.make_destination('Digha', 'Purba Medinipur')
+        ViewCount.objects.create(kind='destination', object_id=busy.pk, count=40)
+        Testimonial.objects.create(name='Asha', feedback='Lovely', rating=5, destination=quiet)
+
+        start = timezone.now()
+        update_scores(now=start)
+        busy.refresh_from_db()
+        quiet.refresh_from_db()
+        self.assertEqual(busy.popularity, 40)
+        self.assertEqual(quiet.popularity, 20)
+
+        # Nothing new: a week later every score has halved
+        update_scores(now=start + timedelta(days=7))
+        busy.refresh_from_db()
+        self.assertAlmostEqual(busy.popularity, 20)
+
+        response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['popular_cities'], ['Purba Medinipur', 'South 24 Parganas'])
+        self.assertEqual(list(response.context['featured_destinations']), [busy, quiet])
+
+    def test_scores_are_written_in_batches(self):
+        destinations = Destination.objects.bulk_create([
+            Destination(
+                name=f'Place {i}', slug=f'place-{i}', location='x', description='d', price_per_person=1,
+                duration=1, destination_type='beach',
+            )
+            for i in range(650)
+        ])
+        ViewCount.objects.bulk_create([
+            ViewCount(kind='destination', object_id=destination.pk, count=i + 1)
+            for i, destination in enumerate(destinations)
+        ])
+        with CaptureQueriesContext(connection) as captured:
+            self.assertEqual(update_scores(), 650)
+        updates = [query['sql'] for query in captured.captured_queries if query['sql'].startswith('UPDATE')]
+        # Three batches of view counts and three of scores
+        self.assertEqual(len(updates), 6)
+        self.assertEqual(Destination.objects.get(slug='place-649').popularity, 650)
+        self.assertFalse(ViewCount.objects.filter(scored_count__lt=F('count')).exists())
+
+
+class SitemapTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.destination = Destination.objects.create(
+            name='Shantiniketan', location='Birbhum', description='d', price_per_person=1500, duration=2,
+            destination_type='cultural',
+        )
+
+    def shard(self, section):
+        response = self.client.get(reverse('sitemap_shard', kwargs={'section': section, 'shard': 0}))
+        self.assertEqual(response.status_code, 200)
+        return gzip.decompress(response.content).decode()
+
+    def test_index_lists_shards(self):
+        response = self.client.get(reverse('sitemap_index'))
+        self.assertContains(response, '/sitemaps/destinations-0.xml.gz')
+        self.assertContains(response, '/sitemaps/types-0.xml.gz')
+        self.assertNotContains(response, '/sitemaps/courses-0.xml.gz')
+
+    def test_shard_regenerated_only_when_rows_change(self):
+        self.assertIn('/destinations/shantiniketan/', self.shard('destinations'))
+        with mock.patch('core.sitemaps.render_shard', wraps=sitemaps.render_shard) as render:
+            self.shard('destinations')
+            self.assertEqual(render.call_count, 0)
+            Destination.objects.create(
+                name='Bolpur', location='Birbhum', description='d', price_per_person=900, duration=1,
+                destination_type='cultural',
+            )
+            self.assertIn('/destinations/bolpur/', self.shard('destinations'))
+            self.assertEqual(render.call_count, 1)
+
+    def test_unknown_shard(self):
+        response = self.client.get(reverse('sitemap_shard', kwargs={'section': 'destinations', 'shard': 3}))
+        self.assertEqual(response.status_code, 404)
+
+
+class PrerenderTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.addCleanup(view_counter.reset)
+        self.destination = Destination.objects.create(
+            name='Bishnupur', location='Bankura', description='Terracotta temples', price_per_person=1200,
+            duration=2, destination_type='historical', image='destinations/bishnupur.jpg',
+        )
+
+    def test_incremental_build(self):
+        rendered, skipped, removed = build(self.root)
+        self.assertGreater(rendered, 0)
+        self.assertEqual((skipped, removed), (0, 0))
+        page = output_path(self.root, reverse('destination_detail', args=[self.destination.slug]))
+        self.assertIn(b'Terracotta temples', page.read_bytes())
+        self.assertTrue((page.parents[2] / MANIFEST_NAME).exists())
+
+        self.assertEqual(build(self.root), (0, rendered, 0))
+
+        Destination.objects.filter(pk=self.destination.pk).update(
+            description='Baluchari saris', updated_at=timezone.now() + timedelta(seconds=1),
+        )
+        # The detail page and its type listing are the only pages that read this row
+        self.assertEqual(build(self.root), (2, rendered - 2, 0))
+        self.assertIn(b'Baluchari saris', page.read_bytes())
+
+        # The detail page also lists its gallery, POIs and testimonials
+        Testimonial.objects.create(name='Asha', feedback='Lovely terracotta', destination=self.destination)
+        self.assertEqual(build(self.root), (1, rendered - 1, 0))
+
+    def test_removed_pages_are_deleted(self):
+        build(self.root)
+        page = output_path(self.root, reverse('destination_detail', args=[self.destination.slug]))
+        self.destination.is_active = False
+        self.destination.save()
+        rendered, skipped, removed = build(self.root)
+        self.assertEqual(removed, 1)
+        self.assertFalse(page.exists())
+        self.assertFalse(ViewCount.objects.exists())
+
+
+@skipUnless(jinja2, 'jinja2 is not installed')
+class Jinja2ParityTest(TestCase):
+    """The Jinja2 ports must render the same markup as the Django templates."""
+
+    def setUp(self):
+        self.addCleanup(view_counter.reset)
+        for n in range(4):
+            Destination.objects.create(
+                name=f'Digha {n}', location='Purba Medinipur', description='Sea beach', price_per_person=2500,
+                duration=3, destination_type='beach', is_featured=True, image='destinations/digha.jpg',
+                near_beach=n % 2 == 0,
+            )
+        Testimonial.objects.create(name='Asha', position='Teacher', feedback='Lovely trip', rating=4,
+                                   destination=Destination.objects.first())
+        for n in range(11):
+            Caravan.objects.create(
+                name=f'Roamer {n}', description='Sleeps four', capacity=4, mileage=10, year=2023,
+                daily_rate=1000 + n, weekly_rate=6000, security_deposit=5000, pickup_locations='Kolkata',
+                max_distance=500, is_featured=n < 2, has_ac=n % 2 == 0, has_kitchen=True,
+            )
+
+    def assertSameMarkup(self, url):
+        html = render_both(url)
+        # Masked CSRF tokens differ per call, and the engines escape quotes differently
+        normalized = {
+            name: re.sub(r'\s+', '', re.sub(r'value="[A-Za-z0-9]{64}"', '', text.replace('&#x27;', '&#39;')))
+            for name, text in html.items()
+        }
+        self.assertEqual(normalized['django'], normalized['jinja2'])
+        return html['jinja2']
+
+    def test_home(self):
+        self.assertIn('Digha 3', self.assertSameMarkup('/'))
+
+    def test_caravan_list(self):
+        self.assertSameMarkup('/caravans/')
+        self.assertIn('Roamer 9', self.assertSameMarkup('/caravans/?page=2'))
+
+    def test_caravan_detail(self):
+        self.assertIn('Sleeps four', self.assertSameMarkup(reverse('caravan_detail', args=['roamer-1'])))
+
+    def test_travel_agency(self):
+        Agency.objects.create(name='Sundarban Trails', email='hello@example.com', description='Boat safaris',
+                              approved=True)
+        html = self.assertSameMarkup(reverse('hotel'))
+        self.assertIn('Sundarban Trails', html)
+        self.assertIn('Roamer 1', html)
+
+
+class ProfilingMiddlewareTest(TestCase):
+    def setUp(self):
+        profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, profile_dir, ignore_errors=True)
+        settings_override = override_settings(PROFILE_DIR=profile_dir, PROFILE_TOKEN='let-me-in', PROFILE_KEEP=3)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_disabled_without_token_or_sampling(self):
+        with override_settings(PROFILE_TOKEN=None, PROFILE_SAMPLE_RATE=0):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: None)
+
+    def test_profiles_only_authorized_requests(self):
+        self.assertNotIn('X-Profile-Id', self.client.get('/about/'))
+        self.assertNotIn('X-Profile-Id', self.client.get('/about/', HTTP_X_PROFILE='wrong'))
+        self.assertEqual(list_profiles(), [])
+
+        response = self.client.get('/about/', HTTP_X_PROFILE='let-me-in')
+        [summary] = list_profiles()
+        self.assertEqual(response['X-Profile-Id'], summary['id'])
+        self.assertEqual((summary['url_name'], summary['status']), ('about', 200))
+
+    def test_rotation_and_diff(self):
+        for _ in range(4):
+            self.client.get('/about/', HTTP_X_PROFILE='let-me-in')
+        self.client.get('/contact/', HTTP_X_PROFILE='let-me-in')
+        self.assertEqual([summary['url_name'] for summary in list_profiles()], ['about', 'about', 'contact'])
+
+        changes = diff('about', 'contact')
+        self.assertTrue(changes)
+        out = io.StringIO()
+        call_command('profiles', 'list', '--by-url', stdout=out)
+        self.assertIn('contact', out.getvalue())
+        call_command('profiles', 'aggregate', 'about', stdout=out)
+        self.assertIn('2 profile(s) merged', out.getvalue())
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_endpoint_reports_requests_templates_and_queries(self):
+        self.client.get('/about/')
+        body = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-me').content.decode()
+        self.assertIn(
+            'http_request_duration_seconds_count{method="GET",route="about",status="200"} 1', body,
+        )
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="about",status="200",le="+Inf"} 1',
+                      body)
+        self.assertIn('template_render_duration_seconds_count{template="core/about.html"} 1', body)
+
+    def test_cache_hit_ratio(self):
+        cache.clear()
+        self.client.get(reverse('sitemap_index'))
+        self.client.get(reverse('sitemap_index'))
+        counters, _ = metrics.collect()
+        self.assertEqual(counters['cache_requests_total', (('cache', 'sitemap_index'), ('result', 'hit'))], 1)
+        self.assertEqual(counters['cache_requests_total', (('cache', 'sitemap_index'), ('result', 'miss'))], 1)
+
+    def test_workers_are_summed_from_shared_directory(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        other_worker = {
+            'counters': [['db_queries_total', [['route', 'home']], 4]],
+            'histograms': [['upload_size_bytes', [['directory', 'agencies']], [1] + [0] * 8 + [2048, 1]]],
+        }
+        with open(f'{directory}/1-1.json', 'w') as fh:
+            json.dump(other_worker, fh)
+        with override_settings(METRICS_DIR=directory):
+            metrics.inc('db_queries_total', {'route': 'home'}, 3)
+            metrics.observe('upload_size_bytes', {'directory': 'agencies'}, 4096)
+            body = metrics.render_prometheus()
+        self.assertIn('db_queries_total{route="home"} 7', body)
+        self.assertIn('upload_size_bytes_bucket{directory="agencies",le="1024"} 1', body)
+        self.assertIn('upload_size_bytes_bucket{directory="agencies",le="10240"} 2', body)
+        self.assertIn('upload_size_bytes_count{directory="agencies"} 2', body)
+
+    def test_large_values_are_written_exactly(self):
+        metrics.inc('db_queries_total', {'route': 'home'}, 1234567)
+        metrics.inc('db_queries_total', {'route': 'home'}, 2)
+        metrics.inc('db_query_duration_seconds_total', {'route': 'home'}, 1234567.25)
+        metrics.observe('upload_size_bytes', {'directory': 'agencies'}, 50 * 1024 ** 2)
+        body = metrics.render_prometheus()
+        self.assertIn('db_queries_total{route="home"} 1234569.0\n', body)
+        self.assertIn('db_query_duration_seconds_total{route="home"} 1234567.25\n', body)
+        self.assertIn('upload_size_bytes_bucket{directory="agencies",le="104857600"} 1', body)
+        self.assertIn('upload_size_bytes_sum{directory="agencies"} 52428800\n', body)
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_endpoint_is_internal(self):
+        # Behind a proxy on the same host every request comes from localhost
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').status_code, 404)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer guessed')
+        self.assertEqual(response.status_code, 404)
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5').status_code, 200)
+
+
+class ImageMetaTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def png(self, width, height):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, height), (30, 120, 200)).save(buffer, 'PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+
+    def create_destination(self, **kwargs):
+        return Destination.objects.create(
+            name='Mandarmani', location='Purba Medinipur', description='d', price_per_person=1800, duration=2,
+            destination_type='beach', **kwargs,
+        )
+
+    def test_meta_computed_once_on_upload(self):
+        destination = self.create_destination(image=self.png(640, 480))
+        self.assertEqual(jobs.run_pending(), 1)
+        meta = Destination.objects.get(pk=destination.pk).image_meta['image']
+        self.assertEqual((meta['width'], meta['height']), (640, 480))
+        self.assertTrue(meta['placeholder'].startswith('data:image/jpeg;base64,'))
+        self.assertLess(len(meta['placeholder']), 1000)
+
+        destination.refresh_from_db()
+        with mock.patch('core.images.image_info') as image_info:
+            destination.name = 'Mandarmoni'
+            destination.save()
+            self.assertEqual(jobs.run_pending(), 0)
+            self.assertFalse(image_info.called)
+
+        html = lazy_img(destination, 'image', alt='Beach', css_class='card-cover')
+        self.assertIn('width="640" height="480"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertIn('class="card-cover"', html)
+        self.assertIn('background-image:url(data:image/jpeg;base64,', html)
+
+    def test_backfill_and_listing_markup(self):
+        destination = self.create_destination(image=self.png(300, 200))
+        Destination.objects.filter(pk=destination.pk).update(image_meta={})
+        call_command('backfill_image_meta', stdout=io.StringIO())
+        self.assertEqual(Destination.objects.get(pk=destination.pk).image_meta['image']['width'], 300)
+
+        response = self.client.get(reverse('destination_list'))
+        self.assertContains(response, 'width="300" height="200"')
+        self.assertNotContains(response, "background-image: url('/media/")
+
+    def test_missing_file_is_not_retried(self):
+        destination = self.create_destination(image='destinations/missing.jpg')
+        jobs.run_pending()
+        destination.refresh_from_db()
+        self.assertEqual(destination.image_meta, {'image': {'name': 'destinations/missing.jpg'}})
+        self.assertIn('src="/media/destinations/missing.jpg"', lazy_img(destination, 'image'))
+
+
+class DestinationFacetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hills = Tag.objects.create(name='Hills', slug='hills')
+        for name, kind, price, beds, days, mountain in [
+            ('Darjeeling', 'mountain', 4000, 2, 4, True),
+            ('Kalimpong', 'mountain', 2500, 1, 2, True),
+            ('Digha', 'beach', 1500, 3, 2, False),
+            ('Mandarmani', 'beach', 6000, 2, 7, False),
+        ]:
+            destination = Destination.objects.create(
+                name=name, location='West Bengal', description='d', price_per_person=price, duration=days,
+                destination_type=kind, bed_count=beds, near_mountain=mountain,
+            )
+            if mountain:
+                destination.tags.add(self.hills)
+
+    def facets(self, **data):
+        return destination_facets(normalize_destination_filters(data))
+
+    def option(self, options, value):
+        return next(option for option in options if option['value'] == value)
+
+    def test_counts_exclude_their_own_group(self):
+        facets = self.facets(destination_type=['beach'], duration=['1-2'])
+        self.assertEqual(facets['total'], 1)
+        # Type counts ignore the type filter but honour the duration filter
+        self.assertEqual(self.option(facets['type'], 'mountain')['count'], 1)
+        self.assertEqual(self.option(facets['type'], 'beach')['count'], 1)
+        self.assertTrue(self.option(facets['type'], 'beach')['selected'])
+        self.assertEqual(self.option(facets['duration'], '6-')['count'], 1)
+        self.assertEqual(self.option(facets['tags'], 'hills')['count'], 0)
+        self.assertEqual(self.option(facets['beds'], '3')['count'], 1)
+        self.assertEqual(self.option(facets['beds'], '4')['count'], 0)
+
+    def test_price_histogram_and_bounds(self):
+        facets = self.facets(price_limit=3000)
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(facets['price_bounds'], {'min': 1500, 'max': 6000})
+        counts = {bucket['value']: bucket['count'] for bucket in facets['price_histogram']}
+        self.assertEqual(counts['0-2000'], 1)
+        self.assertEqual(counts['2000-5000'], 2)
+        self.assertEqual(counts['5000-10000'], 1)
+
+    def test_one_aggregate_query_then_cached(self):
+        with assert_queries_outside_cache(self, 2):  # the tag list and the aggregate
+            self.facets(destination='dar', near_mountain=True, min_beds=2, tags=['hills'], price_min=1000)
+        with assert_queries_outside_cache(self, 0):
+            self.facets(tags=['hills'], price_min=1000, min_beds=2, near_mountain=True, destination='Dar ')
+
+    def test_saving_a_destination_invalidates(self):
+        self.assertEqual(self.facets()['total'], 4)
+        Destination.objects.get(name='Digha').delete()
+        self.assertEqual(self.facets()['total'], 3)
+        Destination.objects.filter(name='Mandarmani').first().tags.add(self.hills)
+        self.assertEqual(self.option(self.facets()['tags'], 'hills')['count'], 3)
+
+    def test_list_view_filters_and_renders_slider(self):
+        response = self.client.get(reverse('destination'), {'destination_type': 'mountain', 'min_beds': '2'})
+        self.assertEqual([d.name for d in response.context['destinations']], ['Darjeeling'])
+        self.assertContains(response, 'class="range-slider"')
+        self.assertContains(response, 'min="4000" max="4000"')
+        self.assertContains(response, 'js/range.js')
+
+
+class CaravanFacetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        for name, kind, capacity, rate, fuel, ac in [
+            ('Roamer', 'family', 4, 2500, 'diesel', True),
+            ('Nomad', 'family', 6, 4000, 'petrol', False),
+            ('Drifter', 'compact', 2, 3000, 'diesel', True),
+            ('Voyager', 'luxury', 8, 9000, 'diesel', True),
+        ]:
+            Caravan.objects.create(
+                name=name, caravan_type=kind, description='d', capacity=capacity, mileage=10, year=2023,
+                daily_rate=rate, weekly_rate=rate * 6, security_deposit=5000, pickup_locations='Kolkata',
+                max_distance=500, fuel_type=fuel, has_ac=ac,
+            )
+
+    def facets(self, **data):
+        return caravan_facets(normalize_caravan_filters(data))
+
+    def counts(self, options):
+        return {option['value']: option['count'] for option in options}
+
+    def test_counts_in_one_query(self):
+        with assert_queries_outside_cache(self, 1):
+            facets = self.facets(caravan_type='family', has_ac=True)
+        self.assertEqual(facets['total'], 1)
+        types = self.counts(facets['type'])
+        self.assertEqual((types['family'], types['compact'], types['luxury'], types['eco']), (1, 1, 1, 0))
+        amenities = self.counts(facets['amenities'])
+        self.assertEqual(amenities['has_ac'], 1)
+        self.assertEqual(amenities['has_generator'], 1)
+        self.assertEqual(self.counts(facets['price'])['1000-3000'], 1)
+        with assert_queries_outside_cache(self, 0):
+            self.facets(has_ac=True, caravan_type='family')
+        # Bands are inclusive, so 3000 counts toward both neighbouring price bands
+        prices = self.counts(self.facets()['price'])
+        self.assertEqual((prices['1000-3000'], prices['3000-5000'], prices['8000+']), (2, 2, 1))
+
+    @override_settings(CARAVAN_PRICE_BANDS=[('cheap', 'Cheap', 0, 3000), ('dear', 'Dear', 3001, None)])
+    def test_bands_are_configurable(self):
+        self.assertEqual(self.counts(self.facets()['price']), {'cheap': 2, 'dear': 2})
+        response = self.client.get(reverse('caravan_list'), {'price_range': 'dear', 'fuel_type': 'diesel'})
+        self.assertEqual([c.name for c in response.context['caravans']], ['Voyager'])
+        self.assertContains(response, '<option value="cheap">Cheap (2)</option>', html=True)
+
+    def test_saving_a_caravan_invalidates(self):
+        self.assertEqual(self.facets()['total'], 4)
+        Caravan.objects.filter(name='Nomad').get().delete()
+        self.assertEqual(self.facets()['total'], 3)
+
+
+class CategoryMembershipTest(TestCase):
+    def make_destination(self, name, *tags):
+        destination = Destination.objects.create(
+            name=name, location='West Bengal', description='d', price_per_person=1000, duration=2,
+            destination_type='mountain',
+        )
+        destination.tags.add(*tags)
+        return destination
+
+    def test_migration_uses_exact_tag_matches(self):
+        from django.apps import apps
+
+        hills = Tag.objects.create(name='Hills', slug='hills')
+        stations = Tag.objects.create(name='Hill Stations', slug='hill-stations')
+        darjeeling = self.make_destination('Darjeeling', hills)
+        self.make_destination('Kurseong', stations)
+        category = Category.objects.create(name='Hills', slug='hills')
+
+        migration = importlib.import_module('core.migrations.0014_category_destinations')
+        migration.memberships_from_tags(apps, None)
+        category.refresh_from_db()
+        self.assertEqual(list(category.destinations.all()), [darjeeling])
+        self.assertEqual(category.destination_count, 1)
+
+    def test_counts_follow_membership_and_activity(self):
+        category = Category.objects.create(name='Heritage', slug='heritage')
+        bishnupur = self.make_destination('Bishnupur')
+        murshidabad = self.make_destination('Murshidabad')
+
+        def count():
+            category.refresh_from_db()
+            return category.destination_count
+
+        category.destinations.add(bishnupur, murshidabad)
+        self.assertEqual(count(), 2)
+        bishnupur.is_active = False
+        bishnupur.save()
+        self.assertEqual(count(), 1)
+        murshidabad.categories.clear()
+        self.assertEqual(count(), 0)
+        bishnupur.is_active = True
+        bishnupur.save()
+        self.assertEqual(count(), 1)
+        bishnupur.delete()
+        self.assertEqual(count(), 0)
+
+    def test_category_page_and_home_block(self):
+        category = Category.objects.create(name='Heritage', slug='heritage')
+        Category.objects.create(name='Empty', slug='empty')
+        category.destinations.add(self.make_destination('Bishnupur'))
+        self.make_destination('Bishnupur Heritage Walk')
+
+        response = self.client.get(reverse('destinations_by_category', args=['heritage']))
+        self.assertEqual([d.name for d in response.context['destinations']], ['Bishnupur'])
+
+        response = self.client.get(reverse('home'))
+        self.assertEqual(list(response.context['categories']), [category])
+        self.assertContains(response, '/category/heritage/')
+
+
+class VersionTokenTest(TestCase):
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+            'OPTIONS': {'MAX_ENTRIES': 5, 'CULL_FREQUENCY': 2},
+        },
+        'versions': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache_versions',
+        },
+    })
+    def test_tokens_outlive_culling_and_never_repeat(self):
+        token = versions.current(search.VERSION_KEY)
+        for i in range(20):
+            cache.set(f'filler:{i}', i)
+        self.assertEqual(versions.current(search.VERSION_KEY), token)
+        search.invalidate()
+        bumped = versions.current(search.VERSION_KEY)
+        self.assertNotEqual(bumped, token)
+        # A lost token starts a new generation rather than an old one
+        caches['versions'].clear()
+        self.assertNotIn(versions.current(search.VERSION_KEY), (token, bumped))
+
+
+class FuzzySearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        for name, location, kind in [
+            ('Darjeeling', 'Darjeeling', 'mountain'),
+            ('Santiniketan', 'Birbhum', 'cultural'),
+            ('Sundarbans National Park', 'South 24 Parganas', 'wildlife'),
+            ('Digha', 'Purba Medinipur', 'beach'),
+            ('Mandarmani', 'Purba Medinipur', 'beach'),
+        ]:
+            Destination.objects.create(
+                name=name, location=location, description='Loved by everyone', price_per_person=1000,
+                duration=2, destination_type=kind,
+            )
+
+    def search(self, q):
+        response = self.client.get(reverse('search_destinations'), {'q': q})
+        return [d.name for d in response.context['destinations']], response.context['suggestion']
+
+    def test_romanization_variants_normalize_alike(self):
+        for a, b in [('Darjeeling', 'darjiling'), ('Shantiniketan', 'santiniketan'), ('Bishnupur', 'vishnupur')]:
+            self.assertEqual(normalize_word(a.lower()), normalize_word(b))
+
+    def test_misspellings_find_destinations(self):
+        self.assertEqual(self.search('Darjiling'), (['Darjeeling'], 'darjeeling'))
+        self.assertEqual(self.search('Shantiniketan')[0], ['Santiniketan'])
+        self.assertEqual(self.search('Sundarban')[0], ['Sundarbans National Park'])
+        names, suggestion = self.search('Digha beech')
+        self.assertEqual(names, ['Digha', 'Mandarmani'])
+        self.assertEqual(suggestion, 'digha beach')
+        self.assertEqual(self.search('darjeeling'), (['Darjeeling'], None))
+
+    def test_description_fallback_and_index_refresh(self):
+        self.assertEqual(len(self.search('everyone')[0]), 5)
+        Destination.objects.create(
+            name='Bishnupur', location='Bankura', description='d', price_per_person=900, duration=1,
+            destination_type='historical',
+        )
+        self.assertEqual(self.search('vishnupur')[0], ['Bishnupur'])
+
+    def test_index_lookup(self):
+        index = SearchIndex([(1, 'name', 'Kalimpong'), (2, 'name', 'Kurseong'), (2, 'tag', 'Tea gardens')])
+        self.assertEqual(index.search('kalimpong tea')[0], [1, 2])
+        self.assertEqual(index.search('qwxz'), ([], None))
+
+
+class PersonalizationTest(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.user = User.objects.create_user('asha', 'asha@example.com', 'ashapass123', first_name='Asha')
+        self.caravan = Caravan.objects.create(
+            name='Roamer', description='d', capacity=4, mileage=10, year=2023, daily_rate=2500,
+            weekly_rate=15000, security_deposit=5000, pickup_locations='Kolkata', max_distance=500,
+        )
+
+    def test_catalog_pages_skip_the_session(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('caravan_detail', args=[self.caravan.slug]))
+        self.assertEqual(response.status_code, 200)
+        tables = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('auth_user', tables)
+        self.assertNotIn('django_session', tables)
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        self.assertIn('public', response['Cache-Control'])
+        self.assertNotContains(response, 'Asha')
+        self.assertContains(response, 'data-anonymous')
+
+    def test_fragment_fills_in_the_visitor(self):
+        response = self.client.get(reverse('session_fragment'))
+        self.assertEqual(response.json()['user_menu'], '')
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        self.client.force_login(self.user)
+        session = self.client.get(reverse('session_fragment')).json()
+        self.assertTrue(session['authenticated'])
+        self.assertIn('Asha', session['user_menu'])
+        self.assertNotIn('public', self.client.get(reverse('about')).get('Cache-Control', ''))
+
+    def test_fragment_token_passes_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        course = Course.objects.create(name='Travel Photography', description='d', max_students=5)
+        url = reverse('course_detail', args=[course.slug])
+        data = {'full_name': 'Bimal', 'email': 'bimal@example.com'}
+        self.assertEqual(client.post(url, data).status_code, 403)
+        data['csrfmiddlewaretoken'] = client.get(reverse('session_fragment')).json()['csrf_token']
+        self.assertEqual(client.post(url, data).status_code, 200)
+        self.assertEqual(course.applications.count(), 1)
+
+
+FLAKY_CALLS = []
+
+
+@jobs.job('tests.flaky', max_attempts=3)
+def flaky_job(failures=0):
+    FLAKY_CALLS.append(failures)
+    if len(FLAKY_CALLS) <= failures:
+        raise RuntimeError('try again')
+    return {'calls': len(FLAKY_CALLS)}
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        FLAKY_CALLS.clear()
+
+    def run_due(self):
+        # Makes every queued job due, skipping the retry backoff
+        Job.objects.filter(status=Job.QUEUED).update(run_at=timezone.now())
+        return jobs.run_pending()
+
+    def test_dedupe_and_results(self):
+        first = jobs.enqueue(flaky_job, [0], dedupe_key='flaky', delay=60)
+        second = jobs.enqueue('tests.flaky', [0], dedupe_key='flaky')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(jobs.run_pending(), 1)
+        job = Job.objects.get(pk=first.pk)
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual(job.results.get().value, {'calls': 1})
+        # Once the job has started, the same key queues new work
+        self.assertNotEqual(jobs.enqueue(flaky_job, [0], dedupe_key='flaky').pk, first.pk)
+
+    def test_retries_with_backoff_then_fails(self):
+        job = jobs.enqueue(flaky_job, [1])
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=5))
+        self.assertEqual(jobs.run_pending(), 0)
+        self.run_due()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual([r.succeeded for r in job.results.all()], [False, True])
+        self.assertIn('try again', job.results.first().error)
+
+        hopeless = jobs.enqueue(flaky_job, [10])
+        unknown = Job.objects.create(name='tests.missing')
+        with self.assertLogs('core.jobs', 'WARNING'):
+            for _ in range(3):
+                self.run_due()
+        hopeless.refresh_from_db()
+        self.assertEqual((hopeless.status, hopeless.attempts), (Job.FAILED, 3))
+        unknown.refresh_from_db()
+        self.assertEqual((unknown.status, unknown.attempts), (Job.FAILED, 1))
+
+    @override_settings(PERIODIC_JOBS={'tests.flaky': 600})
+    def test_periodic_and_lost_jobs(self):
+        jobs.schedule_periodic()
+        jobs.schedule_periodic()
+        self.assertEqual(Job.objects.get().dedupe_key, 'periodic:tests.flaky')
+        self.assertEqual(jobs.run_pending(), 1)
+        following = Job.objects.get(status=Job.QUEUED)
+        self.assertGreater(following.run_at, timezone.now() + timedelta(seconds=500))
+
+        Job.objects.filter(pk=following.pk).update(
+            status=Job.RUNNING, locked_by='gone', locked_at=timezone.now() - timedelta(hours=1), attempts=1,
+        )
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertEqual(jobs.requeue_lost(), 1)
+        self.assertEqual(Job.objects.get(pk=following.pk).status, Job.QUEUED)
+
+    def test_heartbeat_keeps_long_jobs_held(self):
+        job = jobs.enqueue(flaky_job, [0])
+        self.assertEqual(jobs.claim('slow', 1), [job.pk])
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.heartbeat('slow', [job.pk]), 1)
+        self.assertEqual(jobs.requeue_lost(), 0)
+
+        # Once the lock has lapsed and the job was queued again, the first run's outcome is dropped
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        with self.assertLogs('core.jobs', 'WARNING'):
+            jobs.requeue_lost()
+        self.assertEqual(jobs.claim('fresh', 1), [job.pk])
+        with self.assertLogs('core.jobs', 'WARNING') as logs:
+            self.assertTrue(jobs.execute(job.pk, 'slow'))
+        self.assertIn('no longer held it', logs.output[0])
+        self.assertEqual(Job.objects.get(pk=job.pk).locked_by, 'fresh')
+
+    def test_prune_removes_done_and_failed_jobs(self):
+        old = timezone.now() - timedelta(days=30)
+        for status in (Job.DONE, Job.FAILED, Job.QUEUED):
+            JobResult.objects.create(
+                job=Job.objects.create(name='tests.flaky', status=status, finished_at=old),
+                attempt=1, succeeded=status == Job.DONE, worker='w', started_at=old, duration=1,
+            )
+        jobs.prune()
+        self.assertEqual(list(Job.objects.values_list('status', flat=True)), [Job.QUEUED])
+        self.assertEqual(JobResult.objects.count(), 1)
+
+
+class JobWorkerTest(TransactionTestCase):
+    def test_thread_pool_runs_queued_jobs(self):
+        FLAKY_CALLS.clear()
+        for _ in range(4):
+            jobs.enqueue(flaky_job, [0])
+        out = io.StringIO()
+        call_command('runworker', '--burst', '--concurrency', '2', stdout=out)
+        self.assertIn('after 4 jobs', out.getvalue())
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 4)
+
+
+class CaravanAvailabilityTest(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        cache.clear()
+        self.user = User.objects.create_user('asha', 'asha@example.com', 'ashapass123')
+        self.roamer, self.nomad = [
+            Caravan.objects.create(
+                name=name, description='d', capacity=4, mileage=10, year=2023, daily_rate=2500,
+                weekly_rate=15000, security_deposit=5000, pickup_locations='Kolkata', max_distance=500,
+            )
+            for name in ['Roamer', 'Nomad']
+        ]
+        for caravan, pickup, returned, status in [
+            (self.roamer, date(2099, 10, 30), date(2099, 11, 2), 'confirmed'),
+            (self.roamer, date(2099, 11, 3), date(2099, 11, 6), 'pending'),
+            (self.roamer, date(2099, 11, 6), date(2099, 11, 8), 'confirmed'),
+            (self.roamer, date(2099, 11, 10), date(2099, 11, 12), 'cancelled'),
+            (self.roamer, date(2099, 11, 28), date(2099, 12, 3), 'pending'),
+            (self.nomad, date(2099, 12, 24), date(2099, 12, 26), 'confirmed'),
+        ]:
+            self.book(caravan, pickup, returned, status)
+
+    def book(self, caravan, pickup, returned, status='pending'):
+        return CaravanBooking.objects.create(
+            caravan=caravan, user=self.user, pickup_date=pickup, return_date=returned, status=status,
+            pickup_location='Kolkata', full_name='Asha', email='asha@example.com', phone='1', driving_license='DL',
+            total_amount=1000,
+        )
+
+    def blocked(self, **params):
+        return self.client.get(reverse('caravan_availability', args=[self.roamer.slug]), params).json()['blocked']
+
+    def test_month_ranges_are_merged_and_cached(self):
+        expected = [['2099-11-01', '2099-11-01'], ['2099-11-03', '2099-11-07'], ['2099-11-28', '2099-11-30']]
+        self.assertEqual(self.blocked(month='2099-11'), expected)
+        with assert_queries_outside_cache(self, 1):
+            self.assertEqual(self.blocked(month='2099-11'), expected)
+
+        self.book(self.roamer, date(2099, 11, 8), date(2099, 11, 9))
+        self.assertEqual(self.blocked(month='2099-11')[1], ['2099-11-03', '2099-11-08'])
+
+    def test_fleet_quarter(self):
+        response = self.client.get(reverse('fleet_availability'), {'quarter': '2099-q4'})
+        data = response.json()
+        self.assertEqual((data['start'], data['end']), ('2099-10-01', '2099-12-31'))
+        self.assertEqual(data['caravans']['roamer'][-1], ['2099-11-28', '2099-12-02'])
+        self.assertEqual(data['caravans']['nomad'], [['2099-12-24', '2099-12-25']])
+        self.assertEqual(self.client.get(reverse('fleet_availability'), {'month': '2099-13'}).status_code, 400)
+
+    def test_booking_form_rejects_booked_dates(self):
+        self.client.force_login(self.user)
+        url = reverse('caravan_detail', args=[self.roamer.slug])
+        data = {
+            'pickup_date': '2099-11-07', 'return_date': '2099-11-09', 'pickup_location': 'Kolkata',
+            'full_name': 'Asha', 'email': 'asha@example.com', 'phone': '1', 'driving_license': 'DL',
+        }
+        self.assertContains(self.client.post(url, data), 'already booked for some of those dates')
+        data.update(pickup_date='2099-11-08', return_date='2099-11-10')
+        self.assertTrue(self.client.post(url, data).context['form_success'])
+
+
+@skipUnless(numpy, 'numpy is not installed')
+class FleetUtilizationTest(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        cache.clear()
+        self.user = User.objects.create_user('asha', 'asha@example.com', 'ashapass123')
+        self.roamer, self.nomad = [
+            Caravan.objects.create(
+                name=name, caravan_type=caravan_type, description='d', capacity=4, mileage=10, year=2023,
+                daily_rate=2500, weekly_rate=15000, security_deposit=5000, pickup_locations='Kolkata', max_distance=500,
+            )
+            for name, caravan_type in [('Roamer', 'family'), ('Nomad', 'luxury')]
+        ]
+        for caravan, pickup, returned, status, location in [
+            (self.roamer, date(2099, 10, 30), date(2099, 11, 2), 'confirmed', 'Kolkata'),
+            (self.roamer, date(2099, 11, 3), date(2099, 11, 6), 'pending', 'Kolkata'),
+            (self.roamer, date(2099, 11, 6), date(2099, 11, 8), 'confirmed', 'Siliguri'),
+            (self.roamer, date(2099, 11, 10), date(2099, 11, 12), 'cancelled', 'Kolkata'),
+            (self.roamer, date(2099, 11, 28), date(2099, 12, 3), 'pending', 'Kolkata'),
+            (self.nomad, date(2099, 11, 10), date(2099, 11, 20), 'confirmed', '  kolkata'),
+        ]:
+            CaravanBooking.objects.create(
+                caravan=caravan, user=self.user, pickup_date=pickup, return_date=returned, status=status,
+                pickup_location=location, full_name='Asha', email='asha@example.com', phone='1',
+                driving_license='DL', total_amount=1000,
+            )
+        CaravanBooking.objects.update(created_at=datetime(2099, 10, 20, 12, tzinfo=dt_timezone.utc))
+
+    def report(self):
+        from .analytics import fleet_utilization
+        return fleet_utilization(date(2099, 11, 1), date(2099, 11, 30))
+
+    def test_utilization_and_idle_streaks(self):
+        report = self.report()
+        roamer, nomad = report['caravans']
+        self.assertEqual(report['days'], 30)
+        self.assertEqual((roamer['booked_days'], roamer['longest_idle'], roamer['idle_streaks']), (9, 20, 1))
+        self.assertEqual((nomad['booked_days'], nomad['longest_idle'], nomad['idle_streaks']), (10, 11, 2))
+        self.assertEqual(report['fleet']['booked_days'], 19)
+        self.assertAlmostEqual(report['fleet']['utilization'], 19 / 60)
+        self.assertEqual(report['occupancy'].shape, (2, 30))
+        self.assertEqual(report['fleet']['daily'][0], 1)
+        self.assertEqual(report['fleet']['daily'][9], 1)
+        self.assertEqual([row['type'] for row in report['types']], ['family', 'luxury'])
+        self.assertEqual(report['types'][1]['booked_days'], 10)
+
+    def test_lead_time_weekly_share_and_locations(self):
+        report = self.report()
+        roamer, nomad = report['caravans']
+        # Only bookings picked up inside the window count
+        self.assertEqual((roamer['bookings'], roamer['lead_days'], roamer['weekly_share']), (3, 17.0, 0.0))
+        self.assertEqual((nomad['bookings'], nomad['lead_days'], nomad['weekly_share']), (1, 21.0, 1.0))
+        self.assertEqual(report['fleet']['bookings'], 4)
+        self.assertEqual(report['fleet']['lead_days'], 19.0)
+        self.assertEqual(report['fleet']['weekly_share'], 0.25)
+        kolkata, siliguri = report['locations']
+        self.assertEqual((kolkata['location'], kolkata['bookings'], kolkata['booked_days']), ('Kolkata', 3, 17))
+        self.assertEqual((siliguri['location'], siliguri['bookings'], siliguri['booked_days']), ('Siliguri', 1, 2))
+
+    def test_snapshot_reloaded_after_booking_changes(self):
+        self.report()
+        with assert_queries_outside_cache(self, 1):
+            self.report()
+        CaravanBooking.objects.filter(caravan=self.nomad).update(status='cancelled')
+        # Bulk updates skip the signals; saving one booking invalidates
+        booking = CaravanBooking.objects.filter(caravan=self.roamer).first()
+        booking.save()
+        self.assertEqual(self.report()['caravans'][1]['booked_days'], 0)
+
+    def test_admin_page(self):
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'adminpass123'))
+        url = reverse('admin:core_caravan_utilization')
+        self.assertContains(self.client.get(reverse('admin:core_caravan_changelist')), url)
+        response = self.client.get(url, {'start': '2099-11-01', 'end': '2099-11-30'})
+        self.assertContains(response, 'Luxury Caravan')
+        self.assertContains(response, 'Siliguri')
+        self.assertContains(response, 'Roamer')
+        self.assertEqual(response.context['report']['fleet']['booked_days'], 19)
+        response = self.client.get(url, {'start': '2099-11-30', 'end': '2099-11-01'})
+        self.assertIsNone(response.context['report'])
+        response = self.client.get(url, {'start': '2000-01-01', 'end': '2099-11-30'})
+        self.assertIsNone(response.context['report'])
+        self.assertContains(response, 'at most five years')
+
+
+class RollupTest(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.user = User.objects.create_user('asha', 'asha@example.com', 'ashapass123')
+        self.caravan = Caravan.objects.create(
+            name='Roamer', caravan_type='family', description='d', capacity=4, mileage=10, year=2023,
+            daily_rate=2500, weekly_rate=15000, security_deposit=5000, pickup_locations='Kolkata', max_distance=500,
+        )
+        self.course = Course.objects.create(name='Travel Photography', description='d', max_students=10)
+
+    def book(self, pickup, amount, status='pending'):
+        return CaravanBooking.objects.create(
+            caravan=self.caravan, user=self.user, pickup_date=pickup, return_date=pickup + timedelta(days=3),
+            status=status, pickup_location='Kolkata', full_name='Asha', email='asha@example.com', phone='1',
+            driving_license='DL', total_amount=amount,
+        )
+
+    def revenue(self):
+        rows = BookingRevenue.objects.filter(bookings__gt=0).order_by('day', 'status')
+        return list(rows.values_list('day', 'caravan_type', 'status', 'bookings', 'revenue'))
+
+    def test_booking_changes_move_revenue(self):
+        booking = self.book(date(2099, 7, 1), 7500)
+        self.book(date(2099, 7, 1), 2500)
+        self.assertEqual(self.revenue(), [(date(2099, 7, 1), 'family', 'pending', 2, 10000)])
+
+        booking = CaravanBooking.objects.get(pk=booking.pk)
+        booking.status = 'confirmed'
+        booking.total_amount = 8000
+        booking.save()
+        self.assertEqual(self.revenue(), [
+            (date(2099, 7, 1), 'family', 'confirmed', 1, 8000),
+            (date(2099, 7, 1), 'family', 'pending', 1, 2500),
+        ])
+
+        # Instances that were not fully loaded are read back before the save
+        partial = CaravanBooking.objects.only('pk', 'pickup_date').get(pk=booking.pk)
+        partial.pickup_date = date(2099, 8, 2)
+        partial.save()
+        booking.refresh_from_db()
+        booking.delete()
+        self.assertEqual(self.revenue(), [(date(2099, 7, 1), 'family', 'pending', 1, 2500)])
+
+        self.caravan.caravan_type = 'luxury'
+        self.caravan.save()
+        self.assertEqual(self.revenue()[0][1], 'luxury')
+
+    def test_application_funnel(self):
+        first = CourseApplication.objects.create(course=self.course, full_name='Asha', email='a@example.com')
+        CourseApplication.objects.create(course=self.course, full_name='Bimal', email='b@example.com')
+        first.status = 'completed'
+        first.save()
+        CourseApplication.objects.create(course=self.course, full_name='Chitra', email='c@example.com', status='rejected')
+        funnel, = rollups.course_funnels()
+        self.assertEqual(
+            (funnel['applied'], funnel['pending'], funnel['approved'], funnel['completed'], funnel['rejected']),
+            (3, 1, 1, 1, 1),
+        )
+        today = timezone.localdate()
+        self.assertEqual(rollups.course_funnels(today + timedelta(days=1)), [])
+
+    def test_reconcile_repairs_drift(self):
+        self.book(date(2099, 7, 1), 7500)
+        self.book(date(2099, 9, 3), 5000, status='confirmed')
+        CourseApplication.objects.create(course=self.course, full_name='Asha', email='a@example.com')
+        expected = self.revenue()
+        self.assertEqual(rollups.reconcile_revenue(), [])
+        self.assertEqual(rollups.reconcile_funnel(), [])
+
+        # Queryset updates skip the signals
+        CaravanBooking.objects.filter(pickup_date=date(2099, 9, 3)).update(status='completed')
+        CourseApplication.objects.update(status='approved')
+        BookingRevenue.objects.filter(day=date(2099, 7, 1)).delete()
+        out = io.StringIO()
+        with self.assertRaises(CommandError):
+            call_command('reconcile_rollups', '--check', stdout=out)
+        self.assertIn('Revenue: 3 buckets drifted.', out.getvalue())
+
+        call_command('reconcile_rollups', stdout=io.StringIO())
+        self.assertEqual(self.revenue(), [
+            (date(2099, 7, 1), 'family', 'pending', 1, 7500),
+            (date(2099, 9, 3), 'family', 'completed', 1, 5000),
+        ])
+        self.assertNotEqual(self.revenue(), expected)
+        self.assertEqual(list(ApplicationFunnel.objects.filter(applications__gt=0).values_list('status', flat=True)),
+                         ['approved'])
+        call_command('reconcile_rollups', '--check', '--since', '2099-01-01', stdout=io.StringIO())
+
+    def test_reports_read_only_rollups(self):
+        self.book(date(2099, 7, 1), 7500, status='confirmed')
+        self.book(date(2099, 7, 20), 2500)
+        self.book(date(2099, 8, 5), 4000, status='cancelled')
+        with CaptureQueriesContext(connection) as queries:
+            summary = rollups.revenue_summary(date(2099, 1, 1), date(2099, 12, 31))
+        self.assertTrue(all('core_caravanbooking' not in query['sql'] for query in queries))
+        july, august = summary['months']
+        self.assertEqual((july['month'], july['bookings'], july['earned'], july['pending']), (date(2099, 7, 1), 2, 7500, 2500))
+        self.assertEqual((august['earned'], august['cancelled']), (0, 4000))
+        self.assertEqual(summary['types'][0]['label'], 'Family Caravan')
+
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'adminpass123'))
+        response = self.client.get(reverse('admin:core_caravanbooking_revenue'), {'start': '2099-01-01', 'end': '2099-12-31'})
+        self.assertContains(response, 'Jul 2099')
+        self.assertContains(self.client.get(reverse('admin:core_caravanbooking_changelist')), 'Revenue')
+        CourseApplication.objects.create(course=self.course, full_name='Asha', email='a@example.com')
+        self.assertContains(self.client.get(reverse('admin:core_courseapplication_funnel')), 'Travel Photography')
+
+
+class ReplayTrafficTest(TransactionTestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        User.objects.create_user('asha', 'asha@example.com', 'ashapass123')
+        Destination.objects.create(
+            name='Digha Beach', location='Purba Medinipur', description='Sea beach', price_per_person=2500,
+            duration=3, destination_type='beach',
+        )
+        Caravan.objects.create(
+            name='Roamer', description='d', capacity=4, mileage=10, year=2023, daily_rate=2500,
+            weekly_rate=15000, security_deposit=5000, pickup_locations='Kolkata', max_distance=500,
+        )
+        self.addCleanup(view_counter.reset)
+
+    def test_generated_workload_covers_core_routes(self):
+        entries = loadtest.generate_workload(400, seed=3)
+        self.assertEqual(len(entries), 400)
+        routes = {loadtest.route_name(entry['path']) for entry in entries}
+        self.assertTrue({'home', 'destination_detail', 'caravan_detail', 'session_fragment'} <= routes)
+        self.assertFalse(routes & loadtest.SKIPPED_ROUTES)
+        self.assertIn('/destinations/digha-beach/', {entry['path'] for entry in entries})
+        self.assertEqual({entry['user'] for entry in entries}, {None, 'asha'})
+        self.assertEqual(entries, loadtest.generate_workload(400, seed=3))
+
+    def test_replay_log_in_process(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        log = f'{directory}/access.jsonl'
+        with open(log, 'w') as out:
+            out.write('{"method": "GET", "path": "/caravans/", "query": {"caravan_type": "family"}, "user": null}\n')
+            out.write('{"path": "/fragments/session/", "user": "asha"}\n')
+            out.write('\n{"path": "/missing/?a=1", "user": "anonymous"}\n')
+        with open(log) as lines:
+            entries = loadtest.read_log(lines)
+        self.assertEqual(entries[0]['query'], 'caravan_type=family')
+        self.assertEqual((entries[2]['path'], entries[2]['query'], entries[2]['user']), ('/missing/', 'a=1', None))
+
+        report = loadtest.replay(entries * 3, loadtest.InProcessTarget(), concurrency=2)
+        self.assertEqual(report['run']['requests'], 9)
+        routes = report['routes']
+        self.assertEqual(routes['caravan_list']['statuses'], {'200': 3})
+        self.assertEqual(routes['unresolved']['statuses'], {'404': 3})
+        self.assertEqual(report['overall']['errors'], 0)
+        self.assertEqual(routes['caravan_list']['lock_errors'], 0)
+        self.assertEqual(sum(routes['session_fragment']['latency']['histogram']), 3)
+
+        out = io.StringIO()
+        call_command('replay_traffic', log, '--concurrency', '2', '--json', f'{directory}/report.json',
+                     '--html', f'{directory}/report.html', stdout=out)
+        self.assertIn('3 requests', out.getvalue())
+        with open(f'{directory}/report.json') as report_file:
+            self.assertEqual(json.load(report_file)['routes']['session_fragment']['statuses'], {'200': 1})
+        with open(f'{directory}/report.html') as report_file:
+            self.assertIn('caravan_list', report_file.read())
+
+    def test_unknown_user_stops_the_replay(self):
+        entries = loadtest.read_log(['{"path": "/", "user": "ghost"}'])
+        with self.assertRaisesMessage(LookupError, "No user named 'ghost'"):
+            loadtest.replay(entries, loadtest.InProcessTarget(), concurrency=1)
@@ -24,6 +24,21 @@ urlpatterns = [
     path('courses/', views.courses, name='courses'),
     path('courses/<slug:slug>/', views.course_detail, name='course_detail'),
     path('caravans/', views.caravan_list, name='caravan_list'),
+    path('caravans/availability/', views.caravan_availability, name='fleet_availability'),
     path('caravans/<slug:slug>/', views.caravan_detail, name='caravan_detail'),
+    path('caravans/<slug:slug>/availability/', views.caravan_availability, name='caravan_availability'),
     path('contact/', views.contact, name='contact'),
+
+    # Sitemaps
+    path('sitemap.xml', views.sitemap_index, name='sitemap_index'),
+    path('sitemaps/<str:section>-<int:shard>.xml.gz', views.sitemap_shard, name='sitemap_shard'),
+
+    # Staff data exports
+    path('exports/<str:kind>/', views.export_data, name='export_data'),
+
+    # Per-visitor parts of shared-cacheable pages (js/session.js)
+    path('fragments/session/', views.session_fragment, name='session_fragment'),
+
+    # Internal metrics (Prometheus)
+    path('internal/metrics/', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,25 @@
+"""Version tokens that shared caches and per-worker copies are keyed on.
+
+A token names the current generation of some cached data (the search
+index, facet counts, caravan availability); ``bump()`` replaces it on
+writes, and readers rebuild whatever was built for another token. Tokens
+are random, never counters, so a token that is lost and created afresh
+can never equal one a stale copy was built at. They live in their own
+``versions`` cache, apart from the cached results, so culling a full
+results cache never drops them.
+"""
+from uuid import uuid4
+
+from django.core.cache import caches
+
+ALIAS = 'versions'
+
+
+def current(key):
+    """The current token of ``key``, starting a new generation if there is none."""
+    return caches[ALIAS].get_or_set(key, lambda: uuid4().hex, None)
+
+
+def bump(key):
+    """Start a new generation of ``key``: everything built for an earlier token is stale."""
+    caches[ALIAS].set(key, uuid4().hex, None)
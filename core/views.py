@@ -1,38 +1,48 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Q
-from .models import Destination, Testimonial, Category, Course, Exam, CourseApplication
-from .forms import SearchForm, CourseApplicationForm, AgencyRegistrationForm
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth import get_permission_codename
+from django.contrib.messages import get_messages
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.core.exceptions import PermissionDenied
+from django.db.models import Max
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.views.decorators.cache import never_cache
+from .models import Destination, Testimonial, Category, Course, Exam, CourseApplication, CourseFullError
+from .forms import SearchForm, CourseApplicationForm, AgencyRegistrationForm, ExportFilterForm
+from .exports import EXPORTS, filter_export, stream_export
+from .counters import record_view, total_views
+from .facets import (
+    caravan_facets, destination_facets, filter_caravans, filter_destinations, normalize_caravan_filters,
+    normalize_destination_filters,
+)
+from .personalization import public_page
+from . import availability, search, sitemaps
 from agency.models import Agency
 
+@public_page
 def destination_list(request):
-    # Get all destinations
-    destinations_list = Destination.objects.filter(is_active=True).order_by('name')
-    
     # Initialize search form
     form = SearchForm(request.GET or None)
     search_query = {}
+    filters = normalize_destination_filters({})
     
     # Apply filters if form is submitted
     if form.is_valid():
-        destination_name = form.cleaned_data.get('destination')
-        price_limit = form.cleaned_data.get('price_limit')
-        
-        if destination_name:
-            destinations_list = destinations_list.filter(
-                Q(name__icontains=destination_name) | 
-                Q(location__icontains=destination_name)
-            )
-            search_query['destination'] = destination_name
-            
-        if price_limit:
-            destinations_list = destinations_list.filter(price_per_person__lte=price_limit)
-            search_query['price_limit'] = price_limit
+        filters = normalize_destination_filters(form.cleaned_data)
+        for key in ('destination', 'price_limit'):
+            if form.cleaned_data.get(key):
+                # Strings, so the template can compare them with the option values
+                search_query[key] = str(form.cleaned_data[key])
             
         # Store other search parameters
         search_query['checkin'] = request.GET.get('checkin', '')
         search_query['checkout'] = request.GET.get('checkout', '')
     
+    destinations_list = filter_destinations(filters).order_by('-popularity', 'name')
+    facets = destination_facets(filters)
+    
     # Pagination
     paginator = Paginator(destinations_list, 9)  # Show 9 destinations per page
     page = request.GET.get('page')
@@ -48,7 +58,7 @@ def destination_list(request):
     featured_destinations = Destination.objects.filter(
         is_active=True, 
         is_featured=True
-    )[:3]
+    ).order_by('-popularity', 'name')[:3]
     
     context = {
         'destinations': destinations,
@@ -56,12 +66,16 @@ def destination_list(request):
         'search_query': search_query,
         'page_title': 'Explore Destinations',
         'form': form,
+        'facets': facets,
+        'filters': filters,
     }
     
     return render(request, 'core/destination.html', context)
 
+@public_page
 def destination_detail(request, slug):
     destination = get_object_or_404(Destination, slug=slug, is_active=True)
+    record_view(destination)
     
     # Get gallery images
     gallery_images = destination.images.all()
@@ -88,15 +102,17 @@ def destination_detail(request, slug):
     
     return render(request, 'core/destination_detail.html', context)
 
+@public_page
 def home(request):
     featured_destinations = Destination.objects.filter(
         is_active=True,
         is_featured=True
-    )[:6]
+    ).order_by('-popularity', 'name')[:6]
 
     testimonials = Testimonial.objects.filter(is_active=True).order_by('-created_at')[:5]
 
-    categories = Category.objects.all()
+    # Counts are stored on the row (core.signals), so this is a single small query
+    categories = Category.objects.filter(destination_count__gt=0).order_by('-destination_count', 'name')
 
     all_destinations = Destination.objects.filter(is_active=True).only('name')
 
@@ -107,22 +123,24 @@ def home(request):
         count = Destination.objects.filter(is_active=True, destination_type=code).count()
         destination_types.append((code, display, count))
 
-    # Popular cities from existing destinations
+    # Popular cities: the ten locations with the highest-scoring destinations
     popular_cities = list(
         Destination.objects.filter(is_active=True)
-        .values_list('location', flat=True)
-        .distinct()[:10]
+        .values('location')
+        .annotate(top_popularity=Max('popularity'))
+        .order_by('-top_popularity', 'location')
+        .values_list('location', flat=True)[:10]
     )
 
     # Stats
     stats = {
         'destinations_count': Destination.objects.filter(is_active=True).count(),
         'tours_count': Destination.objects.filter(is_active=True).count(),
-        'visitors_count': 10000,
+        'visitors_count': total_views(),
     }
 
     # Placeholder discounted queryset (reuse featured)
-    discounted_destinations = Destination.objects.filter(is_active=True, is_featured=True)
+    discounted_destinations = Destination.objects.filter(is_active=True, is_featured=True).order_by('-popularity', 'name')
 
     services = [
         {
@@ -251,7 +269,9 @@ def hotel(request):
         reg_form = AgencyRegistrationForm()
 
     # Get featured caravans for the travel agency section
-    featured_caravans = Caravan.objects.filter(is_active=True, is_available=True, is_featured=True)[:6]
+    featured_caravans = Caravan.objects.filter(
+        is_active=True, is_available=True, is_featured=True
+    ).order_by('-popularity', 'name')[:6]
     
     # Get caravan types for filtering
     caravan_types = Caravan.CARAVAN_TYPES
@@ -276,7 +296,7 @@ def courses(request):
         courses_list = courses_list.filter(category=category_filter)
     
     # Get featured courses
-    featured_courses = Course.objects.filter(is_active=True, is_featured=True)[:3]
+    featured_courses = Course.objects.filter(is_active=True, is_featured=True).order_by('-popularity', 'name')[:3]
     
     # Get all categories for filter
     categories = Course.COURSE_CATEGORIES
@@ -302,8 +322,11 @@ def courses(request):
     return render(request, 'core/courses.html', context)
 
 
+@public_page
 def course_detail(request, slug):
     course = get_object_or_404(Course, slug=slug, is_active=True)
+    if request.method == 'GET':
+        record_view(course)
     
     # Get related courses (same category)
     related_courses = Course.objects.filter(
@@ -318,9 +341,14 @@ def course_detail(request, slug):
     if request.method == 'POST' and form.is_valid():
         application = form.save(commit=False)
         application.course = course
-        application.save()
-        form_success = True
-        form = CourseApplicationForm()
+        try:
+            application.save()
+        except CourseFullError:
+            form.add_error(None, 'Sorry, this course is full.')
+        else:
+            form_success = True
+            form = CourseApplicationForm()
+        course.refresh_from_db(fields=['seats_taken'])
     
     context = {
         'page_title': f'{course.name} - Course Details',
@@ -339,51 +367,30 @@ def contact(request):
     return render(request, 'accounts/contact_base.html', context)
 
 
+@public_page
 def caravan_list(request):
     """Display list of available caravans with search and filtering"""
     from .forms import CaravanSearchForm
     from .models import Caravan
     
-    caravans_list = Caravan.objects.filter(is_active=True, is_available=True).order_by('name')
-    
     # Handle search form
     form = CaravanSearchForm(request.GET or None)
-    if form.is_valid():
-        # Filter by caravan type
-        if form.cleaned_data.get('caravan_type'):
-            caravans_list = caravans_list.filter(caravan_type=form.cleaned_data['caravan_type'])
-        
-        # Filter by capacity
-        if form.cleaned_data.get('capacity'):
-            capacity = int(form.cleaned_data['capacity'])
-            caravans_list = caravans_list.filter(capacity__gte=capacity)
-        
-        # Filter by price range
-        if form.cleaned_data.get('price_range'):
-            price_range = form.cleaned_data['price_range']
-            if price_range == '1000-3000':
-                caravans_list = caravans_list.filter(daily_rate__gte=1000, daily_rate__lte=3000)
-            elif price_range == '3000-5000':
-                caravans_list = caravans_list.filter(daily_rate__gte=3000, daily_rate__lte=5000)
-            elif price_range == '5000-8000':
-                caravans_list = caravans_list.filter(daily_rate__gte=5000, daily_rate__lte=8000)
-            elif price_range == '8000+':
-                caravans_list = caravans_list.filter(daily_rate__gte=8000)
-        
-        # Filter by amenities
-        if form.cleaned_data.get('has_ac'):
-            caravans_list = caravans_list.filter(has_ac=True)
-        if form.cleaned_data.get('has_kitchen'):
-            caravans_list = caravans_list.filter(has_kitchen=True)
-        if form.cleaned_data.get('has_bathroom'):
-            caravans_list = caravans_list.filter(has_bathroom=True)
+    filters = normalize_caravan_filters(form.cleaned_data if form.is_valid() else {})
+    caravans_list = filter_caravans(filters).order_by('name')
+    facets = caravan_facets(filters)
+    form.apply_facets(facets)
     
     # Get featured caravans
-    featured_caravans = Caravan.objects.filter(is_active=True, is_available=True, is_featured=True)[:3]
+    featured_caravans = Caravan.objects.filter(
+        is_active=True, is_available=True, is_featured=True
+    ).order_by('-popularity', 'name')[:3]
     
-    # Pagination
+    # Pagination; the links keep the current filters
     paginator = Paginator(caravans_list, 9)
     page = request.GET.get('page')
+    query = request.GET.copy()
+    query.pop('page', None)
+    page_query = query.urlencode()
     
     try:
         caravans = paginator.page(page)
@@ -398,16 +405,21 @@ def caravan_list(request):
         'featured_caravans': featured_caravans,
         'form': form,
         'caravan_types': Caravan.CARAVAN_TYPES,
+        'facets': facets,
+        'page_query': page_query,
     }
     return render(request, 'core/caravan_list.html', context)
 
 
+@public_page
 def caravan_detail(request, slug):
     """Display detailed information about a specific caravan"""
     from .models import Caravan
     from .forms import CaravanBookingForm
     
     caravan = get_object_or_404(Caravan, slug=slug, is_active=True)
+    if request.method == 'GET':
+        record_view(caravan)
     
     # Get related caravans (same type)
     related_caravans = Caravan.objects.filter(
@@ -417,7 +429,7 @@ def caravan_detail(request, slug):
     ).exclude(id=caravan.id)[:3]
     
     # Handle booking form
-    form = CaravanBookingForm(request.POST or None)
+    form = CaravanBookingForm(request.POST or None, caravan=caravan)
     form_success = False
     
     if request.method == 'POST' and form.is_valid():
@@ -445,7 +457,7 @@ def caravan_detail(request, slug):
             booking.total_amount = total_amount
             booking.save()
             form_success = True
-            form = CaravanBookingForm()
+            form = CaravanBookingForm(caravan=caravan)
         else:
             # Redirect to login if user is not authenticated
             from django.contrib.auth.decorators import login_required
@@ -460,36 +472,54 @@ def caravan_detail(request, slug):
     }
     return render(request, 'core/caravan_detail.html', context)
 
+def caravan_availability(request, slug=None):
+    """Booked date ranges of one caravan, or of the whole fleet, for a month or quarter"""
+    from .models import Caravan
+
+    try:
+        start, end = availability.parse_period(request.GET.get('month'), request.GET.get('quarter'))
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    period = {'start': start, 'end': end}
+    if slug is not None:
+        caravan = get_object_or_404(Caravan, slug=slug, is_active=True)
+        blocked = availability.blocked_ranges(start, end, caravan.pk).get(caravan.pk, [])
+        return JsonResponse({**period, 'caravan': caravan.slug, 'blocked': blocked})
+    blocked = availability.blocked_ranges(start, end)
+    slugs = dict(Caravan.objects.filter(is_active=True, pk__in=list(blocked)).values_list('pk', 'slug'))
+    return JsonResponse({**period, 'caravans': {slugs[pk]: ranges for pk, ranges in blocked.items() if pk in slugs}})
+
+
 def search_destinations(request):
     query = request.GET.get('q', '')
+    suggestion = None
     
     if query:
-        destinations = Destination.objects.filter(
-            Q(name__icontains=query) | 
-            Q(location__icontains=query) |
-            Q(description__icontains=query) |
-            Q(tags__name__icontains=query),
-            is_active=True
-        ).distinct().order_by('name')
+        # Fuzzy match on names, locations, types and tags (core.search),
+        # then fall back to the descriptions
+        destinations, suggestion = search.search_destinations(query)
+        if not destinations:
+            destinations = Destination.objects.filter(
+                description__icontains=query, is_active=True
+            ).order_by('name')
     else:
         destinations = Destination.objects.filter(is_active=True).order_by('name')
     
     context = {
         'destinations': destinations,
         'search_query': query,
+        'suggestion': suggestion,
         'page_title': f'Search Results for "{query}"',
     }
     
     return render(request, 'core/search_results.html', context)
 
 # Filter destinations by category
+@public_page
 def destinations_by_category(request, category_slug):
     category = get_object_or_404(Category, slug=category_slug)
     
-    destinations = Destination.objects.filter(
-        tags__name__icontains=category.name,  # Using tags to simulate categories
-        is_active=True
-    ).distinct().order_by('name')
+    destinations = category.destinations.filter(is_active=True).order_by('name')
     
     context = {
         'destinations': destinations,
@@ -500,6 +530,7 @@ def destinations_by_category(request, category_slug):
     return render(request, 'core/destinations_by_category.html', context)
 
 # Filter destinations by type
+@public_page
 def destinations_by_type(request, destination_type):
     # Validate destination type
     valid_types = [choice[0] for choice in Destination.DESTINATION_TYPES]
@@ -521,4 +552,73 @@ def destinations_by_type(request, destination_type):
         'page_title': f'{type_display} Destinations',
     }
     
-    return render(request, 'core/destinations_by_type.html', context)
\ No newline at end of file
+    return render(request, 'core/destinations_by_type.html', context)
+
+@staff_member_required
+def export_data(request, kind):
+    """Stream bookings, applications, agencies or testimonials as CSV/JSONL"""
+    if kind not in EXPORTS:
+        raise Http404('Unknown export')
+
+    form = ExportFilterForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+
+    model = EXPORTS[kind][0]
+    opts = model._meta
+    if not request.user.has_perm(f"{opts.app_label}.{get_permission_codename('view', opts)}"):
+        raise PermissionDenied
+    queryset = filter_export(kind, model.objects.all(), form.cleaned_data)
+    return stream_export(
+        kind,
+        queryset,
+        fmt=form.cleaned_data.get('format') or 'csv',
+        compress=form.cleaned_data.get('gzip'),
+    )
+
+
+def sitemap_index(request):
+    """Sitemap index pointing at every catalog shard"""
+    base_url = request.build_absolute_uri('/').rstrip('/')
+    return HttpResponse(sitemaps.get_index(base_url), content_type='application/xml')
+
+
+def sitemap_shard(request, section, shard):
+    """One gzip-compressed sitemap shard, regenerated only when its rows change"""
+    if section != 'types' and section not in sitemaps.SECTIONS:
+        raise Http404('Unknown sitemap')
+    base_url = request.build_absolute_uri('/').rstrip('/')
+    content = sitemaps.get_shard(section, shard, base_url)
+    if content is None:
+        raise Http404('Unknown sitemap shard')
+    return HttpResponse(content, content_type='application/gzip')
+
+
+def metrics(request):
+    """Prometheus metrics for staff and for scrapers holding METRICS_TOKEN"""
+    from django.conf import settings
+    from django.utils.crypto import constant_time_compare
+    from .metrics import render_prometheus
+
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    scheme, _, supplied = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    allowed = (
+        request.user.is_staff
+        or (token and scheme.lower() == 'bearer' and constant_time_compare(supplied.strip(), token))
+        or request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+    )
+    if not allowed:
+        raise Http404
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@never_cache
+def session_fragment(request):
+    """The visitor's user menu, CSRF token and messages for js/session.js"""
+    authenticated = request.user.is_authenticated
+    return JsonResponse({
+        'authenticated': authenticated,
+        'user_menu': render_to_string('core/user_menu.html', request=request) if authenticated else '',
+        'csrf_token': get_token(request),
+        'messages': [{'level': message.level_tag, 'text': str(message)} for message in get_messages(request)],
+    })
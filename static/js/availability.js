@@ -0,0 +1,59 @@
+(function() {
+
+  // Warns about already-booked dates before the booking form is posted.
+  // Booked days come from the caravan's availability endpoint, one quarter
+  // per request, as inclusive [first, last] ISO date ranges.
+  var form = document.querySelector('form[data-availability-url]');
+  if (!form || !window.fetch) return;
+
+  var pickup = form.querySelector('[name=pickup_date]'),
+      returned = form.querySelector('[name=return_date]'),
+      hint = form.querySelector('.booked-dates'),
+      quarters = {};
+
+  function quarterOf(isoDate) {
+    var year = isoDate.slice(0, 4), month = parseInt(isoDate.slice(5, 7), 10);
+    return year + '-Q' + Math.ceil(month / 3);
+  }
+
+  function load(quarter) {
+    if (!quarters[quarter]) {
+      quarters[quarter] = fetch(form.dataset.availabilityUrl + '?quarter=' + quarter)
+        .then(function(response) { return response.ok ? response.json() : {blocked: []}; })
+        .then(function(data) { return data.blocked; })
+        .catch(function() { return []; });
+    }
+    return quarters[quarter];
+  }
+
+  function format(isoDate) {
+    return new Date(isoDate + 'T00:00:00').toLocaleDateString(undefined, {day: 'numeric', month: 'short'});
+  }
+
+  function check() {
+    var start = pickup.value || new Date().toISOString().slice(0, 10),
+        end = returned.value > start ? returned.value : start,
+        wanted = [quarterOf(start)];
+    if (quarterOf(end) !== wanted[0]) wanted.push(quarterOf(end));
+
+    Promise.all(wanted.map(load)).then(function(results) {
+      var ranges = [].concat.apply([], results);
+      // The return day itself is free for the next pickup
+      var clash = pickup.value && returned.value && ranges.some(function(range) {
+        return range[0] < returned.value && range[1] >= pickup.value;
+      });
+      returned.setCustomValidity(clash ? 'This caravan is already booked for some of those dates.' : '');
+
+      if (!hint) return;
+      hint.hidden = !ranges.length;
+      hint.textContent = 'Already booked: ' + ranges.map(function(range) {
+        return range[0] === range[1] ? format(range[0]) : format(range[0]) + ' – ' + format(range[1]);
+      }).join(', ');
+    });
+  }
+
+  pickup.addEventListener('change', check);
+  returned.addEventListener('change', check);
+  check();
+
+})();
@@ -0,0 +1,47 @@
+(function() {
+
+  // Pages are rendered the same for every visitor so they can be shared-cached;
+  // the visitor's own menu, CSRF token and messages are fetched separately.
+  var script = document.currentScript;
+  if (!script || !window.fetch) return;
+
+  var alertClass = {error: 'danger', debug: 'secondary'};
+
+  fetch(script.dataset.url, {credentials: 'same-origin', headers: {'Accept': 'application/json'}})
+    .then(function(response) {
+      return response.ok ? response.json() : null;
+    })
+    .then(function(session) {
+      if (!session) return;
+
+      document.querySelectorAll('input[name=csrfmiddlewaretoken]').forEach(function(input) {
+        input.value = session.csrf_token;
+      });
+
+      if (session.user_menu) {
+        var nav = document.querySelector('#ftco-nav .navbar-nav');
+        document.querySelectorAll('[data-anonymous]').forEach(function(el) {
+          el.parentNode.removeChild(el);
+        });
+        if (nav) nav.insertAdjacentHTML('beforeend', session.user_menu);
+      }
+
+      document.querySelectorAll('[data-signed-in]').forEach(function(el) {
+        el.hidden = !session.authenticated;
+      });
+      document.querySelectorAll('[data-signed-out]').forEach(function(el) {
+        el.hidden = session.authenticated;
+      });
+
+      var box = document.getElementById('session-messages');
+      if (box) {
+        session.messages.forEach(function(message) {
+          var alert = document.createElement('div');
+          alert.className = 'alert mt-3 alert-' + (alertClass[message.level] || message.level);
+          alert.textContent = message.text;
+          box.appendChild(alert);
+        });
+      }
+    });
+
+})();
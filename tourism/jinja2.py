@@ -0,0 +1,41 @@
+"""Jinja2 environment for the pages ported to ``jinja2/``.
+
+Provides the ``static``, ``url``, ``now`` and ``lazy_img`` helpers and the
+Django filters the ported templates use, and keeps undefined variables
+rendering as empty strings like the Django engine does.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.template import defaultfilters
+from django.templatetags.static import static
+from django.urls import reverse
+from django.utils import timezone
+from jinja2 import Environment, Undefined
+
+from core.images import lazy_img
+
+
+def url(name, *args, **kwargs):
+    return reverse(name, args=args, kwargs=kwargs)
+
+
+def now(format_string):
+    tzinfo = timezone.get_current_timezone() if settings.USE_TZ else None
+    return defaultfilters.date(datetime.now(tz=tzinfo), format_string)
+
+
+def date(value, format_string=None):
+    return defaultfilters.date(timezone.template_localtime(value), format_string)
+
+
+def environment(**options):
+    options['undefined'] = Undefined
+    env = Environment(**options)
+    env.globals.update({'static': static, 'url': url, 'now': now, 'lazy_img': lazy_img})
+    env.filters.update({
+        'date': date,
+        'floatformat': defaultfilters.floatformat,
+        'truncatewords': defaultfilters.truncatewords,
+    })
+    return env
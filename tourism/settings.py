@@ -43,6 +43,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.profiling.ProfilingMiddleware',
+    'core.metrics.MetricsMiddleware',
+    'core.personalization.PublicPageMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,11 +57,16 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'tourism.urls'
 
+# Render the hottest pages (home, caravan list and caravan detail) with the
+# Jinja2 ports in jinja2/; every other template falls through to the Django
+# engine. Requires the jinja2 package. Compare both engines with
+# `manage.py bench_templates`.
+USE_JINJA2_TEMPLATES = False
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -66,10 +74,34 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compiled templates are kept per process whatever DEBUG is set to;
+            # runserver still picks up edits through the autoreloader
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
 
+JINJA2_TEMPLATES = {
+    'NAME': 'jinja2',
+    'BACKEND': 'django.template.backends.jinja2.Jinja2',
+    'DIRS': [BASE_DIR / 'jinja2'],
+    'APP_DIRS': False,
+    'OPTIONS': {
+        'environment': 'tourism.jinja2.environment',
+        'context_processors': [
+            'django.contrib.auth.context_processors.auth',
+            'django.contrib.messages.context_processors.messages',
+        ],
+    },
+}
+if USE_JINJA2_TEMPLATES:
+    TEMPLATES.insert(0, JINJA2_TEMPLATES)
+
 WSGI_APPLICATION = 'tourism.wsgi.application'
 
 
@@ -80,9 +112,33 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file rather than the in-memory default: SQLite's shared in-memory
+        # database fails concurrent writes outright instead of waiting for the
+        # lock, which the worker's thread pool tests would trip over
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Every worker must see the same cache. The version tokens that the search
+# index, facet, availability and fleet-snapshot caches are keyed on (see
+# core.versions) have a table of their own, so that culling the results
+# cache when it is full never drops them. Create the tables with
+# `manage.py createcachetable`; Redis or Memcached can take over on larger
+# deployments.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'versions': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache_versions',
+        # A handful of keys; never culled
+        'OPTIONS': {'MAX_ENTRIES': 1_000_000},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -132,7 +188,100 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Page-view counters are buffered in each worker and written at most this
+# often (seconds); see core.counters
+VIEW_COUNTER_FLUSH_INTERVAL = 5
+
+# Seconds the site-wide view total shown on the home page is cached
+VIEW_TOTAL_CACHE_TIMEOUT = 300
+
+# Half-life of the popularity scores refreshed by `manage.py update_popularity`
+POPULARITY_HALF_LIFE_DAYS = 7
+
+# Output directory of `manage.py prerender_pages`; serve it from the front
+# proxy (try_files $uri/index.html @django) ahead of the application
+PRERENDER_ROOT = BASE_DIR / "prerendered"
+
+# On-demand request profiling (see core.profiling). A request is profiled
+# when it sends `X-Profile: <PROFILE_TOKEN>` or is picked at
+# PROFILE_SAMPLE_RATE (0-1); with neither set the middleware is unloaded.
+# Inspect the results with `manage.py profiles`.
+PROFILE_TOKEN = None
+PROFILE_SAMPLE_RATE = 0
+PROFILE_DIR = BASE_DIR / "profiles"
+PROFILE_KEEP = 200
+
+# Request, database, template, cache and upload metrics (see core.metrics),
+# served in Prometheus format at /internal/metrics/ to staff and to scrapers
+# sending "Authorization: Bearer <METRICS_TOKEN>". METRICS_ALLOWED_IPS may
+# list scraper addresses as well; leave it empty behind a proxy, where every
+# request comes from the proxy's address. With several workers, point
+# METRICS_DIR at a directory they share (ideally tmpfs) so every scrape sees
+# the whole pool.
+METRICS_ENABLED = True
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 15
+METRICS_TOKEN = None
+METRICS_ALLOWED_IPS = []
+
+# Hand media transfers to the front proxy instead of streaming them from
+# Django. Set MEDIA_ACCEL_REDIRECT to an nginx `internal` location prefix
+# (e.g. "/protected-media/") or MEDIA_SENDFILE_HEADER to "X-Sendfile".
+MEDIA_ACCEL_REDIRECT = None
+MEDIA_SENDFILE_HEADER = None
+
+# Seconds shared caches may keep catalog pages marked @public_page (see
+# core.personalization). Those pages are identical for every visitor; the
+# user menu, CSRF token and messages are fetched from
+# /fragments/session/. 0 disables the Cache-Control header.
+PUBLIC_PAGE_MAX_AGE = 300
+
+# Background jobs (see core.jobs), run by `manage.py runworker`. A failed
+# attempt is retried after JOB_RETRY_BACKOFF * 2**(attempt - 1) seconds, at
+# most JOB_RETRY_BACKOFF_MAX; a job whose worker has not refreshed its lock
+# for JOB_LOCK_TIMEOUT seconds is assumed lost and queued again. Done and
+# failed jobs are pruned after JOB_RESULT_TTL_DAYS. PERIODIC_JOBS maps job names to intervals in seconds.
+JOB_POLL_INTERVAL = 1
+JOB_RETRY_BACKOFF = 10
+JOB_RETRY_BACKOFF_MAX = 60 * 60
+JOB_LOCK_TIMEOUT = 15 * 60
+JOB_RESULT_TTL_DAYS = 14
+PERIODIC_JOBS = {
+    "popularity.update": 60 * 60,
+    "jobs.prune": 24 * 60 * 60,
+    "rollups.reconcile": 24 * 60 * 60,
+}
+
+# Caravan search bands (see core.facets): (value, label, low, high) with
+# inclusive bounds; None leaves a band open-ended. Values appear in URLs.
+CARAVAN_CAPACITY_BANDS = [
+    ("2", "2+ People", 2, None),
+    ("4", "4+ People", 4, None),
+    ("6", "6+ People", 6, None),
+    ("8", "8+ People", 8, None),
+]
+CARAVAN_PRICE_BANDS = [
+    ("1000-3000", "₹1,000 - ₹3,000", 1000, 3000),
+    ("3000-5000", "₹3,000 - ₹5,000", 3000, 5000),
+    ("5000-8000", "₹5,000 - ₹8,000", 5000, 8000),
+    ("8000+", "₹8,000+", 8000, None),
+]
+
+# Uploads are stored once per distinct content (see core.storage)
+STORAGES = {
+    "default": {
+        "BACKEND": "core.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
 # Authentication settings
+AUTHENTICATION_BACKENDS = [
+    'django.contrib.auth.backends.ModelBackend',
+    'accounts.backends.EmailBackend',
+]
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 LOGIN_URL = '/accounts/login/'
\ No newline at end of file